@@ -1,45 +1,51 @@
 import json
 from decimal import Decimal
 import time
-import base64
 import boto3
 import stringcase
 
 from aws_xray_sdk.core import xray_recorder  # noqa: F401
 from aws_xray_sdk.core import patch_all
 from boto3.dynamodb.conditions import Key
-from dynamodb_json import json_util
 from environs import Env
 from rpp_lib.logs import LOGGER
 from voluptuous import Any, MultipleInvalid
 from botocore.exceptions import ClientError
-from dynamodb.store import put_work_order, query, get_work_order, DynamoItemNotFound
+from dynamodb.store import put_work_order, WorkOrderSnapshot
 from order_capture import add_capture_data, add_capture_data_summary
 from order_condition import process_condition, add_condition_data_summary
 from order_offering import add_offering_data
-from rpp_lib.rpc import get_pfvehicle
+from rpp_lib.rpc import get_approval, get_labor_status, get_pfvehicle
+from utils.aggregation import deaggregate_records
+from utils.batch import BatchItemFailures
+from utils.decode_record import decode_record
+from utils.executor import get_work_order_key, process_by_work_order
+from utils.metrics import COUNTS, invocation, patch_aws_calls
+from utils.prefetch import call, rpc
 from utils.common import get_vin
 from utils.dynamodb import remove_item
+from utils.resources import queue
 from recon_labor_status import (
+    forget_damages,
+    preload_damages,
     process_labor_status,
     update_labor_status,
     build_labor,
     get_overall_damage_status,
 )
 from order_approval_summary import process_approval_summary
-from damages import LABOR_TYPES, create_isdt_key
+from damages import create_isdt_key, get_labor_types
 from order_retailrecon import delete_work_order, process_retail_recon
 
 
 patch_all()
+patch_aws_calls()
 
 RETRY_EXCEPTIONS = ("ProvisionedThroughputExceededException", "ThrottlingException")
 IGNORE_EXCEPTIONS = "ConditionalCheckFailedException"
 
 ENV = Env()
-SQS = boto3.resource("sqs")
-QUEUE = SQS.get_queue_by_name(QueueName=ENV("QUEUE", validate=Any(str)))
-DYNAMO = boto3.resource("dynamodb")
+QUEUE = queue(ENV("QUEUE", validate=Any(str)))
 KINESIS = boto3.client("kinesis")
 TABLE = ENV("WORKORDER_AM_TABLE")
 # TABLE = "rpp-recon-work-order"
@@ -65,107 +71,146 @@ def process_event(event, _):
     Lambda to process all kinesis events from upstream and decide on how to store the events
     """
     LOGGER.info({"upstream_event": event})
-    record_data = {}
-    for record in event["Records"]:
-        try:
-            LOGGER.debug(
-                {
-                    "message": "record decoding steps",
-                    "kinesis_data": record["kinesis"]["data"],
-                    "base64_decode": base64.b64decode(record["kinesis"]["data"]),
-                }
-            )
+    batch = BatchItemFailures(deaggregate_records(event["Records"]))
+
+    with invocation("aggregate_events"):
+        process_by_work_order(
+            batch,
+            decode_record,
+            process_dynamodb_event,
+            plan=plan_rpc,
+            preload=preload_labor_status_damages,
+        )
 
-            kinesis_event = json.loads(
-                base64.b64decode(record["kinesis"]["data"]), parse_float=Decimal
-            )
+    return batch.response()
 
-            dynamodb_event = json.loads(
-                json.dumps(json_util.loads(kinesis_event)), parse_float=Decimal
-            )
 
-            key_event = "".join(dynamodb_event["dynamodb"]["Keys"].keys())
-
-            event_type = dynamodb_event["eventName"]
-            old_image = dynamodb_event["dynamodb"].get("OldImage", None)
-            if event_type != "REMOVE":
-                new_image = dynamodb_event["dynamodb"]["NewImage"]
-                if ACTION[key_event]["general"]:
-                    LOGGER.info("Storing general record for " + key_event + " event")
-                    wo_key = new_image.get("work_order_key", None)
-                    entity_type = ACTION[key_event]["name"]
-
-                    if key_event == "approval_id":
-                        process_approval(new_image, wo_key, key_event, old_image)
-                    elif key_event == "retailrecon_id":
-                        process_retail_recon(new_image, wo_key, key_event)
-                    elif key_event == "work_credit_idlabor":
-                        process_work_credit(new_image, wo_key, key_event)
-                    elif key_event == "capture_id":
-                        add_capture_data(new_image, "consignment")
-                        add_capture_data_summary(new_image)
-                    elif key_event == "pksk":
-                        process_labor_status(new_image)
-                    elif key_event == "condition_id":
-                        LOGGER.info({"message": "Processing record from condition event.", "record": record})
-                        process_condition(new_image, wo_key, key_event, entity_type)
-                        add_condition_data_summary(new_image)
-                    else:
-                        process_record(
-                            ACTION[key_event]["name"], new_image, wo_key, key_event
-                        )
+def is_labor_status(dynamodb_event):
+    return (
+        dynamodb_event["eventName"] != "REMOVE"
+        and "".join(dynamodb_event["dynamodb"]["Keys"].keys()) == "pksk"
+    )
+
 
+def preload_labor_status_damages(dynamodb_events):
+    """
+    read the damages the labor status events of the batch update in one round
+    """
+    return preload_damages(
+        [
+            dynamodb_event["dynamodb"]["NewImage"]
+            for dynamodb_event in dynamodb_events
+            if is_labor_status(dynamodb_event)
+        ]
+    )
+
+
+def plan_rpc(dynamodb_event):
+    """
+    rpc lookups process_dynamodb_event will make for the decoded event
+    """
+    key_event = "".join(dynamodb_event["dynamodb"]["Keys"].keys())
+    if dynamodb_event["eventName"] == "REMOVE" or not ACTION[key_event]["general"]:
+        return []
+
+    new_image = dynamodb_event["dynamodb"]["NewImage"]
+    wo_key = new_image.get("work_order_key")
+    calls = []
+
+    if key_event == "pksk":
+        if not new_image.get("severity_code"):
+            calls.append(rpc(get_approval, work_order_key=new_image["pk"]))
+        return calls
+
+    if key_event in ("retailrecon_id", "capture_id", "condition_id"):
+        return calls
+
+    if not new_image.get("work_order_number") or not new_image.get("vin"):
+        calls.append(rpc(get_pfvehicle, work_order_key=wo_key))
+
+    if key_event == "approval_id":
+        for damage in new_image["order"]["condition"].get("damages", []):
+            for labor in build_damage_labors(damage):
+                calls.append(rpc(get_labor_status, wo_key, create_isdt_key(labor)))
+
+    return calls
+
+
+def process_dynamodb_event(dynamodb_event):
+    """
+    decide on how to store a single decoded upstream event
+    """
+    key_event = ""
+    try:
+        key_event = "".join(dynamodb_event["dynamodb"]["Keys"].keys())
+
+        event_type = dynamodb_event["eventName"]
+        old_image = dynamodb_event["dynamodb"].get("OldImage", None)
+        if key_event != "pksk":
+            # damages preloaded for labor statuses may be rewritten by this event
+            forget_damages(get_work_order_key(dynamodb_event))
+        if event_type != "REMOVE":
+            new_image = dynamodb_event["dynamodb"]["NewImage"]
+            if ACTION[key_event]["general"]:
+                LOGGER.info("Storing general record for " + key_event + " event")
+                wo_key = new_image.get("work_order_key", None)
+                entity_type = ACTION[key_event]["name"]
+
+                if key_event == "approval_id":
+                    process_approval(new_image, wo_key, key_event, old_image)
+                elif key_event == "retailrecon_id":
+                    process_retail_recon(new_image, wo_key, key_event)
+                elif key_event == "work_credit_idlabor":
+                    process_work_credit(new_image, wo_key, key_event)
+                elif key_event == "capture_id":
+                    add_capture_data(new_image, "consignment")
+                    add_capture_data_summary(new_image)
+                elif key_event == "pksk":
+                    process_labor_status(new_image)
+                elif key_event == "condition_id":
+                    LOGGER.info({"message": "Processing record from condition event.", "record": dynamodb_event})
+                    process_condition(new_image, wo_key, key_event, entity_type)
+                    add_condition_data_summary(new_image)
                 else:
-                    if ACTION[key_event].get("process"):
-                        LOGGER.debug("Special process event")
-                        ACTION[key_event]["process"](
-                            new_image, ACTION[key_event]["name"]
-                        )
+                    process_record(
+                        ACTION[key_event]["name"], new_image, wo_key, key_event
+                    )
 
-                    pass
             else:
-                if key_event == "retailrecon_id":
-                    LOGGER.info(f"Deleting work_order records for {key_event} event")
-                    delete_work_order(old_image)
-
-        except MultipleInvalid as validation_error:
-            message = {
-                "validation_error": str(validation_error),
-                "event": "processing order event",
-                "action": "skipping record",
-                "dynamodb_event": dynamodb_event,
-                "kinesis_event": kinesis_event,
-            }
+                if ACTION[key_event].get("process"):
+                    LOGGER.debug("Special process event")
+                    ACTION[key_event]["process"](
+                        new_image, ACTION[key_event]["name"]
+                    )
 
-            LOGGER.warning(message)
+                pass
+        else:
+            if key_event == "retailrecon_id":
+                LOGGER.info(f"Deleting work_order records for {key_event} event")
+                delete_work_order(old_image)
 
-        except KeyError as key_error:
-            message = {
-                "key_error": str(key_error),
-                "key_event": key_event,
-                "action": "skipping record",
-                "dynamodb_event": dynamodb_event,
-            }
+    except MultipleInvalid as validation_error:
+        message = {
+            "validation_error": str(validation_error),
+            "event": "processing order event",
+            "action": "skipping record",
+            "dynamodb_event": dynamodb_event,
+        }
 
-            LOGGER.warning(message)
+        LOGGER.warning(message)
 
-        except UnicodeDecodeError as exc:
-            message = "Invalid stream data, ignoring"
-            reason = str(exc)
-            exception = exc
-            response = "N/A"
+    except KeyError as key_error:
+        message = {
+            "key_error": str(key_error),
+            "key_event": key_event,
+            "action": "skipping record",
+            "dynamodb_event": dynamodb_event,
+        }
 
-            LOGGER.warning(
-                {
-                    "event": message,
-                    "reason": reason,
-                    "record_data": record_data,
-                    "exception": exception,
-                    "response": response,
-                }
-            )
-        except ClientError as c_err:
-            handle_client_error(c_err, kinesis_event)
+        LOGGER.warning(message)
+
+    except ClientError as c_err:
+        handle_client_error(c_err, dynamodb_event)
 
 
 def process_approval(record, wo_key, key_event, old_record):
@@ -177,7 +222,7 @@ def process_approval(record, wo_key, key_event, old_record):
 
     if not work_order_number or not vin:
         #  get pfvehicle record for work_order_key
-        pfvehicle = get_pfvehicle(work_order_key=wo_key)
+        pfvehicle = call(get_pfvehicle, work_order_key=wo_key)
         LOGGER.debug({"pfvehicle": pfvehicle})
         if pfvehicle:
             pfvehicle = json.loads(pfvehicle)
@@ -208,13 +253,9 @@ def process_approval(record, wo_key, key_event, old_record):
     old_damages = old_record.get("order", {}).get("condition", {}).get("damages", []) if old_record else []
 
     damages = {get_damage_isdsa(damage): damage for damage in new_damages}
-    current_damages = query(
-        {
-            "KeyConditionExpression": Key("pk").eq(f"workorder:{wo_key}")
-            & Key("sk").begins_with("damage:")
-        }
-    ).get("Items", [])
-    current_damages = {damage.get("sk", ""): damage for damage in current_damages}
+    # damages, tires and repair labor statuses are reconciled against one read
+    snapshot = WorkOrderSnapshot.load(wo_key)
+    current_damages = snapshot.begins_with("damage:")
     new_set_damages = set(
         map(lambda x: (get_damage_isdsa(x), get_damage_idsa(x)), new_damages)
     )
@@ -234,12 +275,15 @@ def process_approval(record, wo_key, key_event, old_record):
             key = {"pk": f"workorder:{wo_key}", "sk": current_damage["sk"]}
             LOGGER.debug({"deleting_damage": key})
             remove_item(TABLE, key)
+            snapshot.pop(current_damage["sk"])
             current_damage = current_damages.pop(current_damage["sk"])
 
             # Set the approved flag for any associated repair_labor_status
             # to false for this deleted damage
             current_damage["approved"] = False
-            update_repair_status_approval_flag(wo_key, current_damage, updated_by)
+            update_repair_status_approval_flag(
+                wo_key, current_damage, updated_by, snapshot
+            )
 
     for tuple_damage in update_damages:
         current_damage = current_damages.get(
@@ -257,6 +301,7 @@ def process_approval(record, wo_key, key_event, old_record):
                 record,
                 damages[tuple_damage[0]],
                 updated_by,
+                snapshot,
             )
             current_damages.pop(current_damage["sk"])
 
@@ -269,6 +314,7 @@ def process_approval(record, wo_key, key_event, old_record):
                 record,
                 damages[tuple_damage[0]],
                 updated_by,
+                snapshot,
             )
 
     if current_damages:
@@ -285,6 +331,7 @@ def process_approval(record, wo_key, key_event, old_record):
             record,
             damages[tuple_damage[0]],
             updated_by,
+            snapshot,
         )
 
     # tires document
@@ -302,17 +349,32 @@ def process_approval(record, wo_key, key_event, old_record):
         }
         tire_record_data.update({stringcase.snakecase(k): v for k, v in tire.items()})
         sk = "tire:%s" % (stringcase.snakecase(tire["location"].lower()))
-        try:
-            current_tire = get_work_order(pk=f"workorder:{wo_key}", sk=sk)
-            LOGGER.debug({"Current tire": current_tire})
-        except DynamoItemNotFound:
+        if sk in snapshot:
+            LOGGER.debug({"Current tire": snapshot.get(sk)})
+        else:
             put_work_order(wo_key, sk, tire_record_data)
+            snapshot.put(sk, tire_record_data)
 
     # summary document
     process_approval_summary(record)
 
 
-def process_approval_damage(wo_key, sk, work_order_number, vin, record, damage, updated_by):
+def build_damage_labors(damage):
+    """
+    labors of an approval damage, process_approval_damage looks the labor status of
+    each up by its isdt key and plan_rpc plans those lookups
+    """
+    damage = {stringcase.snakecase(k): v for k, v in damage.items()}
+
+    return [
+        build_labor(damage, labor_type)
+        for labor_type in get_labor_types(damage, missing=0)
+    ]
+
+
+def process_approval_damage(
+    wo_key, sk, work_order_number, vin, record, damage, updated_by, snapshot=None
+):
     damage_record_data = {
         "sblu": record["sblu"],
         "site_id": record["site_id"],
@@ -324,35 +386,37 @@ def process_approval_damage(wo_key, sk, work_order_number, vin, record, damage,
     damage_record_data.update({stringcase.snakecase(k): v for k, v in damage.items()})
 
     LOGGER.debug({"damage_record": damage_record_data})
-    labors = [
-        build_labor(damage_record_data, labor_type)
-        for labor_type in LABOR_TYPES
-        if damage_record_data.get("".join((labor_type.lower(), "_labor_hours")), 0) != 0
-        or damage_record_data.get("".join((labor_type.lower(), "_labor_cost")), 0) != 0
-    ]
-
-    if not labors:
-        labors.append(build_labor(damage_record_data, "REPAIR"))
+    labors = build_damage_labors(damage_record_data)
 
     LOGGER.info({"labors": labors})
 
+    remove_statuses = []
     for labor in labors:
         labor_status_sk = create_isdt_key(labor)
         damage_record_data = update_labor_status(
-            labor, wo_key, labor_status_sk, damage_record_data
+            labor, wo_key, labor_status_sk, damage_record_data, remove_statuses
         )
 
     get_overall_damage_status(damage_record_data)
 
+    # keep the charge statuses set by another labor of the damage
+    remove_statuses = sorted(
+        {status for status in remove_statuses if status not in damage_record_data}
+    )
+
     try:
-        returned_record = put_work_order(wo_key, sk, damage_record_data)
-        update_repair_status_approval_flag(wo_key, returned_record, updated_by)
+        returned_record = put_work_order(
+            wo_key, sk, damage_record_data, remove_attributes=remove_statuses
+        )
+        update_repair_status_approval_flag(
+            wo_key, returned_record, updated_by, snapshot
+        )
 
     except KeyError:
         LOGGER.warning({"Item Code is missing": wo_key})
 
 
-def update_repair_status_approval_flag(wo_key, damage, updated_by):
+def update_repair_status_approval_flag(wo_key, damage, updated_by, snapshot=None):
     # Update the approved flag in the damage repair_labor_status if it exists for this ISDSA
     # repair_part_status approved flag handled elsewhere
     try:
@@ -362,6 +426,19 @@ def update_repair_status_approval_flag(wo_key, damage, updated_by):
                 f"{damage.get('severity_code', '')}#" \
                 f"{damage.get('action_code', '')}"
         repair_labor_status_sk = f"repair_labor_status:{isdsa}"
+        if snapshot is not None and repair_labor_status_sk not in snapshot:
+            # the conditional write below would fail on a missing status anyway, a
+            # status written after the snapshot was read is counted as skipped too
+            LOGGER.info(
+                {
+                    "message": "approved flag not updated, no repair_labor_status",
+                    "work_order_key": wo_key,
+                    "sk": repair_labor_status_sk,
+                }
+            )
+            COUNTS.add("SkippedApprovalFlags")
+            return
+
         LOGGER.debug(f"Updating approved flag for pk=workorder:{wo_key}, sk={repair_labor_status_sk}")
         status = {
             "approved": damage.get("approved", False),
@@ -402,7 +479,7 @@ def process_work_credit(record, wo_key, key_event):
 
     if not work_order_number or not vin:
         # get pfvehicle record by site_id and work_order_number
-        pfvehicle = get_pfvehicle(work_order_key=wo_key)
+        pfvehicle = call(get_pfvehicle, work_order_key=wo_key)
         LOGGER.debug({"pfvehicle": pfvehicle})
         if pfvehicle:
             pfvehicle = json.loads(pfvehicle)
@@ -456,7 +533,7 @@ def process_record(key_event_name, new_image, wo_key, key_event):
     work_order_number = new_image.get("work_order_number", None)
     vin = new_image.get("vin", None)
     if not work_order_number or not vin:
-        pfvehicle = json.loads(get_pfvehicle(work_order_key=wo_key))
+        pfvehicle = json.loads(call(get_pfvehicle, work_order_key=wo_key))
         if pfvehicle:
             vin = get_vin(pfvehicle["pfvehicle"])
             work_order_number = pfvehicle["work_order_number"]
@@ -18,6 +18,7 @@ from utils.dynamodb import convert_to_date_stamp
 
 from dynamodb.store import delete_record, put_work_order, query
 from utils import sqs
+from utils.batch import BatchItemFailures
 from validator.amazon_ingest import (InvalidDspRecordException,
                                      validate_amazon_dsp_ingest,
                                      validate_amazon_ingest)
@@ -40,87 +41,90 @@ def process_stream(event, _):
 
     t_loop = 0
 
-    for record in event["Records"]:
-        try:
-            LOGGER.debug(
-                {
-                    "message": "record decoding steps",
-                    "kinesis_data": record["kinesis"]["data"],
-                    "base64_decode": base64.b64decode(record["kinesis"]["data"]),
-                }
-            )
+    batch = BatchItemFailures(event["Records"])
 
-            kinesis_event = json.loads(
-                base64.b64decode(record["kinesis"]["data"]), parse_float=Decimal
-            )
+    for record in batch:
+        with batch.guard(record):
+            try:
+                LOGGER.debug(
+                    {
+                        "message": "record decoding steps",
+                        "kinesis_data": record["kinesis"]["data"],
+                        "base64_decode": base64.b64decode(record["kinesis"]["data"]),
+                    }
+                )
 
-            dynamodb_event = json.loads(
-                json.dumps(json_util.loads(kinesis_event)), parse_float=Decimal
-            )
-            sk = dynamodb_event["dynamodb"]["NewImage"]["sk"]
-            if sk.startswith("dsp"):
-                t_loop = t_loop + process_dsp_event(dynamodb_event)
-            else:
-                t_loop = t_loop + process_event(dynamodb_event)
+                kinesis_event = json.loads(
+                    base64.b64decode(record["kinesis"]["data"]), parse_float=Decimal
+                )
 
-        except MultipleInvalid as validation_error:
-            message = {
-                "validation_error": str(validation_error),
-                "event": "processing amazon ingest event",
-                "action": "skipping record",
-                "kinesis_event": kinesis_event,
-                "dynamodb_event": dynamodb_event,
-            }
+                dynamodb_event = json.loads(
+                    json.dumps(json_util.loads(kinesis_event)), parse_float=Decimal
+                )
+                sk = dynamodb_event["dynamodb"]["NewImage"]["sk"]
+                if sk.startswith("dsp"):
+                    t_loop = t_loop + process_dsp_event(dynamodb_event)
+                else:
+                    t_loop = t_loop + process_event(dynamodb_event)
+
+            except MultipleInvalid as validation_error:
+                message = {
+                    "validation_error": str(validation_error),
+                    "event": "processing amazon ingest event",
+                    "action": "skipping record",
+                    "kinesis_event": kinesis_event,
+                    "dynamodb_event": dynamodb_event,
+                }
 
-            LOGGER.warning(message)
-            sqs.send_message(DL_QUEUE, record)
+                LOGGER.warning(message)
+                sqs.send_message(DL_QUEUE, record)
 
-        except UnicodeDecodeError as exc:
-            message = "Invalid stream data, ignoring"
-            reason = str(exc)
-            exception = exc
-            response = "N/A"
+            except UnicodeDecodeError as exc:
+                message = "Invalid stream data, ignoring"
+                reason = str(exc)
+                exception = exc
+                response = "N/A"
 
-            LOGGER.warning(
-                {
-                    "event": message,
-                    "reason": reason,
-                    "record": kinesis_event,
-                    "exception": exception,
-                    "response": response,
-                }
-            )
-        except ClientError as err:
-            handle_client_error(err, record)
-        except KeyError as err:
-            message = "Failed to update/delete the record"
-            reason = str(err)
-            exception = err
-            response = "N/A"
-            LOGGER.error(
-                {
-                    "event": message,
-                    "reason": reason,
-                    "record": kinesis_event,
-                    "exception": exception,
-                    "response": response,
-                }
-            )
-        except Exception as err:
-            message = "Unknown error"
-            reason = str(err)
-            exception = err
-            response = "N/A"
-            LOGGER.error(
-                {
-                    "event": message,
-                    "reason": reason,
-                    "record": kinesis_event,
-                    "exception": exception,
-                    "response": response,
-                }
-            )
-            sqs.send_message(DL_QUEUE, record)
+                LOGGER.warning(
+                    {
+                        "event": message,
+                        "reason": reason,
+                        "record": kinesis_event,
+                        "exception": exception,
+                        "response": response,
+                    }
+                )
+            except ClientError as err:
+                handle_client_error(err, record)
+            except KeyError as err:
+                message = "Failed to update/delete the record"
+                reason = str(err)
+                exception = err
+                response = "N/A"
+                LOGGER.error(
+                    {
+                        "event": message,
+                        "reason": reason,
+                        "record": kinesis_event,
+                        "exception": exception,
+                        "response": response,
+                    }
+                )
+            except Exception as err:
+                message = "Unknown error"
+                reason = str(err)
+                exception = err
+                response = "N/A"
+                LOGGER.error(
+                    {
+                        "event": message,
+                        "reason": reason,
+                        "record": kinesis_event,
+                        "exception": exception,
+                        "response": response,
+                    }
+                )
+                sqs.send_message(DL_QUEUE, record)
 
     LOGGER.debug(
         {
@@ -130,6 +134,8 @@ def process_stream(event, _):
         }
     )
 
+    return batch.response()
+
 
 def process_dsp_event(record):
     LOGGER.debug({"record": record})
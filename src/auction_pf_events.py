@@ -2,14 +2,11 @@
 processor for listening to rpp-pfvehicle, rpp-pfvhext,rpp-pfvclog, rpp-pfvcfn, prr-pfrecon
 kinesis stream and adding data to rpp-workorder, rpp-vehicle, rpp-location tables
 """
-import base64
 import json
 import time as _time
 from decimal import Decimal
 from aws_xray_sdk.core import patch_all
-import boto3
 from botocore.exceptions import ClientError
-from dynamodb_json import json_util
 from environs import Env
 from rpp_lib.logs import LOGGER
 from voluptuous import MultipleInvalid, Any
@@ -24,85 +21,40 @@ from validation import validate_pfvehicle_offering
 from validation import validate_pfvehicle_body
 from rpp_lib.rpc import get_pfvehicle
 from boto3.dynamodb.conditions import Key
+from utils.aggregation import deaggregate_records
+from utils.batch import BatchItemFailures
 from utils.common import get_vin, add_update_attributes, get_removed_attributes
+from utils.decode_record import decode_record
+from utils.executor import (
+    get_work_order_key,
+    process_by_work_order,
+    run_concurrently,
+)
+from utils.metrics import invocation, patch_aws_calls
+from utils.prefetch import call, rpc
+from utils.resources import table
 
 patch_all()
+patch_aws_calls()
 
 IGNORE_EXCEPTIONS = "ConditionalCheckFailedException"
+VIN_BACKFILL_PREFIXES = ("expense#", "pfvcfn#", "vcflog:body")
 
 ENV = Env()
-DYNAMO = boto3.resource("dynamodb")
-RPP_RECON_WORK_ORDER_TABLE = DYNAMO.Table(
-    name=ENV("WORKORDER_AM_TABLE", validate=Any(str))
-)
+RPP_RECON_WORK_ORDER_TABLE = table(ENV("WORKORDER_AM_TABLE", validate=Any(str)))
 
 
 def process_stream(event, _):
     LOGGER.info({"event": event})
 
-    t_loop = 0
-
-    for record in event["Records"]:
-        try:
-            LOGGER.debug(
-                {
-                    "message": "record decoding steps",
-                    "kinesis_data": record["kinesis"]["data"],
-                    "base64_decode": base64.b64decode(record["kinesis"]["data"]),
-                }
-            )
+    batch = BatchItemFailures(deaggregate_records(event["Records"]))
 
-            kinesis_event = json.loads(
-                base64.b64decode(record["kinesis"]["data"]), parse_float=Decimal
-            )
-
-            dynamodb_event = json.loads(
-                json.dumps(json_util.loads(kinesis_event)), parse_float=Decimal
-            )
-
-            t_loop = t_loop + process_event(dynamodb_event)
-
-        except MultipleInvalid as validation_error:
-            message = {
-                "validation_error": str(validation_error),
-                "event": "processing vehicle event",
-                "action": "skipping record",
-                "kinesis_event": kinesis_event,
-                "dynamodb_event": dynamodb_event,
-            }
-
-            LOGGER.warning(message)
-
-        except UnicodeDecodeError as exc:
-            message = "Invalid stream data, ignoring"
-            reason = str(exc)
-            exception = exc
-            response = "N/A"
-
-            LOGGER.warning(
-                {
-                    "event": message,
-                    "reason": reason,
-                    "record": record,
-                    "exception": exception,
-                    "response": response,
-                }
-            )
-        except (ClientError, KeyError) as err:
-            message = "Failed to update/delete the record"
-            reason = err
-            exception = err
-            response = "N/A"
-
-            LOGGER.error(
-                {
-                    "event": message,
-                    "reason": reason,
-                    "record": record,
-                    "exception": exception,
-                    "response": response,
-                }
+    with invocation("auction_pf_events"):
+        t_loop = sum(
+            process_by_work_order(
+                batch, decode_record, process_dynamodb_event, plan=plan_rpc
             )
+        )
 
     LOGGER.debug(
         {
@@ -112,6 +64,61 @@ def process_stream(event, _):
         }
     )
 
+    return batch.response()
+
+
+def plan_rpc(record):
+    """
+    pfvehicle lookups the expense, vcfn and vcflog records will make
+    """
+    if record["eventName"] == "REMOVE" or record["tableName"] not in (
+        "rpp-pfrecon",
+        "rpp-pfvcfn",
+        "rpp-pfvcflog",
+    ):
+        return []
+
+    if record["dynamodb"]["NewImage"].get("change_status") == "D":
+        return []
+
+    return [rpc(get_pfvehicle, work_order_key=get_work_order_key(record))]
+
+
+def process_dynamodb_event(dynamodb_event):
+    """
+    process a single decoded vehicle event, returns the time spent on it
+    """
+    try:
+        return process_event(dynamodb_event)
+
+    except MultipleInvalid as validation_error:
+        message = {
+            "validation_error": str(validation_error),
+            "event": "processing vehicle event",
+            "action": "skipping record",
+            "dynamodb_event": dynamodb_event,
+        }
+
+        LOGGER.warning(message)
+
+    except (ClientError, KeyError) as err:
+        message = "Failed to update/delete the record"
+        reason = err
+        exception = err
+        response = "N/A"
+
+        LOGGER.error(
+            {
+                "event": message,
+                "reason": reason,
+                "record": dynamodb_event,
+                "exception": exception,
+                "response": response,
+            }
+        )
+
+    return 0
+
 
 def remove_at_fields(event):
     keys_to_remove = [k for k in event.keys() if k.startswith('@')]
@@ -145,9 +152,7 @@ def process_event(record):
         )  # US1034118 pass the whole record into the store function
 
         # update VIN to all records if event is out of order
-        update_records_with_vin(wo_key, "expense#", vin)
-        update_records_with_vin(wo_key, "pfvcfn#", vin)
-        update_records_with_vin(wo_key, "vcflog:body", vin)
+        update_records_with_vin(wo_key, VIN_BACKFILL_PREFIXES, vin)
 
     elif record["tableName"] == "rpp-pfrecon":
         pfrecon = validate_pfrecon(record["dynamodb"]["NewImage"])
@@ -484,27 +489,43 @@ def delete_expenserecord(pfrecon):
 
 
 def get_pfvehicle_record(work_order_key):
-    pfvehicle = json.loads(get_pfvehicle(work_order_key=work_order_key))
+    pfvehicle = json.loads(call(get_pfvehicle, work_order_key=work_order_key))
     return pfvehicle
 
 
-def update_records_with_vin(work_order_key, sk_prefix, vin):
+def update_records_with_vin(work_order_key, sk_prefixes, vin):
     """
-    Update vin to all records with matching pk and sk
+    Update vin to the records with a matching sk prefix that don't have one yet,
+    returns the number of records updated
     """
 
     pk = f"workorder:{work_order_key}"
 
-    LOGGER.debug({"pk": pk, "sk": sk_prefix, "vin": vin})
+    LOGGER.debug({"pk": pk, "sk": sk_prefixes, "vin": vin})
 
-    key_condition_expression = Key("pk").eq(pk) & Key("sk").begins_with(sk_prefix)
+    query_params = {
+        "KeyConditionExpression": Key("pk").eq(pk),
+        "ProjectionExpression": "#sk, #vin",
+        "ExpressionAttributeNames": {"#sk": "sk", "#vin": "vin"},
+    }
 
-    response = RPP_RECON_WORK_ORDER_TABLE.query(
-        KeyConditionExpression=key_condition_expression
-    )
+    missing_vin = []
+    while True:
+        response = RPP_RECON_WORK_ORDER_TABLE.query(**query_params)
+        missing_vin.extend(
+            item["sk"]
+            for item in response["Items"]
+            if item["sk"].startswith(sk_prefixes) and "vin" not in item
+        )
+
+        if "LastEvaluatedKey" not in response:
+            break
+        query_params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
 
-    for item in response["Items"]:
-        key = {"pk": pk, "sk": item["sk"]}
+    LOGGER.debug({"pk": pk, "missing_vin": missing_vin})
+
+    def update_vin(sk):
+        key = {"pk": pk, "sk": sk}
 
         attribute_names = {"#vin": "vin"}
         attribute_values = {":vin": vin}
@@ -521,13 +542,20 @@ def update_records_with_vin(work_order_key, sk_prefix, vin):
             }
         )
 
-        response = RPP_RECON_WORK_ORDER_TABLE.update_item(
-            Key=key,
-            UpdateExpression=update_expression,
-            ConditionExpression=condition_expression,
-            ExpressionAttributeNames=attribute_names,
-            ExpressionAttributeValues=attribute_values,
-            ReturnValues="UPDATED_NEW",
-        )
+        try:
+            RPP_RECON_WORK_ORDER_TABLE.update_item(
+                Key=key,
+                UpdateExpression=update_expression,
+                ConditionExpression=condition_expression,
+                ExpressionAttributeNames=attribute_names,
+                ExpressionAttributeValues=attribute_values,
+            )
+        except ClientError as c_err:
+            # the vin was set since the query
+            if c_err.response["Error"]["Code"] not in IGNORE_EXCEPTIONS:
+                raise c_err
+            return 0
+
+        return 1
 
-        return response["Attributes"]
+    return sum(run_concurrently(update_vin, missing_vin))
@@ -7,12 +7,17 @@ from decimal import Decimal
 from dynamodb.store import put_work_order, update_document_for_pk_and_sk
 from environs import Env
 from rpp_lib.logs import LOGGER
+from utils.aggregation import deaggregate_records
+from utils.batch import BatchItemFailures
+from utils.changes import get_image_attributes, is_unchanged
 from utils.common import get_removed_attributes, get_utc_now, get_updated_hr
 from utils.decode_record import decode_record
+from utils.metrics import patch_aws_calls, timed
 from utils.sqs import send_message
 from voluptuous import Any, MultipleInvalid
 
 patch_all()
+patch_aws_calls()
 
 ENV = Env()
 
@@ -73,6 +78,7 @@ def set_manheim_account_number(
 
 @with_lambda_profiler(profiling_group_name=PROFILE_GROUP)
 @xray_recorder.capture()
+@timed("charges_ingest")
 def process_stream(event, _):
     """
     processing rpp-charges-ingest kinesis stream for charge items
@@ -80,110 +86,121 @@ def process_stream(event, _):
 
     LOGGER.info({"event": event})
 
-    decoded_records = [decode_record(record) for record in event["Records"] if record]
+    batch = BatchItemFailures(deaggregate_records(event["Records"]))
     records_dict = {}  # Track processed records for manheim_account_number updates
 
-    for record in decoded_records:
-        LOGGER.info({"message": " Processing record.", "record": record})
-        try:
-            charge_call = record["dynamodb"]["NewImage"]
-            remove_attributes = []
-            old_image = record["dynamodb"].get("OldImage", {})
+    for kinesis_record in batch:
+        record = decode_record(kinesis_record)
+        if record is None:
+            continue
+
+        with batch.guard(kinesis_record):
+            LOGGER.info({"message": " Processing record.", "record": record})
+            # the charge items are copied whole
+            if is_unchanged(record, get_image_attributes(record)):
+                continue
+
+            try:
+                charge_call = record["dynamodb"]["NewImage"]
+                remove_attributes = []
+                old_image = record["dynamodb"].get("OldImage", {})
+
+                if old_image:
+                    remove_attributes = get_removed_attributes(
+                        charge_call.keys(), old_image.keys(), record_mapping=None
+                    )
 
-            if old_image:
-                remove_attributes = get_removed_attributes(
-                    charge_call.keys(), old_image.keys(), record_mapping=None
-                )
+                """
+                define sk for vehicle release events
+                """
+                workorder = charge_call.pop("pk").split(":")[1]
+                sk = charge_call.pop("sk")
+
+                # Check if we should update manheim_account_number
+                pk_for_update = f"workorder:{workorder}"
+                new_manheim_account_number = record["dynamodb"]["NewImage"][
+                    "manheim_account_number"
+                ]
+
+                if (
+                    sk.startswith("charge")
+                    and "manheim_account_number" in record["dynamodb"]["NewImage"]
+                    and pk_for_update
+                    not in records_dict  # Not already processed in this batch
+                    and (
+                        not old_image
+                        or old_image.get("manheim_account_number")
+                        != new_manheim_account_number
+                    )
+                ):
 
-            """
-            define sk for vehicle release events
-            """
-            workorder = charge_call.pop("pk").split(":")[1]
-            sk = charge_call.pop("sk")
-
-            # Check if we should update manheim_account_number
-            pk_for_update = f"workorder:{workorder}"
-            new_manheim_account_number = record["dynamodb"]["NewImage"][
-                "manheim_account_number"
-            ]
-
-            if (
-                sk.startswith("charge")
-                and "manheim_account_number" in record["dynamodb"]["NewImage"]
-                and pk_for_update
-                not in records_dict  # Not already processed in this batch
-                and (
-                    not old_image
-                    or old_image.get("manheim_account_number")
-                    != new_manheim_account_number
-                )
-            ):
+                    LOGGER.info(
+                        {
+                            "message": f"Updating manheim_account_number for workorder={workorder}, sk={sk}",
+                            "new_manheim_account_number": new_manheim_account_number,
+                            "old_manheim_account_number": (
+                                old_image.get("manheim_account_number")
+                                if old_image
+                                else None
+                            ),
+                        }
+                    )
+
+                    try:
+                        set_manheim_account_number(
+                            records_dict, pk_for_update, new_manheim_account_number
+                        )
+                    except Exception as update_err:
+                        LOGGER.error(
+                            {
+                                "message": "Failed to update manheim_account_number",
+                                "workorder": workorder,
+                                "error": str(update_err),
+                            }
+                        )
 
                 LOGGER.info(
                     {
-                        "message": f"Updating manheim_account_number for workorder={workorder}, sk={sk}",
-                        "new_manheim_account_number": new_manheim_account_number,
-                        "old_manheim_account_number": (
-                            old_image.get("manheim_account_number")
-                            if old_image
-                            else None
-                        ),
+                        "message": f"Adding a charge document into the table rpp-recon-work-order with  workorder={workorder} and sk={sk}, remove_attributes={remove_attributes}"
                     }
                 )
+                put_work_order(
+                    workorder=workorder,
+                    sk=sk,
+                    remove_attributes=remove_attributes,
+                    record=charge_call,
+                ),
+            except MultipleInvalid as validation_error:
+                LOGGER.error(
+                    {
+                        "message": "Record processing will be skipped",
+                        "reason": str(validation_error),
+                        "record": record,
+                    }
+                )
+                record.update({"reason": str(validation_error)})
+                send_message(DL_QUEUE, record)
 
-                try:
-                    set_manheim_account_number(
-                        records_dict, pk_for_update, new_manheim_account_number
-                    )
-                except Exception as update_err:
-                    LOGGER.error(
-                        {
-                            "message": "Failed to update manheim_account_number",
-                            "workorder": workorder,
-                            "error": str(update_err),
-                        }
-                    )
-
-            LOGGER.info(
-                {
-                    "message": f"Adding a charge document into the table rpp-recon-work-order with  workorder={workorder} and sk={sk}, remove_attributes={remove_attributes}"
+            except ClientError as db_err:
+                message = {
+                    "event": "Client error",
+                    "reason": str(db_err),
+                    "record": record,
                 }
-            )
-            put_work_order(
-                workorder=workorder,
-                sk=sk,
-                remove_attributes=remove_attributes,
-                record=charge_call,
-            ),
-        except MultipleInvalid as validation_error:
-            LOGGER.error(
-                {
-                    "message": "Record processing will be skipped",
-                    "reason": str(validation_error),
+                LOGGER.error(message)
+
+                record.update({"reason": str(db_err)})
+                send_message(DL_QUEUE, record)
+
+            except Exception as err:
+                message = {
+                    "event": "Unknown error",
+                    "reason": str(err),
                     "record": record,
                 }
-            )
-            record.update({"reason": str(validation_error)})
-            send_message(DL_QUEUE, record)
-
-        except ClientError as db_err:
-            message = {
-                "event": "Client error",
-                "reason": str(db_err),
-                "record": record,
-            }
-            LOGGER.error(message)
-
-            record.update({"reason": str(db_err)})
-            send_message(DL_QUEUE, record)
-
-        except Exception as err:
-            message = {
-                "event": "Unknown error",
-                "reason": str(err),
-                "record": record,
-            }
-            LOGGER.exception(message)
-
-            record.update({"reason": str(err)})
-            send_message(DL_QUEUE, record)
+                LOGGER.exception(message)
+
+                record.update({"reason": str(err)})
+                send_message(DL_QUEUE, record)
+
+    return batch.response()
@@ -8,11 +8,16 @@ from rpp_lib.logs import LOGGER
 from voluptuous import Any, MultipleInvalid
 
 from dynamodb.store import put_work_order
+from utils.aggregation import deaggregate_records
+from utils.batch import BatchItemFailures
+from utils.changes import get_image_attributes, is_unchanged
 from utils.decode_record import decode_record
+from utils.metrics import patch_aws_calls, timed
 from utils.sqs import send_message
 
 
 patch_all()
+patch_aws_calls()
 
 ENV = Env()
 
@@ -25,6 +30,7 @@ RECON_WORK_ORDER_TABLE = DYNAMO.Table(ENV("WORKORDER_AM_TABLE", validate=Any(str
 
 @with_lambda_profiler(profiling_group_name=PROFILE_GROUP)
 @xray_recorder.capture()
+@timed("client_data_ingest")
 def process_stream(event, _):
     """
     processing rpp-client-data-ingest kinesis stream for PO records uploaded by customer
@@ -32,47 +38,58 @@ def process_stream(event, _):
 
     LOGGER.debug({"event": event})
 
-    decoded_records = [decode_record(record) for record in event["Records"] if record]
-
-    for record in decoded_records:
-        if record["eventName"] == "REMOVE":
-            return
+    batch = BatchItemFailures(deaggregate_records(event["Records"]))
+
+    for kinesis_record in batch:
+        record = decode_record(kinesis_record)
+        if record is None:
+            continue
+
+        with batch.guard(kinesis_record):
+            if record["eventName"] == "REMOVE":
+                return batch.response()
+
+            # the po items are copied whole
+            if is_unchanged(record, get_image_attributes(record)):
+                continue
+
+            try:
+                po_record = record["dynamodb"]["NewImage"]
+                workorder = po_record.pop("pk").split(":")[1]
+                sk = po_record.pop("sk")
+                put_work_order(workorder=workorder, sk=sk, record=po_record)
+
+            except MultipleInvalid as validation_error:
+                LOGGER.error(
+                    {
+                        "message": "Record processing will be skipped",
+                        "reason": str(validation_error),
+                        "record": record,
+                    }
+                )
+                record.update({"reason": str(validation_error)})
+                send_message(DL_QUEUE, record)
+
+            except ClientError as db_err:
+                message = {
+                    "event": "Client error",
+                    "reason": str(db_err),
+                    "record": record,
+                }
+                LOGGER.error(message)
 
-        try:
-            po_record = record["dynamodb"]["NewImage"]
-            workorder = po_record.pop("pk").split(":")[1]
-            sk = po_record.pop("sk")
-            put_work_order(workorder=workorder, sk=sk, record=po_record)
+                record.update({"reason": str(db_err)})
+                send_message(DL_QUEUE, record)
 
-        except MultipleInvalid as validation_error:
-            LOGGER.error(
-                {
-                    "message": "Record processing will be skipped",
-                    "reason": str(validation_error),
+            except Exception as err:
+                message = {
+                    "event": "Unknown error",
+                    "reason": str(err),
                     "record": record,
                 }
-            )
-            record.update({"reason": str(validation_error)})
-            send_message(DL_QUEUE, record)
-
-        except ClientError as db_err:
-            message = {
-                "event": "Client error",
-                "reason": str(db_err),
-                "record": record,
-            }
-            LOGGER.error(message)
-
-            record.update({"reason": str(db_err)})
-            send_message(DL_QUEUE, record)
-
-        except Exception as err:
-            message = {
-                "event": "Unknown error",
-                "reason": str(err),
-                "record": record,
-            }
-            LOGGER.exception(message)
-
-            record.update({"reason": str(err)})
-            send_message(DL_QUEUE, record)
+                LOGGER.exception(message)
+
+                record.update({"reason": str(err)})
+                send_message(DL_QUEUE, record)
+
+    return batch.response()
@@ -14,6 +14,7 @@ from voluptuous import MultipleInvalid
 from environs import Env
 
 from utils import sqs
+from utils.batch import BatchItemFailures
 from utils.dynamodb import update, remove_item
 import boto3
 
@@ -40,45 +41,50 @@ def process_stream(event, _):
     """
     LOGGER.info({"event": event})
 
-    for record in event["Records"]:
-        try:
-            kinesis_event = json.loads(
-                base64.b64decode(record["kinesis"]["data"]), parse_float=Decimal
-            )
-
-            dynamodb_event = json.loads(
-                json.dumps(json_util.loads(kinesis_event)), parse_float=Decimal
-            )
-
-            LOGGER.debug({"decoded record": dynamodb_event})
-            process_record(dynamodb_event)
-        except UnicodeDecodeError as exc:
-            message = "Invalid stream data, ignoring"
-            reason = str(exc)
-            response = "N/A"
-
-            LOGGER.warning(
-                {
-                    "event": message,
-                    "reason": reason,
+    batch = BatchItemFailures(event["Records"])
+
+    for record in batch:
+        with batch.guard(record):
+            try:
+                kinesis_event = json.loads(
+                    base64.b64decode(record["kinesis"]["data"]), parse_float=Decimal
+                )
+
+                dynamodb_event = json.loads(
+                    json.dumps(json_util.loads(kinesis_event)), parse_float=Decimal
+                )
+
+                LOGGER.debug({"decoded record": dynamodb_event})
+                process_record(dynamodb_event)
+            except UnicodeDecodeError as exc:
+                message = "Invalid stream data, ignoring"
+                reason = str(exc)
+                response = "N/A"
+
+                LOGGER.warning(
+                    {
+                        "event": message,
+                        "reason": reason,
+                        "record": record,
+                        "response": response,
+                    }
+                )
+
+            except ClientError as err:
+                handle_client_error(err, record)
+            except Exception as err:
+                record.update({"reason": str(err)})
+                message = {
+                    "event": "Unknown error",
+                    "reason": str(err),
                     "record": record,
-                    "response": response,
                 }
-            )
 
-        except ClientError as err:
-            handle_client_error(err, record)
-        except Exception as err:
-            record.update({"reason": str(err)})
-            message = {
-                "event": "Unknown error",
-                "reason": str(err),
-                "record": record,
-            }
+                LOGGER.exception(message)
+                LOGGER.info(message)
+                sqs.send_message(DLQ, record)
 
-            LOGGER.exception(message)
-            LOGGER.info(message)
-            sqs.send_message(DLQ, record)
+    return batch.response()
 
 
 @xray_recorder.capture()
@@ -10,6 +10,7 @@ from rpp_lib.rpc import get_labor_status, get_work_credit
 from stringcase import snakecase
 from voluptuous import MultipleInvalid
 
+from utils.prefetch import call, rpc
 from validation import valid_damage, valid_damage_labor, valid_work_credit
 
 LABOR_TYPES = ("REPAIR", "PAINT", "PART")
@@ -51,17 +52,7 @@ def create_damage_list(damages, work_order_key):
         try:
             damage = valid_damage(damage)
             dmg = {snakecase(k): v for (k, v) in damage.items()}
-            labors = [
-                build_labor(dmg, labor_type)
-                for labor_type in LABOR_TYPES
-                if dmg.get(labor_type.lower() + "_labor_hours") != 0
-                or dmg.get(labor_type.lower() + "_labor_cost") != 0
-            ]
-
-            if not labors:
-                labors.append(build_labor(dmg, "REPAIR"))
-
-            for labor in labors:
+            for labor in build_labors(dmg):
                 isdt_key = create_isdt_key(labor)
                 labor = update_labor(labor, isdt_key, work_order_key)
                 approved_damages.update({isdt_key: labor})
@@ -73,6 +64,50 @@ def create_damage_list(damages, work_order_key):
     return approved_damages, declined_damages
 
 
+def plan_damage_rpc(order, work_order_key):
+    """
+    labor status and work credit lookups update_labor will make for the order damages
+    """
+    calls = []
+    for damage in order.get("condition", {}).get("damages", []):
+        try:
+            dmg = {snakecase(k): v for (k, v) in valid_damage(damage).items()}
+            labors = build_labors(dmg)
+        except MultipleInvalid:
+            continue
+
+        for labor in labors:
+            isdt_key = create_isdt_key(labor)
+            calls.append(rpc(get_labor_status, work_order_key, isdt_key))
+            calls.append(rpc(get_work_credit, work_order_key, isdt_key))
+
+    return calls
+
+
+def get_labor_types(damage, missing=None):
+    """
+    labor types of a snake cased damage, those it has hours or a cost for and REPAIR
+    when it has none. A labor type whose attributes the damage doesn't have counts as
+    having labor unless missing is 0.
+    """
+    labor_types = [
+        labor_type
+        for labor_type in LABOR_TYPES
+        if damage.get(labor_type.lower() + "_labor_hours", missing) != 0
+        or damage.get(labor_type.lower() + "_labor_cost", missing) != 0
+    ]
+
+    return labor_types or ["REPAIR"]
+
+
+def build_labors(damage):
+    """
+    labors of a valid snake cased damage, create_damage_list looks the labor status
+    and work credit of each up by its isdt key and plan_damage_rpc plans those lookups
+    """
+    return [build_labor(damage, labor_type) for labor_type in get_labor_types(damage)]
+
+
 def build_labor(damage, labor_type):
     """Returns labor based on labor_type."""
     labor = valid_damage_labor(dict(damage.items()), labor_type.lower())
@@ -117,7 +152,7 @@ def update_labor(labor, isdt_key, work_order_key):
             }
         )
 
-    labor_status = get_labor_status(work_order_key, isdt_key)
+    labor_status = call(get_labor_status, work_order_key, isdt_key)
 
     if labor_status:
         labor.update({"current_status": labor_status["current_status"]})
@@ -129,7 +164,7 @@ def update_labor(labor, isdt_key, work_order_key):
             labor.update({"charge_p_status": labor_status["charge_p_status"]})
 
     try:
-        work_credit_info = get_work_credit(work_order_key, isdt_key)
+        work_credit_info = call(get_work_credit, work_order_key, isdt_key)
         work_credit = valid_work_credit(work_credit_info)
 
         if work_credit:
@@ -1,7 +1,6 @@
 """
     dynamodb file to store/retrieve work-order information from rpp-recon-work-order
 """
-import boto3
 from aws_xray_sdk.core import patch_all
 from boto3.dynamodb.conditions import Key, ConditionBase
 from environs import Env
@@ -9,13 +8,44 @@ from rpp_lib.dynamodb import get_item
 from rpp_lib.logs import LOGGER
 from voluptuous import Any
 from utils.common import sanitize_for_logging
+from utils.expression import build_update
+from utils.resources import table
 
 patch_all()
 
 ENV = Env()
-DYNAMO = boto3.resource("dynamodb")
 WORK_ORDER_TABLE_NAME = ENV("WORKORDER_AM_TABLE", validate=Any(str))
-WO_TABLE = DYNAMO.Table(WORK_ORDER_TABLE_NAME)
+WO_TABLE = table(WORK_ORDER_TABLE_NAME)
+# damages of a work order by item_code and damage, keyed on damage_work_order and
+# damage_key
+DAMAGE_INDEX = "index_damage_work_order"
+
+
+def get_damage_work_order(site_id: str, work_order_number: str) -> str:
+    return f"{site_id}#{work_order_number}"
+
+
+def get_damage_key(item_code: str, damage: str) -> str:
+    return f"{item_code}#{damage}"
+
+
+def with_damage_keys(record: dict) -> dict:
+    """
+    record with the keys of DAMAGE_INDEX when it has a site_id, work_order_number,
+    item_code and damage, the record itself otherwise
+    """
+    values = [
+        record.get(name)
+        for name in ("site_id", "work_order_number", "item_code", "damage")
+    ]
+    if not all(isinstance(value, str) and value for value in values):
+        return record
+
+    return {
+        **record,
+        "damage_work_order": get_damage_work_order(*values[:2]),
+        "damage_key": get_damage_key(*values[2:]),
+    }
 
 
 def get_work_order(pk: str, sk: str) -> dict:
@@ -34,20 +64,27 @@ def get_work_order(pk: str, sk: str) -> dict:
     return item
 
 
-def get_work_oder_index(key: dict, index: str) -> list:
+def get_key_condition(key: dict) -> ConditionBase:
     """
-    return list of records for a given index
+    key condition of the first two attributes of key, hash key first
     """
-    LOGGER.debug({"key": key, "index": index})
-
     key_items = list(key.items())
     key_ce = Key(key_items[0][0]).eq(key_items[0][1])
     if len(key_items) > 1:
         key_ce = key_ce & Key(key_items[1][0]).eq(key_items[1][1])
 
+    return key_ce
+
+
+def get_work_oder_index(key: dict, index: str) -> list:
+    """
+    return list of records for a given index
+    """
+    LOGGER.debug({"key": key, "index": index})
+
     response = WO_TABLE.query(
         IndexName=index,
-        KeyConditionExpression=key_ce,
+        KeyConditionExpression=get_key_condition(key),
     )
 
     if not response.get("Items"):
@@ -124,36 +161,23 @@ def update_document_for_pk_and_sk(pk: str, sk: str, document: dict, condition_ex
 
     if not sanitized_document:
         raise ValueError("No valid attributes to update")
+    sanitized_document = with_damage_keys(sanitized_document)
 
-    attribute_names = {}
-    attribute_values = {}
-
-    update_expression = "set "
-    update_expression += ",".join(["#" + k + " = :" + k for k in sanitized_document.keys()])
-
-    attribute_names.update({"#" + k: k for k in sanitized_document.keys()})
-    attribute_values.update({":" + k: sanitized_document[k] for k in sanitized_document.keys()})
-
-    # Prepare update parameters
+    # Prepare update parameters, with the conditional expression if provided
     update_params = {
         "Key": key,
-        "UpdateExpression": update_expression,
-        "ExpressionAttributeNames": attribute_names,
-        "ExpressionAttributeValues": attribute_values,
         "ReturnValues": "UPDATED_NEW",
+        **build_update(
+            sanitized_document, condition=condition_obj or condition_expression
+        ),
     }
 
-    # Add conditional expression if provided
-    if condition_obj:
-        update_params["ConditionExpression"] = condition_obj
-    elif condition_expression:
-        update_params["ConditionExpression"] = condition_expression
     data_to_log = sanitize_for_logging({
         "key": key,
-        "update_expression": update_expression,
+        "update_expression": update_params["UpdateExpression"],
         "condition_expression": update_params.get("ConditionExpression"),
-        "attribute_names": attribute_names,
-        "attribute_values": attribute_values,
+        "attribute_names": update_params["ExpressionAttributeNames"],
+        "attribute_values": update_params["ExpressionAttributeValues"],
     })
     LOGGER.info(
         data_to_log
@@ -206,19 +230,6 @@ def put_work_order(workorder: str,
     LOGGER.debug({"workorder": workorder, "sk": sk})
     key = {"pk": f"workorder:{workorder}", "sk": sk}
 
-    attribute_names = {}
-    attribute_values = {}
-
-    update_expression = "set "
-    update_expression += ",".join(["#" + k + " = :" + k for k in record.keys()])
-
-    if remove_attributes:
-        update_expression += " remove "
-        update_expression += ", ".join(remove_attributes)
-
-    attribute_names.update({"#" + k: k for k in record.keys()})
-
-    attribute_values.update({":" + k: record[k] for k in record.keys()})
     if condition_obj:
         condition_expression = condition_obj
     else:
@@ -226,24 +237,19 @@ def put_work_order(workorder: str,
         if condition:
             condition_expression += " " + condition
 
+    update = build_update(with_damage_keys(record), remove_attributes, condition_expression)
+
     LOGGER.info(
         {
             "key": key,
-            "update_expression": update_expression,
+            "update_expression": update["UpdateExpression"],
             "condition_expression": condition_expression,
-            "attribute_names": attribute_names,
-            "attribute_values": attribute_values,
+            "attribute_names": update["ExpressionAttributeNames"],
+            "attribute_values": update["ExpressionAttributeValues"],
         }
     )
 
-    response = WO_TABLE.update_item(
-        Key=key,
-        UpdateExpression=update_expression,
-        ConditionExpression=condition_expression,
-        ExpressionAttributeNames=attribute_names,
-        ExpressionAttributeValues=attribute_values,
-        ReturnValues="UPDATED_NEW",
-    )
+    response = WO_TABLE.update_item(Key=key, ReturnValues="UPDATED_NEW", **update)
 
     return response["Attributes"]
 
@@ -252,6 +258,55 @@ class DynamoItemNotFound(Exception):
     pass
 
 
+class WorkOrderSnapshot:
+    """
+    In memory view of a work order partition read with a single paginated query,
+    rows are indexed by sk. Callers that write rows while working from the view
+    keep it up to date with put/pop.
+    """
+
+    def __init__(self, workorder: str, items: list):
+        self.workorder = workorder
+        self.items = {item["sk"]: item for item in items}
+
+    @classmethod
+    def load(cls, workorder: str) -> "WorkOrderSnapshot":
+        query_params = {
+            "KeyConditionExpression": Key("pk").eq(f"workorder:{workorder}")
+        }
+
+        items = []
+        while True:
+            response = WO_TABLE.query(**query_params)
+            items.extend(response.get("Items", []))
+
+            if "LastEvaluatedKey" not in response:
+                break
+            query_params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+        LOGGER.debug({"workorder": workorder, "snapshot_size": len(items)})
+
+        return cls(workorder, items)
+
+    def __contains__(self, sk: str) -> bool:
+        return sk in self.items
+
+    def get(self, sk: str, default=None):
+        return self.items.get(sk, default)
+
+    def begins_with(self, prefix: str) -> dict:
+        """
+        rows whose sk starts with prefix, by sk
+        """
+        return {sk: item for sk, item in self.items.items() if sk.startswith(prefix)}
+
+    def put(self, sk: str, item: dict):
+        self.items[sk] = {**self.items.get(sk, {}), **item, "sk": sk}
+
+    def pop(self, sk: str, default=None):
+        return self.items.pop(sk, default)
+
+
 def delete_record(workorder: str, sk: str):
     """
     Delete work-order row info for a given workorder
@@ -269,3 +324,29 @@ def delete_record(workorder: str, sk: str):
 
 def query(kwargs) -> dict:
     return WO_TABLE.query(**kwargs)
+
+
+def query_page(kwargs: dict,
+               page_size: int = None,
+               start_key: dict = None,
+               all_pages: bool = False) -> tuple:
+    """
+    items and LastEvaluatedKey of a page starting after start_key, of page_size
+    items or as many as one query reads, or of every page when all_pages
+    """
+    kwargs = dict(kwargs)
+    if start_key:
+        kwargs["ExclusiveStartKey"] = start_key
+    if page_size is not None:
+        kwargs["Limit"] = page_size
+    if not all_pages:
+        response = WO_TABLE.query(**kwargs)
+        return response.get("Items", []), response.get("LastEvaluatedKey")
+
+    items = []
+    while True:
+        response = WO_TABLE.query(**kwargs)
+        items.extend(response.get("Items", []))
+        if "LastEvaluatedKey" not in response:
+            return items, None
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
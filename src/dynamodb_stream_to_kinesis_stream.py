@@ -4,13 +4,18 @@ pulling the records from dynamodb stream and pushing them to kinesis stream
 import time
 import json
 import sys
-import uuid
 import boto3
 from aws_xray_sdk.core import xray_recorder  # noqa: F401
 from aws_xray_sdk.core import patch_all
 from botocore.exceptions import ClientError
 from environs import Env
 from rpp_lib.logs import LOGGER
+from utils import partition
+from utils.aggregation import MAX_SIZE, aggregate, group_entries
+from utils.batch import BatchItemFailures
+from utils.cache import invalidate
+from utils.metrics import timed
+from utils.trim import trim_record
 from voluptuous import Any
 
 patch_all()
@@ -18,21 +23,24 @@ patch_all()
 ENV = Env()
 KINESIS = boto3.client("kinesis")
 RECON_WORKORDER_KINESIS_STREAM_ARN = ENV("RECON_WORKORDER_KINESIS_STREAM_ARN", validate=Any(str))
+# kpl aggregation of the records of a pk, every consumer of the stream has to deaggregate first
+RECORD_AGGREGATION = ENV.bool("RECORD_AGGREGATION", False)
+RECORD_AGGREGATION_MAX_SIZE = ENV.int("RECORD_AGGREGATION_MAX_SIZE", MAX_SIZE)
 
 
+@timed("dynamodb_stream_to_kinesis_stream")
 def handler(event, context):
     LOGGER.info({"event": event})
-    messages_to_reprocess = []
-    batch_failure_response = {"batchItemFailures": messages_to_reprocess}
+    batch = BatchItemFailures(event["Records"])
 
     LOGGER.info({"message": f"Got {len(event['Records'])} record(s) to process"})
     response = {}
-    for dynamodb_stream_record in event["Records"]:
+    for dynamodb_stream_records, kwargs in get_puts(event["Records"]):
+        if batch.failed:
+            break
+        # the put of an aggregated record fails every record it has
+        dynamodb_stream_record = dynamodb_stream_records[0]
         try:
-            add_additional_fields_to_record(dynamodb_stream_record)
-            kwargs = {"Data": json.dumps(dynamodb_stream_record).encode("utf-8"),
-                      "PartitionKey": get_partition_key(dynamodb_stream_record),
-                      "StreamARN": RECON_WORKORDER_KINESIS_STREAM_ARN}
             LOGGER.info({"message": "Putting the data into the kinesis stream", "kwargs": kwargs})
             response = KINESIS.put_record(**kwargs)
             if response["ResponseMetadata"]["HTTPStatusCode"] == 200:
@@ -40,29 +48,59 @@ def handler(event, context):
                 continue
 
             LOGGER.critical({"message": "Error while putting the data into the kinesis stream"})
-            messages_to_reprocess.append({"itemIdentifier": dynamodb_stream_record["dynamodb"]["SequenceNumber"]})
             message = {
                 "message": f"Error while putting the data into the kinesis stream {RECON_WORKORDER_KINESIS_STREAM_ARN}. Will be returned for reprocessing",
                 "reason": response,
                 "dynamodb_stream_sequence_number": dynamodb_stream_record["dynamodb"]["SequenceNumber"],
                 "chunk_size": sys.getsizeof({"Data": kwargs["Data"], "PartitionKey": kwargs["PartitionKey"]}),
-                "chunk": dynamodb_stream_record,
+                "chunk": dynamodb_stream_records,
             }
             LOGGER.critical(message)
-            return batch_failure_response
+            batch.fail(dynamodb_stream_record, response)
         except ClientError as err:
-            messages_to_reprocess.append({"itemIdentifier": dynamodb_stream_record["dynamodb"]["SequenceNumber"]})
             message = {
                 "message": f"Error while putting the data into the kinesis stream {RECON_WORKORDER_KINESIS_STREAM_ARN}. Will be returned for reprocessing",
                 "reason": str(err),
                 "dynamodb_stream_sequence_number": dynamodb_stream_record["dynamodb"]["SequenceNumber"],
                 "chunk_size": sys.getsizeof({"Data": kwargs["Data"], "PartitionKey": kwargs["PartitionKey"]}),
-                "chunk": dynamodb_stream_record,
+                "chunk": dynamodb_stream_records,
             }
             LOGGER.critical(message)
-            return batch_failure_response
+            batch.fail(dynamodb_stream_record, err)
 
-    return batch_failure_response
+    try:
+        invalidate(event["Records"])
+    except ClientError as err:
+        # the cached lookups still expire after READ_CACHE_TTL
+        LOGGER.warning({"message": "Unable to invalidate the cached lookups", "reason": str(err)})
+
+    return batch.response()
+
+
+def get_puts(records):
+    """ (dynamodb stream records, put_record kwargs) of a batch, in the order of its
+    first record. With RECORD_AGGREGATION the records of a pk are put together in
+    kpl aggregated records. """
+    entries = []
+    for record in records:
+        add_additional_fields_to_record(record)
+        entries.append(partition.with_hash_key({"Data": json.dumps(trim_record(record)).encode("utf-8"),
+                                                "PartitionKey": get_partition_key(record),
+                                                "Record": record}, record))
+    partition.report_distribution(entries, RECON_WORKORDER_KINESIS_STREAM_ARN)
+
+    groups = group_entries(entries, RECORD_AGGREGATION_MAX_SIZE) if RECORD_AGGREGATION else [[entry] for entry in entries]
+    puts = []
+    for group in groups:
+        data = group[0]["Data"] if len(group) == 1 else aggregate(group[0]["PartitionKey"], [entry["Data"] for entry in group])
+        kwargs = {"Data": data,
+                  "PartitionKey": group[0]["PartitionKey"],
+                  "StreamARN": RECON_WORKORDER_KINESIS_STREAM_ARN}
+        if "ExplicitHashKey" in group[0]:
+            kwargs["ExplicitHashKey"] = group[0]["ExplicitHashKey"]
+        puts.append(([entry["Record"] for entry in group], kwargs))
+
+    return puts
 
 
 def add_additional_fields_to_record(record):
@@ -79,13 +117,5 @@ def add_additional_fields_to_record(record):
 
 
 def get_partition_key(record):
-    """ get dynamodb stream partition key """
-    try:
-        partition_key = record["dynamodb"]["NewImage"]["pk"]["S"]
-    except KeyError:
-        try:
-            partition_key = record["dynamodb"]["OldImage"]["pk"]["S"]
-        except KeyError:
-            partition_key = str(uuid.uuid4())
-
-    return str(partition_key)
+    """ get dynamodb stream partition key, the pk of the record """
+    return partition.get_partition_key(record, "pk")
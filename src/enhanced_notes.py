@@ -12,6 +12,7 @@ from voluptuous import MultipleInvalid, Any
 from aws_lambda_powertools import Tracer, Logger
 from environs import Env
 
+from utils.batch import BatchItemFailures
 from utils.dynamodb import update
 from validator.enhanced_notes import valid_enhanced_notes_item
 from utils.common import (
@@ -37,9 +38,9 @@ def handler(event, _):
     """
     LOGGER.info({"event": event})
 
-    batch_item_failures = []
+    batch = BatchItemFailures(event["Records"])
 
-    for record in event["Records"]:
+    for record in batch:
         try:
             kinesis_event = json.loads(
                 base64.b64decode(record["kinesis"]["data"]), parse_float=Decimal
@@ -64,22 +65,17 @@ def handler(event, _):
                 }
             )
         except Exception as exc:
-            # Add failed record to batch failures for retry
-            sequence_number = record.get("kinesis", {}).get("sequenceNumber")
-            if sequence_number:
-                batch_item_failures.append({"itemIdentifier": sequence_number})
-
             LOGGER.exception(
                 {
                     "message": "Failed to process enhanced notes record",
                     "error": str(exc),
-                    "sequence_number": sequence_number,
                     "record": safe_json_for_logging(record),
                 }
             )
+            # Kinesis retries the batch from this record onward
+            batch.fail(record, exc)
 
-    # Return batch item failures for Kinesis to retry
-    return {"batchItemFailures": batch_item_failures}
+    return batch.response()
 
 
 @TRACER.capture_method(capture_response=False)
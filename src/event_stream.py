@@ -23,6 +23,7 @@ from rpp_lib.rpc import get_unit
 from rpp_lib.validation import validate_unit
 from voluptuous import Any, MultipleInvalid
 
+from damages import plan_damage_rpc
 from labor_status import get_labor_status
 from order_approval import get_order_approval
 from order_certification import get_order_certification
@@ -30,23 +31,31 @@ from order_condition import get_order_condition
 from order_detail import get_order_detail
 from order_offering import get_order_offering
 from order_retailrecon import get_order_retailrecon
+from utils.aggregation import deaggregate_records
+from utils.batch import BatchItemFailures
+from utils.envelope import unpack
+from utils.executor import process_by_work_order
+from utils.expression import build_update, name_alias, value_alias
+from utils.metrics import TIMING, add_count, invocation, patch_aws_calls
+from utils.prefetch import call, rpc
+from utils.resources import queue, table
 from validation import valid_new_image
 from vcf_events import get_vcf_events
 from work_credit import get_work_credit
 
 patch_all()
+patch_aws_calls()
 
 RETRY_EXCEPTIONS = ("ProvisionedThroughputExceededException", "ThrottlingException")
 
 IGNORE_EXCEPTIONS = "ConditionalCheckFailedException"
 
 ENV = Env()
-SQS = boto3.resource("sqs")
-QUEUE = SQS.get_queue_by_name(QueueName=ENV("WORKORDER_QUEUE", validate=Any(str)))
-DYNAMO = boto3.resource("dynamodb")
+QUEUE = queue(ENV("WORKORDER_QUEUE", validate=Any(str)))
 KINESIS = boto3.client("kinesis")
-TABLE = DYNAMO.Table(ENV("WORKORDER_TABLE"))
+TABLE = table(ENV("WORKORDER_TABLE"))
 MAX_STREAM_WAIT = ENV("MAX_STREAM_WAIT", 60000)
+COMPACT_BATCH = ENV.bool("COMPACT_BATCH", False)
 
 COLUMN = {
     "approval_id": {"function": get_order_approval, "unit": True, "old_image": True},
@@ -128,7 +137,7 @@ def lookup_unit(new_record):
 
     LOGGER.debug({"unit_id": unit_id})
 
-    unit = get_unit(unit_id)
+    unit = call(get_unit, unit_id)
     if "errorMessage" in unit:
         error_response = {
             "Error": {"Code": unit["errorType"], "Message": unit["errorMessage"]}
@@ -160,40 +169,21 @@ def store_wo_record(new_image, updated, column, unit, table, new_column=False):
 
     key = {"work_order_key": work_order_key, "site_id": new_image["site_id"]}
 
-    update_expression = "set \
-    #sblu = :sblu,\
-    #vin = :vin,\
-    #work_order_number = :work_order_number,\
-    #manheim_account_number = :manheim_account_number,\
-    #company_name = :company_name,\
-    #group_code = :group_code,\
-    #check_in_date = :check_in_date,\
-    #column_updated = :updated"
-
-    condition_expression = "attribute_not_exists(#column_updated) OR \
-    #column_updated < :updated"
-
-    expression_attribute_names = {
-        "#sblu": "sblu",
-        "#vin": "vin",
-        "#work_order_number": "work_order_number",
-        "#manheim_account_number": "manheim_account_number",
-        "#company_name": "company_name",
-        "#group_code": "group_code",
-        "#check_in_date": "check_in_date",
-        "#column_updated": column.get("updated_name", column["name"] + "_updated"),
+    column_updated = column.get("updated_name", column["name"] + "_updated")
+    values = {
+        "sblu": new_image["sblu"],
+        "vin": new_image["vin"],
+        "work_order_number": new_image["work_order_number"],
+        "manheim_account_number": new_image["consignment"]["manheimAccountNumber"],
+        "company_name": unit["contact"]["companyName"],
+        "group_code": unit["account"]["groupCode"],
+        "check_in_date": new_image["consignment"]["checkInDate"],
+        column_updated: updated,
     }
 
-    expression_attribute_values = {
-        ":sblu": new_image["sblu"],
-        ":vin": new_image["vin"],
-        ":work_order_number": new_image["work_order_number"],
-        ":manheim_account_number": new_image["consignment"]["manheimAccountNumber"],
-        ":company_name": unit["contact"]["companyName"],
-        ":group_code": unit["account"]["groupCode"],
-        ":check_in_date": new_image["consignment"]["checkInDate"],
-        ":updated": updated,
-    }
+    condition_expression = "attribute_not_exists({0}) OR {0} < {1}".format(
+        "#" + name_alias(column_updated), value_alias((column_updated,))
+    )
 
     if column is not None and new_column:
 
@@ -202,77 +192,42 @@ def store_wo_record(new_image, updated, column, unit, table, new_column=False):
             if v == "Remove":
                 column["data"].pop(k)
 
-        update_expression += ", #column_name = :column_data"
-        condition_expression = "(attribute_not_exists(#column_updated) OR \
-            #column_updated < :updated) AND \
-            attribute_not_exists(#column_name)"
-
-        expression_attribute_names.update({"#column_name": column["name"]})
-
-        expression_attribute_values.update({":column_data": column["data"]})
-
-    if column is not None and not new_column:
-        update_expression += "," + ",".join(
-            [
-                "#rpp_"
-                + column["name"]
-                + ".#rpp_"
-                + k
-                + " = :"
-                + column["name"]
-                + "_"
-                + k
-                for k in column["data"].keys()
-                if column["data"][k] != "Remove"
-            ]
-        )
-
-        expression_attribute_names.update({"#rpp_" + column["name"]: column["name"]})
-
-        expression_attribute_names.update(
-            {"#rpp_" + k: k for k in column["data"].keys()}
+        values.update({column["name"]: column["data"]})
+        condition_expression = "({}) AND attribute_not_exists(#{})".format(
+            condition_expression, name_alias(column["name"])
         )
 
-        expression_attribute_values.update(
+    if column is not None and not new_column:
+        values.update(
             {
-                ":" + column["name"] + "_" + k: column["data"][k]
-                for k in column["data"].keys()
-                if column["data"][k] != "Remove"
+                (column["name"], k): v
+                for k, v in column["data"].items()
+                if v != "Remove"
             }
         )
 
     remove_fields = [
-        "#rpp_" + column["name"] + ".#rpp_" + k
-        for k in column["data"].keys()
-        if column["data"][k] == "Remove"
+        (column["name"], k) for k, v in column["data"].items() if v == "Remove"
     ]
 
     LOGGER.info({"remove_fields": remove_fields})
     LOGGER.info({"column data": column["data"]})
 
-    if remove_fields:
-        update_expression += " REMOVE " + ",".join(remove_fields)
+    update = build_update(values, remove_fields, condition_expression)
 
     LOGGER.info(
         {
             "message": "store record via the following",
-            "update_expression": update_expression,
+            "update_expression": update["UpdateExpression"],
             "condition_expression": condition_expression,
-            "expression_attribute_names": expression_attribute_names,
-            "expression_attribute_values": expression_attribute_values,
+            "expression_attribute_names": update["ExpressionAttributeNames"],
+            "expression_attribute_values": update["ExpressionAttributeValues"],
         }
     )
 
     response = None
     try:
-        response = table.update_item(
-            Key=key,
-            UpdateExpression=update_expression,
-            ConditionExpression=condition_expression,
-            ExpressionAttributeNames=expression_attribute_names,
-            ExpressionAttributeValues=expression_attribute_values,
-            ReturnValues="UPDATED_NEW",
-        )
+        response = table.update_item(Key=key, ReturnValues="UPDATED_NEW", **update)
     except ClientError as c_err:
         error_code = c_err.response["Error"]["Code"]
         if error_code == "ValidationException":
@@ -285,6 +240,29 @@ def store_wo_record(new_image, updated, column, unit, table, new_column=False):
     return response
 
 
+def plan_rpc(record):
+    """
+    rpc lookups handle_new_image will make for the decoded record
+    """
+    if record["eventName"] == "REMOVE":
+        return []
+
+    new_image = record["dynamodb"]["NewImage"]
+    key = get_column_key(record)
+
+    calls = []
+    if COLUMN.get(key, {}).get("unit"):
+        unit_id = new_image["consignment"]["unit"]["href"].rsplit("/", 1)[-1]
+        calls.append(rpc(get_unit, unit_id))
+
+    if key == "approval_id":
+        calls.extend(
+            plan_damage_rpc(new_image["order"], new_image["work_order_key"])
+        )
+
+    return calls
+
+
 def default_column(new_image):
     """
     default column handler function,
@@ -303,15 +281,17 @@ def handle_new_image(new_image, updated, key, old_image):
     if not COLUMN.get(key, default_column)["old_image"]:
         params.pop("old_image")
 
-    column = COLUMN.get(key, default_column)["function"](**params)
+    with TIMING.stage("transform"):
+        column = COLUMN.get(key, default_column)["function"](**params)
     unit = None
     response = None
 
     if column is not None:
         if COLUMN.get(key, default_column)["unit"]:
             response = lookup_unit(new_image)
-            unit = validate_unit(response)
-            new_record = valid_new_image(new_image)
+            with TIMING.stage("validate"):
+                unit = validate_unit(response)
+                new_record = valid_new_image(new_image)
         else:
             new_record = new_image
         column.get("store_wo_record", store_wo_record)(
@@ -367,6 +347,95 @@ def send_to_queue(record):
     LOGGER.info({"event": message, "record": record, "response": response})
 
 
+def get_column_key(record):
+    """
+    COLUMN key of a decoded stream record
+    """
+    key = "".join(record["dynamodb"]["Keys"].keys())
+    # need to use the table name for tables that have adjacency matrix structure
+    if "pksk" in key:
+        key = record["tableName"]
+
+    return key
+
+
+def get_updated(record):
+    """
+    timestamp the column is conditionally written with
+    """
+    try:
+        if record.get("dynamodb", {}).get("NewImage", {}).get("retrigger_flag", False):
+            updated = record["dynamodb"]["NewImage"]["updated"]
+            LOGGER.debug({"message": "using updated timestamp"})
+        else:
+            updated = (
+                parser.parse(record["dynamodb"]["NewImage"]["order"]["updatedOn"])
+                .replace(tzinfo=timezone.utc)
+                .timestamp()
+            )
+            LOGGER.debug({"message": "using updatedOn datetime converted to timestamp"})
+    except (KeyError, ValueError):
+        LOGGER.debug({"message": "using approximate creation datetime"})
+        updated = record["dynamodb"]["ApproximateCreationDateTime"]
+
+    return updated
+
+
+def get_compaction_key(record):
+    """
+    (column, source item) the decoded record writes, None when it can't be compacted.
+    Columns built from the old image depend on every intermediate image and are
+    never compacted.
+    """
+    if record["eventName"] == "REMOVE":
+        return None
+
+    key = get_column_key(record)
+    if COLUMN.get(key, {}).get("old_image", True):
+        return None
+
+    return key, json.dumps(record["dynamodb"]["Keys"], sort_keys=True, default=str)
+
+
+def compact_group(group):
+    """
+    keep the newest image of every (column, source item) of a work order group
+    """
+    newest = {}
+    for index, (_, record) in enumerate(group):
+        compaction_key = get_compaction_key(record)
+        if compaction_key is None:
+            continue
+
+        updated = Decimal(str(get_updated(record)))
+        # on a tie the conditional write keeps the first image, so does compaction
+        if compaction_key not in newest or updated > newest[compaction_key][1]:
+            newest[compaction_key] = (index, updated)
+
+    kept = {index for index, _ in newest.values()}
+
+    return [
+        (raw_record, record)
+        for index, (raw_record, record) in enumerate(group)
+        if index in kept or get_compaction_key(record) is None
+    ]
+
+
+def compact_groups(groups):
+    """
+    Drop the images of a batch that are superseded by a newer image of the same
+    column and source item. Their writes would be rejected by the column_updated
+    condition anyway, compaction saves the write requests.
+    """
+    compacted = [compact_group(group) for group in groups]
+    dropped = sum(map(len, groups)) - sum(map(len, compacted))
+
+    LOGGER.info({"message": "compacted batch", "dropped": dropped})
+    add_count("CompactedRecords", dropped, function="event_stream")
+
+    return [group for group in compacted if group]
+
+
 def process_record(record):
     new_image = None
     try:
@@ -376,33 +445,8 @@ def process_record(record):
             new_image = record["dynamodb"]["NewImage"]
             old_image = record["dynamodb"].get("OldImage", {})
 
-            key = "".join(record["dynamodb"]["Keys"].keys())
-            # need to use the table name for tables that have adjacency matrix structure
-            if "pksk" in key:
-                key = record["tableName"]
-
-            try:
-                if (
-                    record.get("dynamodb", {})
-                    .get("NewImage", {})
-                    .get("retrigger_flag", False)
-                ):
-                    updated = record["dynamodb"]["NewImage"]["updated"]
-                    LOGGER.debug({"message": "using updated timestamp"})
-                else:
-                    updated = (
-                        parser.parse(
-                            record["dynamodb"]["NewImage"]["order"]["updatedOn"]
-                        )
-                        .replace(tzinfo=timezone.utc)
-                        .timestamp()
-                    )
-                    LOGGER.debug(
-                        {"message": "using updatedOn datetime converted to timestamp"}
-                    )
-            except (KeyError, ValueError):
-                LOGGER.debug({"message": "using approximate creation datetime"})
-                updated = record["dynamodb"]["ApproximateCreationDateTime"]
+            key = get_column_key(record)
+            updated = get_updated(record)
 
             LOGGER.debug({"keys": key})
             LOGGER.debug({"updated_timestamp": updated})
@@ -528,24 +572,24 @@ def process_stream(event, _):
 
     LOGGER.debug({"event": event})
     t_loop = monotonic()
-    t_process = 0
-
-    decoded_records = [decode_record(record) for record in event["Records"] if record]
 
-    for record in decoded_records:
-        try:
-            t_process = monotonic()
-            process_record(record)
-            t_process += monotonic() - t_process
+    batch = BatchItemFailures(deaggregate_records(event["Records"]))
 
-        except ClientError as c_err:
-            handle_client_error(c_err, record, "aws:kinesis")
+    # retry errors are re-raised by process_record and fail the batch from that record
+    with invocation("event_stream"):
+        process_by_work_order(
+            batch,
+            decode_record,
+            process_record,
+            plan=plan_rpc,
+            compact=compact_groups if COMPACT_BATCH else None,
+        )
 
     t_loop = monotonic() - t_loop
 
-    LOGGER.info(
-        {"count": len(event["Records"]), "loop_time": t_loop, "process_time": t_process}
-    )
+    LOGGER.info({"count": len(event["Records"]), "loop_time": t_loop})
+
+    return batch.response()
 
 
 def decode_record(record):
@@ -556,7 +600,8 @@ def decode_record(record):
             json.dumps(
                 json_util.loads(
                     json.loads(
-                        base64.b64decode(record["kinesis"]["data"]), parse_float=Decimal
+                        unpack(base64.b64decode(record["kinesis"]["data"])),
+                        parse_float=Decimal,
                     )
                 )
             ),
@@ -2,11 +2,8 @@
 processor for approval stream
 """
 import json
-
-# import zlib
 import sys
 import time
-import uuid
 from decimal import Decimal
 
 import boto3
@@ -24,9 +21,16 @@ from voluptuous import Any
 
 from event_stream import lookup_unit
 from order_offering import get_order_offering
+from utils import partition
+from utils.aggregation import MAX_SIZE, aggregate_entries
+from utils.envelope import CODECS, pack
+from utils.metrics import patch_aws_calls, timed
+from utils.prefetch import call, prefetch, rpc
+from utils.trim import trim_record
 from validation import valid_new_image
 
 patch_all()
+patch_aws_calls()
 
 ENV = Env()
 DYNAMO = boto3.resource("dynamodb")
@@ -36,36 +40,39 @@ STREAM = ENV("STREAM", validate=Any(str))
 CHUNK_SIZE = int(ENV("CHUNK_SIZE", validate=Any(str)))
 RETRY_EXCEPTIONS = ("ProvisionedThroughputExceededException", "ThrottlingException")
 IGNORE_EXCEPTIONS = "ConditionalCheckFailedException"
+# records are written as json until every consumer of STREAM reads the envelope
+RECORD_ENVELOPE = ENV.bool("RECORD_ENVELOPE", False)
+RECORD_COMPRESSION = ENV("RECORD_COMPRESSION", "zlib", validate=Any(*CODECS))
+RECORD_COMPRESSION_THRESHOLD = ENV.int("RECORD_COMPRESSION_THRESHOLD", 1024)
+# kpl aggregation of the records of a work order, every consumer of STREAM has to
+# deaggregate first
+RECORD_AGGREGATION = ENV.bool("RECORD_AGGREGATION", False)
+RECORD_AGGREGATION_MAX_SIZE = ENV.int("RECORD_AGGREGATION_MAX_SIZE", MAX_SIZE)
+# bytes of data and partition keys a put_records call takes
+PUT_RECORDS_MAX_SIZE = 5 * 1024 * 1024
 
 
 def get_partition_key(record):
-    """ get stream partition key """
-    try:
-        partition_key = record["dynamodb"]["NewImage"]["work_order_key"]["S"]
-    except KeyError:
-        try:
-            partition_key = record["dynamodb"]["OldImage"]["work_order_key"]["S"]
-        except KeyError:
-            partition_key = str(uuid.uuid4())
-
-    return partition_key
+    """ get stream partition key, the work_order_key of the record """
+    return partition.get_partition_key(record, "work_order_key")
 
 
 def prep_data(record):
-    """ trim and compress data """
+    """ json of a record trimmed to TRIM_PROFILE, in a compressed envelope with
+    RECORD_ENVELOPE """
 
     t_compress = time.monotonic()
-    data = json.dumps(record).encode("utf-8")
+    data = json.dumps(trim_record(record)).encode("utf-8")
+    size = len(data)
+    if RECORD_ENVELOPE:
+        data = pack(data, RECORD_COMPRESSION, RECORD_COMPRESSION_THRESHOLD)
     t_compress = time.monotonic() - t_compress
 
     LOGGER.debug(
         {
-            "message": "Data trimmed and compressed",
-            "record": record,
-            "size of origional record ": sys.getsizeof(
-                json.dumps(record).encode("utf-8")
-            ),
-            "size of record compressed": sys.getsizeof(data),
+            "message": "Data compressed",
+            "size of record": size,
+            "size of data": len(data),
             "compression time": t_compress,
         }
     )
@@ -87,7 +94,7 @@ def check_offering(record, work_order_key):
     LOGGER.debug(record)
     offering = {}
 
-    offering = get_offering(None, work_order_key)
+    offering = call(get_offering, None, work_order_key)
     LOGGER.debug(offering)
 
     if offering:
@@ -119,26 +126,41 @@ def check_offering(record, work_order_key):
             LOGGER.error({"reason": str(exc), "exception": exc, "record": max_record})
 
 
+def plan_offering(record):
+    """ offering lookup check_offering will make for an inserted record """
+    if record["eventName"] != "INSERT":
+        return []
+
+    work_order_key = record["dynamodb"]["NewImage"]["work_order_key"]["S"]
+
+    return [rpc(get_offering, None, work_order_key)]
+
+
+@timed("kinesis")
 def process_stream(event, _):
     """ handle dynamodb stream events """
 
     event_records = event["Records"]
     records = []
 
-    for record in event_records:
-        if record["eventName"] == "INSERT":
-            work_order_key = get_partition_key(record)
-            check_offering(record, work_order_key)
+    with prefetch(event_records, plan_offering):
+        for record in event_records:
+            if record["eventName"] == "INSERT":
+                work_order_key = get_partition_key(record)
+                check_offering(record, work_order_key)
 
     records = [
-        {"Data": prep_data(record), "PartitionKey": get_partition_key(record)}
+        partition.with_hash_key(
+            {"Data": prep_data(record), "PartitionKey": get_partition_key(record)},
+            record,
+        )
         for record in event_records
     ]
+    partition.report_distribution(records, STREAM)
+    if RECORD_AGGREGATION:
+        records = aggregate_entries(records, RECORD_AGGREGATION_MAX_SIZE)
 
-    chunks = [
-        records[i * CHUNK_SIZE : (i + 1) * CHUNK_SIZE]  # noqa E203
-        for i in range((len(records) + CHUNK_SIZE - 1) // CHUNK_SIZE)
-    ]
+    chunks = get_chunks(records)
 
     for chunk in chunks:
         try:
@@ -170,6 +192,26 @@ def process_stream(event, _):
         LOGGER.info(response)
 
 
+def get_chunks(records):
+    """ records in chunks of CHUNK_SIZE records and PUT_RECORDS_MAX_SIZE bytes """
+    chunks = []
+    chunk = []
+    size = 0
+    for record in records:
+        record_size = len(record["Data"]) + len(record["PartitionKey"].encode("utf-8"))
+        full = len(chunk) == CHUNK_SIZE or size + record_size > PUT_RECORDS_MAX_SIZE
+        if chunk and full:
+            chunks.append(chunk)
+            chunk = []
+            size = 0
+        chunk.append(record)
+        size += record_size
+    if chunk:
+        chunks.append(chunk)
+
+    return chunks
+
+
 def get_failed_records(response, chunk):
     """Filters error records from Kinesis put_records response.
     Arguments:
@@ -14,6 +14,7 @@ from environs import Env
 
 from validation import valid_rpp_notes_item
 from utils.dynamodb import update
+from utils.batch import BatchItemFailures
 from utils.common import (
     get_updated_hr,
     get_updated_source_hr,
@@ -37,30 +38,35 @@ def handler(event, _):
     """
     LOGGER.debug({"event": event})
 
-    for record in event["Records"]:
-        try:
-            kinesis_event = json.loads(
-                base64.b64decode(record["kinesis"]["data"]), parse_float=Decimal
-            )
-
-            dynamodb_event = json.loads(
-                json.dumps(json_util.loads(kinesis_event)), parse_float=Decimal
-            )
-
-            process_record(dynamodb_event)
-        except UnicodeDecodeError as exc:
-            message = "Invalid stream data, ignoring"
-            reason = str(exc)
-            response = "N/A"
-
-            LOGGER.warning(
-                {
-                    "event": message,
-                    "reason": reason,
-                    "record": record,
-                    "response": response,
-                }
-            )
+    batch = BatchItemFailures(event["Records"])
+
+    for record in batch:
+        with batch.guard(record):
+            try:
+                kinesis_event = json.loads(
+                    base64.b64decode(record["kinesis"]["data"]), parse_float=Decimal
+                )
+
+                dynamodb_event = json.loads(
+                    json.dumps(json_util.loads(kinesis_event)), parse_float=Decimal
+                )
+
+                process_record(dynamodb_event)
+            except UnicodeDecodeError as exc:
+                message = "Invalid stream data, ignoring"
+                reason = str(exc)
+                response = "N/A"
+
+                LOGGER.warning(
+                    {
+                        "event": message,
+                        "reason": reason,
+                        "record": record,
+                        "response": response,
+                    }
+                )
+
+    return batch.response()
 
 
 @TRACER.capture_method(capture_response=False)
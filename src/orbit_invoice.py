@@ -7,7 +7,7 @@ from codeguru_profiler_agent import with_lambda_profiler
 from dynamodb.store import put_work_order
 from rpp_lib.logs import LOGGER
 
-from utils.decode_record import decode_record
+from utils.decode_record import decode_records
 from utils.sqs import send_message
 
 patch_all()
@@ -24,7 +24,7 @@ TABLE = DYNAMO.Table(os.environ["WORKORDER_TABLE"])
 def handler(event, _):
     LOGGER.info({"DynamoDB event": event})
 
-    decoded_records = [decode_record(record) for record in event["Records"] if record]
+    decoded_records = decode_records(event["Records"])
 
     LOGGER.debug({"decoded messages": decoded_records})
 
@@ -10,17 +10,14 @@ from rpp_lib.logs import LOGGER
 from voluptuous import Any
 from environs import Env
 
-import boto3
 from boto3.dynamodb.conditions import Key
 from utils.dynamodb import update
+from utils.resources import table
 
 ENV = Env()
 
 WORKORDER_AM_TABLE = ENV("WORKORDER_AM_TABLE")
-DYNAMO = boto3.resource("dynamodb")
-RPP_RECON_WORK_ORDER_TABLE = DYNAMO.Table(
-    name=ENV("WORKORDER_AM_TABLE", validate=Any(str))
-)
+RPP_RECON_WORK_ORDER_TABLE = table(ENV("WORKORDER_AM_TABLE", validate=Any(str)))
 
 patch_all()
 
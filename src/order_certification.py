@@ -3,7 +3,6 @@
 """
 import copy
 from decimal import Decimal
-import boto3
 from botocore.exceptions import ClientError
 from environs import Env
 from voluptuous import MultipleInvalid
@@ -14,10 +13,10 @@ from validation import (
     valid_certification_updated,
     valid_certification_canceled
 )
+from utils.resources import table
 
 ENV = Env()
-DYNAMO = boto3.resource('dynamodb')
-CATEGORY_TABLE = DYNAMO.Table(name=ENV('CATEGORY_TABLE', validate=Any(str)))
+CATEGORY_TABLE = table(ENV('CATEGORY_TABLE', validate=Any(str)))
 
 
 def build_order(new_record):
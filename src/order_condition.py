@@ -2,7 +2,6 @@
     order condition functions
 """
 
-import boto3
 import json
 import time
 import stringcase
@@ -17,11 +16,11 @@ from validation import valid_condition_completed, validate_order_condition_schem
 from validation import valid_condition_updated
 from dynamodb.store import put_work_order, get_work_order, DynamoItemNotFound
 from utils.constants import EVENT_SOURCE_SMART_INSPECT, EVENT_SOURCE_AUCTION_ECR, CAPTURE_COMPLETE
+from utils.resources import table
 from json.decoder import JSONDecodeError
 
 ENV = Env()
-DYNAMO = boto3.resource("dynamodb")
-CATEGORY_TABLE = DYNAMO.Table(name=ENV("CATEGORY_TABLE", validate=Any(str)))
+CATEGORY_TABLE = table(ENV("CATEGORY_TABLE", validate=Any(str)))
 
 
 def build_order(new_record):
@@ -113,6 +112,10 @@ def process_condition(record, wo_key, key_event, entity_type):
         {stringcase.snakecase(k): v for k, v in record["order"].items()}
     )
     general_record_data.update({"key_src": key_event})
+    if vin:
+        # key of index_conditions_vin, the conditions of a vin newest first
+        general_record_data["conditions_vin"] = vin
+        general_record_data["conditions_updated"] = general_record_data["updated"]
 
     put_work_order(wo_key, entity_type, general_record_data)
     LOGGER.debug({"tires": tires})
@@ -1,7 +1,6 @@
 """
    order detail functions
 """
-import boto3
 from environs import Env
 from voluptuous import MultipleInvalid
 from voluptuous import Any
@@ -10,11 +9,11 @@ from validation import valid_detail_completed
 from validation import valid_detail_requested
 from validation import valid_detail_declined
 from validation import valid_detail_canceled
+from utils.resources import table
 
 
 ENV = Env()
-DYNAMO = boto3.resource('dynamodb')
-CATEGORY_TABLE = DYNAMO.Table(name=ENV('CATEGORY_TABLE', validate=Any(str)))
+CATEGORY_TABLE = table(ENV('CATEGORY_TABLE', validate=Any(str)))
 
 
 def get_category_data(key):
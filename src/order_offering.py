@@ -2,7 +2,6 @@
     order offering functions
 """
 
-import boto3
 from botocore.exceptions import ClientError
 from environs import Env
 from rpp_lib.logs import LOGGER
@@ -22,11 +21,11 @@ from validation import (
 import json
 from rpp_lib.rpc import get_pfvehicle
 from utils.common import get_vin
+from utils.resources import table
 
 ENV = Env()
-DYNAMO = boto3.resource("dynamodb")
-SALE_EVENT_TABLE = DYNAMO.Table(name=ENV("SALE_EVENT_TABLE", validate=Any(str)))
-RECON_WORK_ORDER_TABLE = DYNAMO.Table(name=ENV("WORKORDER_AM_TABLE", validate=Any(str)))
+SALE_EVENT_TABLE = table(ENV("SALE_EVENT_TABLE", validate=Any(str)))
+RECON_WORK_ORDER_TABLE = table(ENV("WORKORDER_AM_TABLE", validate=Any(str)))
 GENERIC_SALE_EVENT_GSI = "auctionId-year-saleNumber-computerLane-index"
 SALE_DATE_APPROXIMATE_GSI = "auctionId-saleYear-saleNumber-index"
 
@@ -2,7 +2,6 @@
     order retailrecon functions
 """
 
-import boto3
 import json
 import time
 from decimal import Decimal
@@ -17,11 +16,11 @@ from validation import valid_retailrecon_updated
 from dynamodb.store import put_work_order
 from rpp_lib.rpc import get_pfvehicle
 from utils.common import get_vin
+from utils.resources import table
 from dynamodb.store import delete_record, get_all_by_pk
 
 ENV = Env()
-DYNAMO = boto3.resource('dynamodb')
-CATEGORY_TABLE = DYNAMO.Table(name=ENV('CATEGORY_TABLE', validate=Any(str)))
+CATEGORY_TABLE = table(ENV('CATEGORY_TABLE', validate=Any(str)))
 
 
 def build_order(new_record):
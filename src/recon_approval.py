@@ -15,6 +15,7 @@ from rpp_lib.logs import LOGGER
 from voluptuous import MultipleInvalid
 
 from utils import sqs
+from utils.batch import BatchItemFailures
 from utils.common import get_updated_hr, get_utc_now
 from dynamodb.store import put_work_order
 from validation import valid_recon_approval, valid_recon_approval_item
@@ -41,10 +42,14 @@ def process_recon_approval(event, _):
     LOGGER.info({"event": event})
 
     if "Records" in event.keys():
-        for record in event["Records"]:
-            process_record(record)
-    else:
-        process_record(event)
+        batch = BatchItemFailures(event["Records"])
+        for record in batch:
+            with batch.guard(record):
+                process_record(record)
+
+        return batch.response()
+
+    process_record(event)
 
 
 def process_record(record):
@@ -13,7 +13,9 @@ from rpp_lib.logs import LOGGER
 from voluptuous import MultipleInvalid
 from environs import Env
 from utils import sqs
+from utils.batch import BatchItemFailures
 from utils.dynamodb import update, remove_item
+from utils.metrics import patch_aws_calls, timed
 from dynamodb.store import get_work_order
 from validator.recon_labor_ingest import validate_labor_ingest_event
 from datetime import datetime, timezone
@@ -31,90 +33,97 @@ RETRY_EXCEPTIONS = (
 )
 
 patch_all()
+patch_aws_calls()
 
 
 @xray_recorder.capture()
+@timed("recon_labor_ingest")
 def process_stream(event, _):
     """
     Processing for rpp-labor-ingest kinesis stream events
     """
     LOGGER.info({"event": event})
 
-    for record in event["Records"]:
-        try:
-            kinesis_event = json.loads(
-                base64.b64decode(record["kinesis"]["data"]),
-                parse_float=Decimal,
-            )
-
-            dynamodb_event = json.loads(
-                json.dumps(json_util.loads(kinesis_event)), parse_float=Decimal
-            )
+    batch = BatchItemFailures(event["Records"])
 
-            if dynamodb_event.get("eventName") in ["INSERT", "MODIFY"]:
-                process_record(
-                    dynamodb_event.get("dynamodb", {}).get("NewImage"),
-                    dynamodb_event.get("dynamodb", {}).get(
-                        "ApproximateCreationDateTime"
-                    ),
+    for record in batch:
+        with batch.guard(record):
+            try:
+                kinesis_event = json.loads(
+                    base64.b64decode(record["kinesis"]["data"]),
+                    parse_float=Decimal,
                 )
-            else:
-                LOGGER.debug(f"Removing item: {dynamodb_event}")
-                remove_item(
-                    table_name=RPP_RECON_WORK_ORDER_TABLE,
-                    key={
-                        "pk": dynamodb_event.get("dynamodb", {})
-                        .get("Keys")
-                        .get("pk"),
-                        "sk": dynamodb_event.get("dynamodb", {})
-                        .get("Keys")
-                        .get("sk"),
-                    },
+
+                dynamodb_event = json.loads(
+                    json.dumps(json_util.loads(kinesis_event)), parse_float=Decimal
                 )
 
-        except UnicodeDecodeError as exc:
-            message = "Invalid stream data, ignoring"
-            reason = str(exc)
-            response = "N/A"
+                if dynamodb_event.get("eventName") in ["INSERT", "MODIFY"]:
+                    process_record(
+                        dynamodb_event.get("dynamodb", {}).get("NewImage"),
+                        dynamodb_event.get("dynamodb", {}).get(
+                            "ApproximateCreationDateTime"
+                        ),
+                    )
+                else:
+                    LOGGER.debug(f"Removing item: {dynamodb_event}")
+                    remove_item(
+                        table_name=RPP_RECON_WORK_ORDER_TABLE,
+                        key={
+                            "pk": dynamodb_event.get("dynamodb", {})
+                            .get("Keys")
+                            .get("pk"),
+                            "sk": dynamodb_event.get("dynamodb", {})
+                            .get("Keys")
+                            .get("sk"),
+                        },
+                    )
+
+            except UnicodeDecodeError as exc:
+                message = "Invalid stream data, ignoring"
+                reason = str(exc)
+                response = "N/A"
 
-            LOGGER.exception(
-                {
-                    "event": message,
-                    "reason": reason,
-                    "record": record,
-                    "response": response,
-                }
-            )
-
-        except ClientError as client_error:
-            error_code = client_error.response["Error"]["Code"]
-            if error_code in [IGNORE_EXCEPTIONS]:
-                LOGGER.warning(
-                    {
-                        "message": "Client error processing record",
-                        "exception_name": type(client_error),
-                        "exception": str(client_error),
-                    }
-                )
-            else:
                 LOGGER.exception(
                     {
-                        "message": "Client error processing record",
-                        "exception_name": type(client_error),
-                        "exception": str(client_error),
+                        "event": message,
+                        "reason": reason,
+                        "record": record,
+                        "response": response,
                     }
                 )
-                raise
-        except Exception as err:
-            record.update({"reason": str(err)})
-            message = {
-                "event": "Unknown error",
-                "reason": str(err),
-                "record": record,
-            }
 
-            LOGGER.exception(message)
-            sqs.send_message(DL_QUEUE, record)
+            except ClientError as client_error:
+                error_code = client_error.response["Error"]["Code"]
+                if error_code in [IGNORE_EXCEPTIONS]:
+                    LOGGER.warning(
+                        {
+                            "message": "Client error processing record",
+                            "exception_name": type(client_error),
+                            "exception": str(client_error),
+                        }
+                    )
+                else:
+                    LOGGER.exception(
+                        {
+                            "message": "Client error processing record",
+                            "exception_name": type(client_error),
+                            "exception": str(client_error),
+                        }
+                    )
+                    raise
+            except Exception as err:
+                record.update({"reason": str(err)})
+                message = {
+                    "event": "Unknown error",
+                    "reason": str(err),
+                    "record": record,
+                }
+
+                LOGGER.exception(message)
+                sqs.send_message(DL_QUEUE, record)
+
+    return batch.response()
 
 
 def process_record(record, approx_creation_time):
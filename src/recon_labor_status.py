@@ -1,8 +1,8 @@
 
+from contextlib import contextmanager
 from decimal import Decimal
 from time import time
 
-import boto3
 from rpp_lib.rpc import get_approval, get_labor_status
 from voluptuous import Any
 from voluptuous.error import MultipleInvalid
@@ -10,7 +10,12 @@ from validator.recon_work_order import validate_process_labor_status, valid_dama
 from environs import Env
 from botocore.exceptions import ClientError
 from rpp_lib.logs import LOGGER
-from recon_work_order import find as get_work_order
+from recon_work_order import find_work_order as get_work_order
+from dynamodb.store import with_damage_keys
+from utils.dynamodb import batch_get_items
+from utils.expression import build_update
+from utils.prefetch import call
+from utils.resources import table
 from aws_xray_sdk.core import xray_recorder
 from aws_xray_sdk.core import patch_all
 
@@ -18,9 +23,11 @@ patch_all()
 
 ENV = Env()
 LABOR_TYPES = ("REPAIR", "PAINT", "PART")
-DYNAMO = boto3.resource("dynamodb")
 WORK_ORDER_TABLE_NAME = ENV("WORKORDER_AM_TABLE", validate=Any(str))
-WO_TABLE = DYNAMO.Table(WORK_ORDER_TABLE_NAME)
+WO_TABLE = table(WORK_ORDER_TABLE_NAME)
+
+# damages preloaded for the labor status events being processed, by (pk, sk)
+DAMAGES = {}
 
 
 @xray_recorder.capture("process_labor_status")
@@ -31,40 +38,16 @@ def process_labor_status(record):
         work_order_key = labor_status.pop("pk")
         labor_status_sk = labor_status.pop("sk")
         item_code, sub_item_code, damage_code, labor_type = labor_status_sk.split("#")
-        action_code = labor_status.pop("action_code", None)
-        severity_code = labor_status.pop("severity_code", None)
-        if not severity_code:
-            approval_info = get_action_severity_code(work_order_key, item_code, sub_item_code, damage_code)
-            severity_code = approval_info.get("severityCode", "")
-            action_code = approval_info.get("actionCode", "")
-
-        idsa = f"damage:{item_code}"
-        isdsa = f"damage:{item_code}#{sub_item_code}"
-
-        if damage_code:
-            idsa += f"#{damage_code}"
-            isdsa += f"#{damage_code}"
-
-        if severity_code:
-            idsa += f"#{severity_code}"
-            isdsa += f"#{severity_code}"
-
-        if action_code:
-            idsa += f"#{action_code}"
-            isdsa += f"#{action_code}"
-
-        isdsa_record = get_work_order({
-            "key": {
-                "pk": f"workorder:{work_order_key}",
-                "sk": isdsa
-            }
-        }, None)
-        idsa_record = get_work_order({
-            "key": {
-                "pk": f"workorder:{work_order_key}",
-                "sk": idsa
-            }
-        }, None)
+        severity_code, action_code = get_severity_action_codes(
+            work_order_key,
+            labor_status_sk,
+            labor_status.pop("severity_code", None),
+            labor_status.pop("action_code", None),
+        )
+        isdsa, idsa = get_damage_sks(labor_status_sk, severity_code, action_code)
+
+        isdsa_record = find_damage(work_order_key, isdsa)
+        idsa_record = find_damage(work_order_key, idsa)
 
         if isdsa_record:
             sk = isdsa
@@ -135,15 +118,13 @@ def process_labor_status(record):
                 remove_statuses.append("charge_p_status")
                 damage_record.pop("charge_p_status", None)
 
-            if remove_statuses:
-                delete_attribute({
-                    "pk": f"workorder:{work_order_key}",
-                    "sk": sk
-                }, remove_statuses)
             damage_record.pop("pk")
             damage_record.pop("sk")
             get_overall_damage_status(damage_record)
-            update_work_order(work_order_key, sk, damage_record, labor_type)
+            update_work_order(
+                work_order_key, sk, damage_record, labor_type, remove_statuses
+            )
+            remember_damage(work_order_key, sk, damage_record)
         else:
             LOGGER.warning({
                 "Message": f"No record found for {sk} combination, skipping update."
@@ -174,9 +155,141 @@ def process_labor_status(record):
         })
 
 
-def update_work_order(work_order_key, sk, damage_record, labor_type):
+def get_severity_action_codes(
+    work_order_key, labor_status_sk, severity_code, action_code
+):
+    """
+    severity and action codes of the labor status damage, from the order approval
+    when the labor status doesn't carry them
+    """
+    if not severity_code:
+        item_code, sub_item_code, damage_code, _ = labor_status_sk.split("#")
+        approval_info = get_action_severity_code(
+            work_order_key, item_code, sub_item_code, damage_code
+        )
+        severity_code = approval_info.get("severityCode", "")
+        action_code = approval_info.get("actionCode", "")
+
+    return severity_code, action_code
+
+
+def get_damage_sks(labor_status_sk, severity_code, action_code):
+    """
+    isdsa and idsa sort keys of the damage a labor status belongs to
+    """
+    item_code, sub_item_code, damage_code, _ = labor_status_sk.split("#")
+
+    idsa = f"damage:{item_code}"
+    isdsa = f"damage:{item_code}#{sub_item_code}"
+
+    if damage_code:
+        idsa += f"#{damage_code}"
+        isdsa += f"#{damage_code}"
+
+    if severity_code:
+        idsa += f"#{severity_code}"
+        isdsa += f"#{severity_code}"
+
+    if action_code:
+        idsa += f"#{action_code}"
+        isdsa += f"#{action_code}"
+
+    return isdsa, idsa
+
+
+def get_damage_keys(record):
+    """
+    keys of the isdsa and idsa damages a labor status record may update
+    """
+    labor_status = validate_process_labor_status(record)
+    work_order_key = labor_status["pk"]
+    severity_code, action_code = get_severity_action_codes(
+        work_order_key,
+        labor_status["sk"],
+        labor_status.get("severity_code"),
+        labor_status.get("action_code"),
+    )
+
+    return [
+        (f"workorder:{work_order_key}", sk)
+        for sk in get_damage_sks(labor_status["sk"], severity_code, action_code)
+    ]
+
+
+@contextmanager
+def preload_damages(records):
+    """
+    Read the damages of every labor status record with BatchGetItem, each key once,
+    find_damage serves them while the block runs. Records of a work order must be
+    processed one after the other for the damages they write to be seen by the next.
+    """
+    keys = set()
+    for record in records:
+        try:
+            keys.update(get_damage_keys(record))
+        except Exception as exc:
+            # read one at a time, processing reports what is wrong with the record
+            LOGGER.debug({"message": "unable to preload damages", "reason": str(exc)})
+
+    try:
+        if keys:
+            items, unprocessed = batch_get_items(
+                WORK_ORDER_TABLE_NAME, [{"pk": pk, "sk": sk} for pk, sk in keys]
+            )
+            # find_damage reads the unprocessed ones itself
+            keys -= {(key["pk"], key["sk"]) for key in unprocessed}
+            DAMAGES.update(dict.fromkeys(keys))
+            DAMAGES.update({(item["pk"], item["sk"]): item for item in items})
+    except ClientError as c_err:
+        LOGGER.warning({"message": "unable to preload damages", "reason": str(c_err)})
+
+    try:
+        yield
+    finally:
+        DAMAGES.clear()
+
+
+def find_damage(work_order_key, sk):
+    """
+    damage record of the work order, None when there is none
+    """
+    pk = f"workorder:{work_order_key}"
+
+    if (pk, sk) not in DAMAGES:
+        return get_work_order({"key": {"pk": pk, "sk": sk}}, None)
+
+    damage = DAMAGES[(pk, sk)]
+
+    return dict(damage) if damage else None
+
+
+def remember_damage(work_order_key, sk, damage_record):
+    """
+    keep a preloaded damage in step with what was written over it
+    """
+    pk = f"workorder:{work_order_key}"
+
+    if DAMAGES.get((pk, sk)):
+        DAMAGES[(pk, sk)] = {**damage_record, "pk": pk, "sk": sk}
+
+
+def forget_damages(work_order_key):
+    """
+    drop the preloaded damages of a work order that is written by another path
+    """
+    pk = f"workorder:{work_order_key}"
+
+    for key in list(DAMAGES):
+        if key[0] == pk:
+            DAMAGES.pop(key, None)
+
+
+def update_work_order(
+    work_order_key, sk, damage_record, labor_type, remove_attributes=()
+):
     """
-            Update work-order row info for a given workorder
+            Update work-order row info for a given workorder, removing remove_attributes
+            in the same conditional write
         """
 
     LOGGER.debug({"workorder": work_order_key, "sk": sk})
@@ -185,17 +298,6 @@ def update_work_order(work_order_key, sk, damage_record, labor_type):
         "sk": sk
     }
 
-    attribute_names = {}
-    attribute_values = {}
-
-    update_expression = "set "
-    update_expression += ",".join(
-        ["#" + k + " = :" + k for k in damage_record.keys()]
-    )
-
-    attribute_names.update({"#" + k: k for k in damage_record.keys()})
-
-    attribute_values.update({":" + k: damage_record[k] for k in damage_record.keys()})
     if labor_type == "REPAIR":
         condition_expression = "attribute_not_exists(#repair_updated) OR #repair_updated <= :updated"
     if labor_type == "PART":
@@ -203,56 +305,28 @@ def update_work_order(work_order_key, sk, damage_record, labor_type):
     if labor_type == "PAINT":
         condition_expression = "attribute_not_exists(#paint_updated) OR #paint_updated <= :updated"
 
+    update = build_update(with_damage_keys(damage_record), remove_attributes, condition_expression)
+
     LOGGER.info({
         "key": key,
-        "update_expression": update_expression,
+        "update_expression": update["UpdateExpression"],
         "condition_expression": condition_expression,
-        "attribute_names": attribute_names,
-        "attribute_values": attribute_values
+        "attribute_names": update["ExpressionAttributeNames"],
+        "attribute_values": update["ExpressionAttributeValues"]
     })
 
-    response = WO_TABLE.update_item(
-        Key=key,
-        UpdateExpression=update_expression,
-        ConditionExpression=condition_expression,
-        ExpressionAttributeNames=attribute_names,
-        ExpressionAttributeValues=attribute_values,
-        ReturnValues="UPDATED_NEW",
-    )
+    response = WO_TABLE.update_item(Key=key, ReturnValues="UPDATED_NEW", **update)
 
     return response['Attributes']
 
 
-def delete_attribute(key, attributes):
-    update_expression = "REMOVE "
-    update_expression += ", ".join(attributes)
-
-    LOGGER.info(
-        {
-            "message": "Removing attribute from record",
-            "key": key,
-            "update_expression": update_expression,
-        }
-    )
-
-    response = WO_TABLE.update_item(
-        Key=key,
-        UpdateExpression=update_expression,
-        ReturnValues="UPDATED_NEW",
-    )
-
-    LOGGER.debug({"response": response})
-
-    return response
-
-
 def get_action_severity_code(work_order_key, item_code, sub_item_code, damage_code):
     """Identifies the action code/severity code of the damage from order approval record.
 
     Returns:
         A dict contain actionCode and severityCode from rpp-order-approval
     """
-    approval_response = get_approval(work_order_key=work_order_key)
+    approval_response = call(get_approval, work_order_key=work_order_key)
     if approval_response:
         approval = approval_response[0]
         LOGGER.debug({"approval response": approval})
@@ -272,12 +346,14 @@ def get_action_severity_code(work_order_key, item_code, sub_item_code, damage_co
     return {"severityCode": "", "actionCode": ""}
 
 
-def update_labor_status(labor, work_order_key, sk, damage):
+def update_labor_status(labor, work_order_key, sk, damage, remove_statuses=None):
     """
-    Function to update damage information with recon-labor-status information
+    Function to update damage information with recon-labor-status information,
+    charge statuses the labor status doesn't have are added to remove_statuses
+    for the caller to remove in its damage write
     """
 
-    labor_status = get_labor_status(work_order_key, sk)
+    labor_status = call(get_labor_status, work_order_key, sk)
     LOGGER.debug({"labor_status": labor_status})
     labor_type = labor.get("damage_labor_type")
     try:
@@ -292,7 +368,8 @@ def update_labor_status(labor, work_order_key, sk, damage):
                 if labor_status["current_status"].get("updated_by"):
                     damage.update({"updated_by": labor_status["current_status"]["updated_by"]})
 
-            remove_statuses = []
+            if remove_statuses is None:
+                remove_statuses = []
 
             if labor_status.get("charge_l_status"):
                 damage.update({"charge_l_status": labor_status["charge_l_status"]})
@@ -302,11 +379,6 @@ def update_labor_status(labor, work_order_key, sk, damage):
                 damage.update({"charge_p_status": labor_status["charge_p_status"]})
             else:
                 remove_statuses.append("charge_p_status")
-            if remove_statuses:
-                delete_attribute({
-                    "pk": f"workorder:{work_order_key}",
-                    "sk": sk
-                }, remove_statuses)
         else:
             damage.update({
                 labor_type + "_status": "READY FOR REPAIR",
@@ -18,6 +18,7 @@ from voluptuous import MultipleInvalid
 
 from utils.common import add_update_attributes
 from utils import sqs
+from utils.batch import BatchItemFailures
 from utils.constants import MEASUREMENT_LOCATION, MEASUREMENT_TYPE
 from utils.dynamodb import update, delete_field_item, remove_item
 from validation import valid_retail_inspection
@@ -44,43 +45,48 @@ def process_stream(event, _):
     """
     LOGGER.debug({"event": event})
 
-    for record in event["Records"]:
-        try:
-            kinesis_event = json.loads(
-                base64.b64decode(record["kinesis"]["data"]), parse_float=Decimal
-            )
+    batch = BatchItemFailures(event["Records"])
 
-            dynamodb_event = json.loads(
-                json.dumps(json_util.loads(kinesis_event)), parse_float=Decimal
-            )
+    for record in batch:
+        with batch.guard(record):
+            try:
+                kinesis_event = json.loads(
+                    base64.b64decode(record["kinesis"]["data"]), parse_float=Decimal
+                )
 
-            process_record(dynamodb_event)
-        except UnicodeDecodeError as exc:
-            message = "Invalid stream data, ignoring"
-            reason = str(exc)
-            response = "N/A"
+                dynamodb_event = json.loads(
+                    json.dumps(json_util.loads(kinesis_event)), parse_float=Decimal
+                )
 
-            LOGGER.warning(
-                {
-                    "event": message,
-                    "reason": reason,
+                process_record(dynamodb_event)
+            except UnicodeDecodeError as exc:
+                message = "Invalid stream data, ignoring"
+                reason = str(exc)
+                response = "N/A"
+
+                LOGGER.warning(
+                    {
+                        "event": message,
+                        "reason": reason,
+                        "record": record,
+                        "response": response,
+                    }
+                )
+
+            except ClientError as err:
+                handle_client_error(err, record)
+            except Exception as err:
+                record.update({"reason": str(err)})
+                message = {
+                    "event": "Unknown error",
+                    "reason": str(err),
                     "record": record,
-                    "response": response,
                 }
-            )
 
-        except ClientError as err:
-            handle_client_error(err, record)
-        except Exception as err:
-            record.update({"reason": str(err)})
-            message = {
-                "event": "Unknown error",
-                "reason": str(err),
-                "record": record,
-            }
+                LOGGER.exception(message)
+                sqs.send_message(DL_QUEUE, record)
 
-            LOGGER.exception(message)
-            sqs.send_message(DL_QUEUE, record)
+    return batch.response()
 
 
 @xray_recorder.capture()
@@ -13,7 +13,10 @@ from rpp_lib.logs import LOGGER
 from voluptuous import MultipleInvalid
 from environs import Env
 from utils import sqs
+from utils.batch import BatchItemFailures
+from utils.changes import get_image_attributes, is_unchanged
 from utils.dynamodb import update, remove_item
+from utils.metrics import patch_aws_calls, timed
 from validator.recon_service_status_ingest import validate_service_status_ingest_event
 from datetime import datetime, timezone
 
@@ -28,68 +31,80 @@ RETRY_EXCEPTIONS = (
 )
 
 patch_all()
+patch_aws_calls()
 
 
 @xray_recorder.capture()
+@timed("recon_service_status_ingest")
 def process_stream(event, _):
     """
     Processing for rpp-service-status kinesis stream events
     """
     LOGGER.info({"event": event})
 
-    for record in event["Records"]:
-        try:
-            kinesis_event = json.loads(
-                base64.b64decode(record["kinesis"]["data"]),
-                parse_float=Decimal,
-            )
+    batch = BatchItemFailures(event["Records"])
 
-            dynamodb_event = json.loads(
-                json.dumps(json_util.loads(kinesis_event)), parse_float=Decimal
-            )
-            LOGGER.info({"service_status_ingest_dynamo_event": dynamodb_event})
-
-            if dynamodb_event.get("eventName") in ["INSERT", "MODIFY"]:
-                process_record(
-                    dynamodb_event.get("dynamodb", {}).get("NewImage"),
-                    dynamodb_event.get("dynamodb", {}).get(
-                        "ApproximateCreationDateTime"
-                    ),
+    for record in batch:
+        with batch.guard(record):
+            try:
+                kinesis_event = json.loads(
+                    base64.b64decode(record["kinesis"]["data"]),
+                    parse_float=Decimal,
+                )
+
+                dynamodb_event = json.loads(
+                    json.dumps(json_util.loads(kinesis_event)), parse_float=Decimal
                 )
+                LOGGER.info({"service_status_ingest_dynamo_event": dynamodb_event})
 
-        except UnicodeDecodeError as exc:
-            message = "Invalid stream data, ignoring"
-            reason = str(exc)
-            response = "N/A"
+                # the service status items are copied whole, updated is taken
+                # from ApproximateCreationDateTime
+                changed = not is_unchanged(
+                    dynamodb_event, get_image_attributes(dynamodb_event)
+                )
+                if dynamodb_event.get("eventName") in ["INSERT", "MODIFY"] and changed:
+                    process_record(
+                        dynamodb_event.get("dynamodb", {}).get("NewImage"),
+                        dynamodb_event.get("dynamodb", {}).get(
+                            "ApproximateCreationDateTime"
+                        ),
+                    )
+
+            except UnicodeDecodeError as exc:
+                message = "Invalid stream data, ignoring"
+                reason = str(exc)
+                response = "N/A"
+
+                LOGGER.exception(
+                    {
+                        "event": message,
+                        "reason": reason,
+                        "record": record,
+                        "response": response,
+                    }
+                )
 
-            LOGGER.exception(
-                {
-                    "event": message,
-                    "reason": reason,
+            except ClientError as client_error:
+                LOGGER.exception(
+                    {
+                        "message": "Client error processing record",
+                        "exception_name": type(client_error),
+                        "exception": str(client_error),
+                    }
+                )
+                raise
+            except Exception as err:
+                record.update({"reason": str(err)})
+                message = {
+                    "event": "Unknown error",
+                    "reason": str(err),
                     "record": record,
-                    "response": response,
                 }
-            )
 
-        except ClientError as client_error:
-            LOGGER.exception(
-                {
-                    "message": "Client error processing record",
-                    "exception_name": type(client_error),
-                    "exception": str(client_error),
-                }
-            )
-            raise
-        except Exception as err:
-            record.update({"reason": str(err)})
-            message = {
-                "event": "Unknown error",
-                "reason": str(err),
-                "record": record,
-            }
+                LOGGER.exception(message)
+                sqs.send_message(DL_QUEUE, record)
 
-            LOGGER.exception(message)
-            sqs.send_message(DL_QUEUE, record)
+    return batch.response()
 
 
 def process_record(record, approx_creation_time):
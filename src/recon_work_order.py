@@ -1,42 +1,130 @@
 from operator import itemgetter
-from dynamodb.store import get_work_order, get_work_oder_index, query, DynamoItemNotFound
+from dynamodb.store import (
+    get_work_order, query, query_page, get_key_condition, DynamoItemNotFound,
+    WORK_ORDER_TABLE_NAME, DAMAGE_INDEX, get_damage_key, get_damage_work_order
+)
 from validator.recon_work_order import (
     validate_find_work_order, validate_get_conditions_by_vin, validate_damage,
-    validate_condition, validate_workorder_damage, validate_tire, validate_primary_key
+    validate_condition, validate_workorder_damage, validate_workorder_damages,
+    validate_tire, validate_primary_key
 )
 from aws_xray_sdk.core import patch_all, xray_recorder
 from rpp_lib.logs import LOGGER
 from voluptuous import MultipleInvalid
 from boto3.dynamodb.conditions import Attr, Key
-from utils.dynamodb import get_response, get_error, HEADERS
-import simplejson as s_json
+from environs import Env
+from utils.cache import CACHE, can_invalidate, get_tag
+from utils.dynamodb import get_response, get_error, get_projection, encode_cursor, HEADERS
+from utils.http import compress, dumps, with_body
+from utils.metrics import timed
 import json
 from http import HTTPStatus
 
 
 patch_all()
 
+ENV = Env()
+# DAMAGE_INDEX exists, it ships in the release after index_conditions_vin as
+# CloudFormation adds one index per stack update. Without it every damage is looked
+# for in index_site_work_order_number.
+DAMAGE_INDEX_ENABLED = ENV.bool("DAMAGE_INDEX_ENABLED", False)
+# look for damages missing from DAMAGE_INDEX in index_site_work_order_number, until
+# every damage was written with the index keys
+DAMAGE_INDEX_FALLBACK = ENV.bool("DAMAGE_INDEX_FALLBACK", True)
+
+# items of a page when a request has a cursor without a page_size
+DEFAULT_PAGE_SIZE = 100
+
+CONDITIONS_INDEX = "index_conditions_vin"
+# conditions of a vin read at a time when they are filtered on the work order
+CONDITIONS_PAGE = 10
+
+
+def is_paged(request_params):
+    return "page_size" in request_params or "cursor" in request_params
+
+
+def query_items(args, request_params, description):
+    """
+    items of the first page of a query, of every page with all_pages, or a page of
+    them, {"items": [...], "cursor": ...}, when the request has a page_size or a
+    cursor. The cursor of the last page is None. The request fields are the
+    attributes read, all of them by default.
+    """
+    if request_params.get("fields"):
+        args = {**args, **get_projection(request_params["fields"])}
+
+    if not is_paged(request_params):
+        items, _ = query_page(args, all_pages=request_params.get("all_pages", False))
+        if not items:
+            raise DynamoItemNotFound(404, f"No records found for {description}")
+        return items
+
+    items, last_key = query_page(
+        args,
+        request_params.get("page_size", DEFAULT_PAGE_SIZE),
+        request_params.get("cursor"),
+    )
+    if not items and "cursor" not in request_params:
+        raise DynamoItemNotFound(404, f"No records found for {description}")
+
+    return {"items": items, "cursor": encode_cursor(last_key)}
+
 
+@timed("recon_work_order_find")
 @xray_recorder.capture("find")
 def find(event, _):
+    return find_work_order(event, CACHE)
+
+
+def read_through(cache, key, load, tags):
+    if cache is None:
+        return load()
+
+    return cache.get(key, load, tags)
+
+
+def find_work_order(event, cache=None):
+    """
+    item or index items the event asks for, read through cache when given. The
+    stream processors read without one, they write back what they read.
+    """
     LOGGER.debug({"event": event})
     response = None
 
     try:
         request_params = validate_find_work_order(event)
+        key = request_params["key"]
 
         if request_params.get("index"):
-            response = get_work_oder_index(
-                request_params["key"],
-                request_params["index"]
+            index = request_params["index"]
+            args = {"IndexName": index, "KeyConditionExpression": get_key_condition(key)}
+            index_cache = cache
+            if is_paged(request_params) or not can_invalidate(index, key):
+                # pages are read once, in turn, and the changes of the items of
+                # other lookups do not carry their tags
+                index_cache = None
+            response = read_through(
+                index_cache,
+                (
+                    WORK_ORDER_TABLE_NAME,
+                    index,
+                    tuple(sorted(key.items())),
+                    tuple(request_params.get("fields", ())),
+                    request_params.get("all_pages", False),
+                ),
+                lambda: query_items(args, request_params, f"key:{key} index:{index}"),
+                [get_tag(**key)],
             )
 
         else:
-            response = get_work_order(
-                request_params["key"]["pk"],
-                request_params["key"]["sk"]
+            response = read_through(
+                cache,
+                (WORK_ORDER_TABLE_NAME, key["pk"], key["sk"]),
+                lambda: get_work_order(key["pk"], key["sk"]),
+                [get_tag(pk=key["pk"], sk=key["sk"])],
             )
-            response.update(request_params["key"])
+            response.update(key)
 
     except MultipleInvalid as v_error:
         LOGGER.warn(
@@ -78,6 +166,49 @@ def find(event, _):
     return response
 
 
+def get_latest_conditions(vin, filter_exp=None):
+    """
+    newest conditions item of a vin, out of those matching filter_exp, with only the
+    damages and tires of its condition. index_conditions_vin has the conditions items sorted by update time,
+    those written before it are looked for in index_vin until they are backfilled, see the README.
+    """
+    args = {
+        "IndexName": CONDITIONS_INDEX,
+        "KeyConditionExpression": Key("conditions_vin").eq(vin),
+        "ProjectionExpression": "#condition.damages, #condition.tires",
+        "ExpressionAttributeNames": {"#condition": "condition"},
+        "ScanIndexForward": False,
+        "Limit": 1,
+    }
+    if filter_exp is not None:
+        # the limit applies before the filter, read a page of conditions at a time
+        args["FilterExpression"] = filter_exp
+        args["Limit"] = CONDITIONS_PAGE
+
+    while True:
+        response = query(args)
+        if response.get("Items"):
+            return response["Items"][0]
+        if "LastEvaluatedKey" not in response:
+            break
+        args["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    args = {
+        "IndexName": "index_vin",
+        "KeyConditionExpression": Key("vin").eq(vin) & Key("sk").begins_with("conditions"),
+        "ProjectionExpression": "#condition.damages, #condition.tires, #updated",
+        "ExpressionAttributeNames": {"#condition": "condition", "#updated": "updated"},
+    }
+    if filter_exp is not None:
+        args["FilterExpression"] = filter_exp
+
+    items = query(args).get("Items")
+    if not items:
+        return None
+
+    return max(items, key=itemgetter("updated"))
+
+
 def get_conditions_by_vin(event, _):
     LOGGER.debug({"event": event})
     damages = []
@@ -87,29 +218,19 @@ def get_conditions_by_vin(event, _):
         request_params = validate_get_conditions_by_vin(event)
         vin = request_params["vin"]
 
-        key_condition_expression = Key("vin").eq(vin) & \
-            Key("sk").begins_with("conditions")
-
-        args = {
-            "IndexName": "index_vin",
-            "KeyConditionExpression": key_condition_expression
-        }
-
+        filter_exp = None
         if request_params.get("site_id") and request_params.get("work_order_number"):
             filter_exp = Attr("site_id").eq(request_params.get("site_id")) & Attr("work_order_number").eq(request_params.get("work_order_number"))
-            args["FilterExpression"] = filter_exp
 
-        response = query(args)
+        condition_item = get_latest_conditions(vin, filter_exp)
 
-        if not response.get("Items"):
+        if not condition_item:
             raise DynamoItemNotFound(
                 404,
                 f"No records found for VIN:{vin}"
             )
 
-        condition_items = sorted(response["Items"], key=itemgetter('updated'), reverse=True)
-
-        condition_item = validate_condition(condition_items[0])
+        condition_item = validate_condition(condition_item)
 
         for item in condition_item['condition']['damages']:
             damage = validate_damage(item)
@@ -179,15 +300,7 @@ def get_labors(event, _):
             "KeyConditionExpression": key_condition_expression,
         }
 
-        response = query(args)
-
-        if not response.get("Items"):
-            raise DynamoItemNotFound(
-                404,
-                f"No labors found for pk:{pk}"
-            )
-
-        labors = response["Items"]
+        labors = query_items(args, request_params, f"labors of pk:{pk}")
 
         LOGGER.debug({"labors": labors})
 
@@ -233,48 +346,113 @@ def not_found(headers={}, body=None):
     return get_response("200", headers, body)
 
 
+def get_shop_category(item):
+    if item.get("charge_l_status"):
+        return item["charge_l_status"]["shop_code"]
+    if item.get("charge_p_status"):
+        return item["charge_p_status"]["shop_code"]
+
+    return ""
+
+
+def query_all(args):
+    """
+    items of every page of a query
+    """
+    items = []
+    while True:
+        response = query(args)
+        items.extend(response.get("Items", []))
+        if "LastEvaluatedKey" not in response:
+            return items
+        args["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def get_damage_items(site_id, work_order_number, pairs):
+    """
+    {(item_code, damage): item} of the pairs found in a work order, the first item
+    of each. One pair is a single key query of DAMAGE_INDEX, more read the damages
+    of the work order from it. Pairs of damages written before the index had their
+    keys, or every pair without DAMAGE_INDEX_ENABLED, are looked for in
+    index_site_work_order_number.
+    """
+    pairs = set(pairs)
+    projection = {
+        "ProjectionExpression": (
+            "#item_code, #damage, #charge_l_status, #charge_p_status"
+        ),
+        "ExpressionAttributeNames": {
+            "#item_code": "item_code",
+            "#damage": "damage",
+            "#charge_l_status": "charge_l_status",
+            "#charge_p_status": "charge_p_status",
+        },
+    }
+
+    found = {}
+    if DAMAGE_INDEX_ENABLED:
+        key_condition_expression = Key("damage_work_order").eq(
+            get_damage_work_order(site_id, work_order_number)
+        )
+        if len(pairs) == 1:
+            item_code, damage = next(iter(pairs))
+            key_condition_expression &= Key("damage_key").eq(
+                get_damage_key(item_code, damage)
+            )
+
+        items = query_all({
+            "IndexName": DAMAGE_INDEX,
+            "KeyConditionExpression": key_condition_expression,
+            **projection,
+        })
+
+        for item in items:
+            pair = (item.get("item_code"), item.get("damage"))
+            if pair in pairs:
+                found.setdefault(pair, item)
+
+    missing = pairs - set(found)
+    if not missing or (DAMAGE_INDEX_ENABLED and not DAMAGE_INDEX_FALLBACK):
+        return found
+
+    items = query_all({
+        "IndexName": "index_site_work_order_number",
+        "KeyConditionExpression": Key("site_id").eq(site_id) & Key("work_order_number").eq(work_order_number),
+        "FilterExpression": Attr("item_code").is_in(sorted({item_code for item_code, _ in missing})),
+        **projection,
+    })
+    for item in items:
+        pair = (item.get("item_code"), item.get("damage"))
+        if pair in missing:
+            found.setdefault(pair, item)
+
+    return found
+
+
 def get_workorder_damage(event, _):
     LOGGER.debug({"event": event}),
     items = []
 
     try:
-        request_params = validate_workorder_damage(event)
+        request_params = validate_workorder_damage(with_body(event))
         request_body = request_params.get("body", {})
         site_id = request_body['site_id']
         work_order_number = request_body['work_order_number']
         item_code = request_body['item_code']
         damage = request_body['damage']
 
-        key_condition_expression = Key("site_id").eq(site_id) & Key("work_order_number").eq(work_order_number)
-
-        filter_exp = Attr("item_code").eq(item_code) & Attr("damage").eq(damage)
-
-        args = {
-            "IndexName": "index_site_work_order_number",
-            "KeyConditionExpression": key_condition_expression,
-            "FilterExpression": filter_exp
-        }
+        items = get_damage_items(site_id, work_order_number, [(item_code, damage)])
 
-        response = query(args)
-
-        if not response.get("Items"):
+        if not items:
             raise DynamoItemNotFound(
                 404,
                 f"No damage found for work_order_number:{work_order_number}"
             )
 
-        items = response.get("Items", {})
         LOGGER.debug({"damage": items})
-        if not items:
-            return not_found(body=s_json.dumps([]))
-        if items[0].get("charge_l_status"):
-            shop_category = items[0]["charge_l_status"]["shop_code"]
-        elif items[0].get("charge_p_status"):
-            shop_category = items[0]["charge_p_status"]["shop_code"]
-        else:
-            shop_category = ""
+        shop_category = get_shop_category(items[(item_code, damage)])
 
-        body = s_json.dumps({
+        body = dumps({
             "shop_category": shop_category
         })
         status_code = 200
@@ -312,6 +490,63 @@ def get_workorder_damage(event, _):
         body = json.dumps(get_error(HTTPStatus.INTERNAL_SERVER_ERROR, str(e_error)))
         status_code = HTTPStatus.INTERNAL_SERVER_ERROR
 
-    response = get_response(status_code, HEADERS, body)
+    response = compress(event, get_response(status_code, HEADERS, body))
 
     return response
+
+
+def get_workorder_damages(event, _):
+    """
+    shop category of many damages of a work order, by item_code and damage, in one
+    request. Damages not found have a null shop_category.
+    """
+    LOGGER.debug({"event": event})
+
+    try:
+        request_params = validate_workorder_damages(with_body(event))
+        request_body = request_params.get("body", {})
+        pairs = [
+            (damage["item_code"], damage["damage"]) for damage in request_body["damages"]
+        ]
+
+        items = get_damage_items(
+            request_body["site_id"], request_body["work_order_number"], pairs
+        )
+        LOGGER.debug({"damages": items})
+
+        body = dumps({
+            "damages": [
+                {
+                    "item_code": item_code,
+                    "damage": damage,
+                    "shop_category": get_shop_category(items[(item_code, damage)])
+                    if (item_code, damage) in items else None,
+                }
+                for item_code, damage in pairs
+            ]
+        })
+        status_code = 200
+
+    except MultipleInvalid as v_err:
+        LOGGER.warn(
+            {
+                "type": "MultipleInvalid",
+                "error": str(v_err),
+                "event": event,
+            }
+        )
+        body = json.dumps(get_error("Bad Request", v_err.msg))
+        status_code = 400
+
+    except Exception as e_error:
+        LOGGER.warn(
+            {
+                "type": "Exception",
+                "error": str(e_error),
+                "event": event,
+            }
+        )
+        body = json.dumps(get_error(HTTPStatus.INTERNAL_SERVER_ERROR, str(e_error)))
+        status_code = HTTPStatus.INTERNAL_SERVER_ERROR
+
+    return compress(event, get_response(status_code, HEADERS, body))
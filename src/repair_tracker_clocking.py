@@ -2,6 +2,7 @@
 processor for listening to rpp-work-order DynamoKinesis Stream and adding data to rpp-repair-execution service
 """
 from decimal import Decimal
+from time import monotonic
 import boto3
 import json
 from dynamodb_json import json_util
@@ -16,11 +17,16 @@ from botocore.exceptions import ClientError
 from rpp_lib.aws import get_es
 
 from utils import sqs
+from utils.aggregation import deaggregate_records
+from utils.batch import BatchItemFailures
 from utils.common import get_updated_hr
+from utils.expression import build_update
+from utils.metrics import TIMING, patch_aws_calls, timed
 from dynamodb.store import delete_record
 from validator.repair_tracker import validate_clocking_event, validate_es_clocks
 
 patch_all()
+patch_aws_calls()
 
 ENV = Env()
 DYNAMO = boto3.resource("dynamodb")
@@ -36,76 +42,85 @@ IGNORE_EXCEPTIONS = "ConditionalCheckFailedException"
 index_name = 'rpp_repair_execution_clocks'
 
 
+# of the rpp-recon-work-order stream, only clock_rt records are read, their Keys and
+# the OldImage of a REMOVE, the recon_clocking profile of utils.trim
 @xray_recorder.capture()
+@timed("repair_tracker_clocking")
 def process_stream(event, _):
     LOGGER.debug({"process_stream_event": event})
 
-    for record in event["Records"]:
-        try:
-            LOGGER.debug(
-                {
-                    "message": "record decoding steps",
-                    "kinesis_data": record["kinesis"]["data"],
-                    "base64_decode": base64.b64decode(record["kinesis"]["data"]),
-                }
-            )
-
-            kinesis_event = json.loads(
-                base64.b64decode(record["kinesis"]["data"]), parse_float=Decimal
-            )
-
-            dynamodb_event = json.loads(
-                json.dumps(json_util.loads(kinesis_event)), parse_float=Decimal
-            )
-
-            LOGGER.debug({"dynamodb_event": dynamodb_event})
-
-            process_event(dynamodb_event["dynamodb"], kinesis_event["eventName"], kinesis_event["tableName"])
-
-        except MultipleInvalid as validation_error:
-            message = {
-                "validation_error": str(validation_error),
-                "event": "processing work_order event",
-                "action": "skipping record",
-                "dynamodb_event": dynamodb_event,
-            }
-
-            LOGGER.warning(message)
-
-        except UnicodeDecodeError as exc:
-            message = "Invalid stream data, ignoring"
-            reason = str(exc)
-            exception = exc
-            response = "N/A"
-
-            LOGGER.warning(
-                {
-                    "event": message,
-                    "reason": reason,
-                    "record": record,
-                    "exception": exception,
-                    "response": response,
+    batch = BatchItemFailures(deaggregate_records(event["Records"]))
+
+    for record in batch:
+        with batch.guard(record):
+            try:
+                LOGGER.debug(
+                    {
+                        "message": "record decoding steps",
+                        "kinesis_data": record["kinesis"]["data"],
+                        "base64_decode": base64.b64decode(record["kinesis"]["data"]),
+                    }
+                )
+
+                start = monotonic()
+                kinesis_event = json.loads(
+                    base64.b64decode(record["kinesis"]["data"]), parse_float=Decimal
+                )
+
+                dynamodb_event = json.loads(
+                    json.dumps(json_util.loads(kinesis_event)), parse_float=Decimal
+                )
+                TIMING.add("decode", monotonic() - start, kinesis_event["tableName"])
+
+                LOGGER.debug({"dynamodb_event": dynamodb_event})
+
+                with TIMING.record(kinesis_event["tableName"]):
+                    process_event(dynamodb_event["dynamodb"], kinesis_event["eventName"], kinesis_event["tableName"])
+
+            except MultipleInvalid as validation_error:
+                message = {
+                    "validation_error": str(validation_error),
+                    "event": "processing work_order event",
+                    "action": "skipping record",
+                    "dynamodb_event": dynamodb_event,
                 }
-            )
-        except ClientError as err:
-            handle_client_error(record, err)
-        except (TypeError, KeyError) as err:
-            message = "Failed to update/delete the record"
-            reason = err
-            exception = err
-            response = "N/A"
 
-            LOGGER.error(
-                {
-                    "event": message,
-                    "reason": reason,
-                    "record": record,
-                    "exception": exception,
-                    "response": response,
-                }
-            )
-        except Exception as err:
-            handle_general_exception(record, err)
+                LOGGER.warning(message)
+
+            except UnicodeDecodeError as exc:
+                message = "Invalid stream data, ignoring"
+                reason = str(exc)
+                exception = exc
+                response = "N/A"
+
+                LOGGER.warning(
+                    {
+                        "event": message,
+                        "reason": reason,
+                        "record": record,
+                        "exception": exception,
+                        "response": response,
+                    }
+                )
+            except ClientError as err:
+                handle_client_error(record, err)
+            except (TypeError, KeyError) as err:
+                message = "Failed to update/delete the record"
+                reason = err
+                exception = err
+                response = "N/A"
+
+                LOGGER.error(
+                    {
+                        "event": message,
+                        "reason": reason,
+                        "record": record,
+                        "exception": exception,
+                        "response": response,
+                    }
+                )
+            except Exception as err:
+                handle_general_exception(record, err)
 
     LOGGER.debug(
         {
@@ -114,6 +129,8 @@ def process_stream(event, _):
         }
     )
 
+    return batch.response()
+
 
 @xray_recorder.capture()
 def process_queue(event, _):
@@ -246,12 +263,13 @@ def insert_into_es(record):
         "Clocking data insertion logs: ": record
     })
 
-    es_result = _es.index(
-        index=index_name,
-        body=record,
-        id=_id,
-        doc_type="_doc"
-    )
+    with TIMING.stage("es"):
+        es_result = _es.index(
+            index=index_name,
+            body=record,
+            id=_id,
+            doc_type="_doc"
+        )
 
     LOGGER.debug({
         "Clocking data insertion logs: ": es_result
@@ -273,11 +291,12 @@ def delete_from_es(record, sk):
         }
     })
 
-    es_result = _es.delete(
-        index=index_name,
-        id=_id,
-        doc_type="_doc"
-    )
+    with TIMING.stage("es"):
+        es_result = _es.delete(
+            index=index_name,
+            id=_id,
+            doc_type="_doc"
+        )
 
     LOGGER.debug({
         "Clocking data deletion logs: ": es_result
@@ -359,38 +378,27 @@ def handle_general_exception(record, err):
 def update_record(key, record, condition=None):
     record["hr_updated"] = get_updated_hr(datetime.datetime.fromtimestamp(record["updated"], datetime.timezone.utc))
 
-    attribute_names = {}
-    attribute_values = {}
-
-    update_expression = "set "
-    update_expression += ",".join(
-        map(lambda k: f"#{k} = :{k}", filter(lambda k: record[k], record.keys())))
-
-    attribute_names.update({"#" + k: k for k in record.keys() if record[k]})
-
-    attribute_values.update({":" + k: record[k] for k in record.keys() if record[k]})
     condition_expression = "attribute_not_exists(#updated) OR #updated <= :updated"
 
     if condition:
         condition_expression += " " + condition
 
+    update = build_update(
+        {k: v for k, v in record.items() if v}, condition=condition_expression
+    )
+
     LOGGER.debug(
         {
             "key": key,
-            "update_expression": update_expression,
+            "update_expression": update["UpdateExpression"],
             "condition_expression": condition_expression,
-            "expression_attribute_names": attribute_names,
-            "expression_attribute_values": attribute_values,
+            "expression_attribute_names": update["ExpressionAttributeNames"],
+            "expression_attribute_values": update["ExpressionAttributeValues"],
         }
     )
 
     response = RPP_RECON_WORK_ORDER_TABLE.update_item(
-        Key=key,
-        UpdateExpression=update_expression,
-        ConditionExpression=condition_expression,
-        ExpressionAttributeNames=attribute_names,
-        ExpressionAttributeValues=attribute_values,
-        ReturnValues="UPDATED_NEW",
+        Key=key, ReturnValues="UPDATED_NEW", **update
     )
 
     LOGGER.debug({"response": response})
@@ -7,11 +7,16 @@ from codeguru_profiler_agent import with_lambda_profiler
 from dynamodb.store import put_work_order
 from environs import Env
 from rpp_lib.logs import LOGGER
+from utils.aggregation import deaggregate_records
+from utils.batch import BatchItemFailures
+from utils.changes import get_image_attributes, is_unchanged
 from utils.decode_record import decode_record
 from voluptuous import Any
 from utils.dynamodb import convert_to_date_stamp
+from utils.metrics import patch_aws_calls, timed
 
 patch_all()
+patch_aws_calls()
 
 RETRY_EXCEPTIONS = ("ProvisionedThroughputExceededException", "ThrottlingException")
 
@@ -29,6 +34,10 @@ def process_record(record):
     LOGGER.debug({"dynamo_record": record})
     xray_recorder.put_metadata("dynamodb_record", record)
 
+    # the rims items are copied whole, hr_updated follows updated
+    if is_unchanged(record, get_image_attributes(record)):
+        return
+
     rims_record = record["dynamodb"]["NewImage"]
 
     xray_recorder.put_annotation("site_id", rims_record.get("auction_id", ""))
@@ -49,6 +58,7 @@ def process_record(record):
 
 @with_lambda_profiler(profiling_group_name=PROFILE_GROUP)
 @xray_recorder.capture()
+@timed("rims_ingest")
 def process_stream(event, _):
     """
     processing kinesis stream
@@ -56,7 +66,14 @@ def process_stream(event, _):
 
     LOGGER.debug({"event": event})
 
-    decoded_records = [decode_record(record) for record in event["Records"] if record]
+    batch = BatchItemFailures(deaggregate_records(event["Records"]))
+
+    for kinesis_record in batch:
+        record = decode_record(kinesis_record)
+        if record is None:
+            continue
+
+        with batch.guard(kinesis_record):
+            process_record(record)
 
-    for record in decoded_records:
-        process_record(record)
+    return batch.response()
@@ -4,6 +4,10 @@ import logging
 from botocore.exceptions import ClientError
 from environs import Env
 
+from utils.batch import BatchItemFailures, is_retryable
+from utils.changes import get_image_attributes, is_unchanged
+from utils.metrics import timed
+
 # Initialize environment variables and clients
 env = Env()
 env.read_env()
@@ -13,22 +17,35 @@ logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
+@timed("shop_views")
 def handler(event, context):
     logger.info(f"Received event: {json.dumps(event)}")
-    for record in event['Records']:
-        event_name = record['eventName']
-        try:
-            if event_name in ['INSERT', 'MODIFY']:
-                new_image = record['dynamodb']['NewImage']
-                item = {k: list(v.values())[0] for k, v in new_image.items()}
-                table.put_item(Item=item)
-                logger.info(f"Successfully added/modified item: {item}")
-            elif event_name == 'REMOVE':
-                keys = record['dynamodb']['Keys']
-                key = {k: list(v.values())[0] for k, v in keys.items()}
-                table.delete_item(Key=key)
-                logger.info(f"Successfully deleted item with key: {key}")
-        except ClientError as e:
-            logger.error(f"Failed to process item: {e.response['Error']['Message']}")
-        except Exception as e:
-            logger.error(f"Unexpected error: {str(e)}")
+    batch = BatchItemFailures(event['Records'])
+
+    for record in batch:
+        with batch.guard(record):
+            event_name = record['eventName']
+            # the views are copies of the whole items
+            if is_unchanged(record, get_image_attributes(record)):
+                continue
+
+            try:
+                if event_name in ['INSERT', 'MODIFY']:
+                    new_image = record['dynamodb']['NewImage']
+                    item = {k: list(v.values())[0] for k, v in new_image.items()}
+                    table.put_item(Item=item)
+                    logger.info(f"Successfully added/modified item: {item}")
+                elif event_name == 'REMOVE':
+                    keys = record['dynamodb']['Keys']
+                    key = {k: list(v.values())[0] for k, v in keys.items()}
+                    table.delete_item(Key=key)
+                    logger.info(f"Successfully deleted item with key: {key}")
+            except ClientError as e:
+                if is_retryable(e):
+                    # the stream retries from this record
+                    raise
+                logger.error(f"Failed to process item: {e.response['Error']['Message']}")
+            except Exception as e:
+                logger.error(f"Unexpected error: {str(e)}")
+
+    return batch.response()
@@ -9,12 +9,16 @@ from environs import Env
 from rpp_lib.logs import LOGGER
 
 from dynamodb.store import update_document_for_pk_and_sk
+from utils.aggregation import deaggregate_records
+from utils.batch import BatchItemFailures
 from utils.common import get_utc_now, get_updated_hr
 from utils.decode_record import decode_record
+from utils.metrics import patch_aws_calls, timed
 from utils.sqs import send_message
 from voluptuous import Any, MultipleInvalid
 
 patch_all()
+patch_aws_calls()
 
 ENV = Env()
 
@@ -70,6 +74,7 @@ def set_storage_date(records_dict: dict, pk: str, new_image: dict):
 
 @with_lambda_profiler(profiling_group_name=PROFILE_GROUP)
 @xray_recorder.capture()
+@timed("storage_charges_ingest")
 def process_stream(event, _):
     """
     processing rpp-charges-ingest kinesis stream for storage charge items
@@ -77,105 +82,112 @@ def process_stream(event, _):
 
     LOGGER.info({"event": event})
 
-    decoded_records = [decode_record(record) for record in event["Records"] if record]
+    batch = BatchItemFailures(deaggregate_records(event["Records"]))
+
+    for kinesis_record in batch:
+        record = decode_record(kinesis_record)
+        if record is None:
+            continue
+
+        with batch.guard(kinesis_record):
+            LOGGER.info({"message": " Processing record.", "record": record})
+            try:
+                old_image = record["dynamodb"].get("OldImage", {})
+                new_image = record["dynamodb"]["NewImage"]
+
+                pk = record["dynamodb"]["Keys"]["pk"]
+
+                # If the pk and storage date are already in the records_dictionary,
+                # we will skip processing this record.
+                if pk in records_dictionary and \
+                        records_dictionary[pk]["storage_date"] == new_image["storage_start_date"]:
+                    LOGGER.info(
+                        {
+                            "message": "Record processing will be skipped",
+                            "reason": "Record already processed with same storage date",
+                            "record": record,
+                        }
+                    )
+                    continue
+
+                if "is_invalidated" in new_image and new_image["is_invalidated"]:
+                    """
+                    is_invalidated field is present in the new image and set to True.
+                    If this is the case, we will skip processing this record.
+                    """
+                    LOGGER.info(
+                        {
+                            "message": "Record processing will be skipped",
+                            "reason": "is_invalidated is set to True",
+                            "record": record,
+                        }
+                    )
+                    continue
+
+                if record["eventName"] == "INSERT":
+                    """
+                    If a new record was inserted, verify that "is_invalidated" is not set to False.
+                    """
+                    set_storage_date(records_dictionary, pk, new_image)
+
+                elif record["eventName"] == "MODIFY":
+                    """
+                    If a record was modified, check if the storage_start_date has moved to the future or past.
+                    """
+                    new_image_timestamp = convert_to_timestamp(new_image["storage_start_date"])
+                    old_image_timestamp = convert_to_timestamp(old_image.get("storage_start_date", "1970-01-01"))
+                    if new_image_timestamp >= old_image_timestamp:
+                        if not new_image.get("is_invalidated", False):
+                            set_storage_date(records_dictionary, pk, new_image)
+                    else:
+                        if new_image.get("is_invalidated", False) != old_image.get("is_invalidated", False) and \
+                                not new_image.get("is_invalidated", False):
+                            set_storage_date(records_dictionary, pk, new_image)
 
-    for record in decoded_records:
-        LOGGER.info({"message": " Processing record.", "record": record})
-        try:
-            old_image = record["dynamodb"].get("OldImage", {})
-            new_image = record["dynamodb"]["NewImage"]
-
-            pk = record["dynamodb"]["Keys"]["pk"]
-
-            # If the pk and storage date are already in the records_dictionary,
-            # we will skip processing this record.
-            if pk in records_dictionary and \
-                    records_dictionary[pk]["storage_date"] == new_image["storage_start_date"]:
-                LOGGER.info(
-                    {
-                        "message": "Record processing will be skipped",
-                        "reason": "Record already processed with same storage date",
-                        "record": record,
-                    }
-                )
-                continue
-
-            if "is_invalidated" in new_image and new_image["is_invalidated"]:
-                """
-                is_invalidated field is present in the new image and set to True.
-                If this is the case, we will skip processing this record.
-                """
-                LOGGER.info(
-                    {
-                        "message": "Record processing will be skipped",
-                        "reason": "is_invalidated is set to True",
-                        "record": record,
-                    }
-                )
-                continue
-
-            if record["eventName"] == "INSERT":
-                """
-                If a new record was inserted, verify that "is_invalidated" is not set to False.
-                """
-                set_storage_date(records_dictionary, pk, new_image)
-
-            elif record["eventName"] == "MODIFY":
-                """
-                If a record was modified, check if the storage_start_date has moved to the future or past.
-                """
-                new_image_timestamp = convert_to_timestamp(new_image["storage_start_date"])
-                old_image_timestamp = convert_to_timestamp(old_image.get("storage_start_date", "1970-01-01"))
-                if new_image_timestamp >= old_image_timestamp:
-                    if not new_image.get("is_invalidated", False):
-                        set_storage_date(records_dictionary, pk, new_image)
                 else:
-                    if new_image.get("is_invalidated", False) != old_image.get("is_invalidated", False) and \
-                            not new_image.get("is_invalidated", False):
-                        set_storage_date(records_dictionary, pk, new_image)
-
-            else:
-                """
-                If the event is not INSERT or MODIFY, we will skip processing
-                """
-                LOGGER.info(
+                    """
+                    If the event is not INSERT or MODIFY, we will skip processing
+                    """
+                    LOGGER.info(
+                        {
+                            "message": "Record processing will be skipped",
+                            "reason": "Event is not INSERT or MODIFY",
+                            "record": record,
+                        }
+                    )
+                    continue
+
+            except MultipleInvalid as validation_error:
+                LOGGER.error(
                     {
                         "message": "Record processing will be skipped",
-                        "reason": "Event is not INSERT or MODIFY",
+                        "reason": str(validation_error),
                         "record": record,
                     }
                 )
-                continue
+                record.update({"reason": str(validation_error)})
+                send_message(DL_QUEUE, record)
 
-        except MultipleInvalid as validation_error:
-            LOGGER.error(
-                {
-                    "message": "Record processing will be skipped",
-                    "reason": str(validation_error),
+            except ClientError as db_err:
+                message = {
+                    "event": "Client error",
+                    "reason": str(db_err),
                     "record": record,
                 }
-            )
-            record.update({"reason": str(validation_error)})
-            send_message(DL_QUEUE, record)
-
-        except ClientError as db_err:
-            message = {
-                "event": "Client error",
-                "reason": str(db_err),
-                "record": record,
-            }
-            LOGGER.error(message)
-
-            record.update({"reason": str(db_err)})
-            send_message(DL_QUEUE, record)
-
-        except Exception as err:
-            message = {
-                "event": "Unknown error",
-                "reason": str(err),
-                "record": record,
-            }
-            LOGGER.exception(message)
-
-            record.update({"reason": str(err)})
-            send_message(DL_QUEUE, record)
+                LOGGER.error(message)
+
+                record.update({"reason": str(db_err)})
+                send_message(DL_QUEUE, record)
+
+            except Exception as err:
+                message = {
+                    "event": "Unknown error",
+                    "reason": str(err),
+                    "record": record,
+                }
+                LOGGER.exception(message)
+
+                record.update({"reason": str(err)})
+                send_message(DL_QUEUE, record)
+
+    return batch.response()
@@ -0,0 +1,253 @@
+"""
+kinesis records aggregated the way the kinesis producer library does, several user
+records in the data of one kinesis record, read by the kcl and by the
+aws-kinesis-agg deaggregators as well as by deaggregate_records
+
+    magic, AggregatedRecord protobuf, md5 of the protobuf
+
+    message AggregatedRecord {
+        repeated string partition_key_table = 1;
+        repeated string explicit_hash_key_table = 2;
+        repeated Record records = 3;
+    }
+    message Record {
+        required uint64 partition_key_index = 1;
+        optional uint64 explicit_hash_key_index = 2;
+        required bytes data = 3;
+        repeated Tag tags = 4;
+    }
+
+Only records of one partition key are aggregated together, they land on the shard of
+that key in the order they were written.
+"""
+import base64
+import binascii
+import hashlib
+
+from rpp_lib.logs import LOGGER
+
+MAGIC = b"\xf3\x89\x9a\xc2"
+# base64 of the first three bytes of MAGIC, the data of other records is not decoded
+ENCODED_MAGIC = "84ma"
+DIGEST_SIZE = 16
+# AggregationMaxSize of the kpl, well under the 1 MB of a kinesis record
+MAX_SIZE = 51200
+
+VARINT = 0
+FIXED64 = 1
+LENGTH_DELIMITED = 2
+FIXED32 = 5
+
+
+def encode_varint(value):
+    encoded = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            encoded.append(byte | 0x80)
+        else:
+            encoded.append(byte)
+            return bytes(encoded)
+
+
+def decode_varint(data, position):
+    value = shift = 0
+    while True:
+        if position >= len(data):
+            raise ValueError("truncated varint")
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, position
+        shift += 7
+
+
+def encode_field(number, value):
+    """
+    a length delimited field, or a varint one for an int
+    """
+    if isinstance(value, int):
+        return encode_varint(number << 3 | VARINT) + encode_varint(value)
+
+    return (
+        encode_varint(number << 3 | LENGTH_DELIMITED)
+        + encode_varint(len(value))
+        + value
+    )
+
+
+def decode_fields(data):
+    """
+    (field number, value) of a protobuf message, values of unknown wire types fail
+    """
+    position = 0
+    while position < len(data):
+        key, position = decode_varint(data, position)
+        number, wire_type = key >> 3, key & 0x07
+        if wire_type == VARINT:
+            value, position = decode_varint(data, position)
+        elif wire_type == LENGTH_DELIMITED:
+            size, position = decode_varint(data, position)
+            value = data[position : position + size]
+            if len(value) != size:
+                raise ValueError("truncated field")
+            position += size
+        elif wire_type == FIXED64:
+            value, position = data[position : position + 8], position + 8
+        elif wire_type == FIXED32:
+            value, position = data[position : position + 4], position + 4
+        else:
+            raise ValueError(f"unsupported wire type {wire_type}")
+        yield number, value
+
+
+def get_record_size(data):
+    """
+    bytes a user record adds to an aggregated record
+    """
+    record = 2 + len(encode_varint(len(data))) + len(data) + 1
+    return 1 + len(encode_varint(record)) + record
+
+
+def get_overhead(partition_key):
+    key = partition_key.encode("utf-8")
+    return len(MAGIC) + DIGEST_SIZE + 1 + len(encode_varint(len(key))) + len(key)
+
+
+def aggregate(partition_key, datas):
+    """
+    data of a kinesis record aggregating the data of user records of a partition key
+    """
+    message = encode_field(1, partition_key.encode("utf-8"))
+    for data in datas:
+        message += encode_field(3, encode_field(1, 0) + encode_field(3, data))
+
+    return MAGIC + message + get_digest(message)
+
+
+def get_digest(message):
+    """
+    md5 trailer of an aggregated record, a checksum the kpl format sets
+    """
+    return hashlib.md5(message, usedforsecurity=False).digest()
+
+
+def is_aggregated(data):
+    return (
+        data[: len(MAGIC)] == MAGIC
+        and len(data) >= len(MAGIC) + DIGEST_SIZE
+        and get_digest(data[len(MAGIC) : -DIGEST_SIZE]) == data[-DIGEST_SIZE:]
+    )
+
+
+def deaggregate(data):
+    """
+    (partition key, data) of the user records of aggregated data, in order. Data
+    that does not parse raises ValueError.
+    """
+    partition_keys = []
+    records = []
+    for number, value in decode_fields(data[len(MAGIC) : -DIGEST_SIZE]):
+        if number == 1:
+            partition_keys.append(value.decode("utf-8"))
+        elif number == 3:
+            fields = dict(decode_fields(value))
+            records.append((fields.get(1, 0), fields.get(3, b"")))
+
+    try:
+        return [(partition_keys[index], data) for index, data in records]
+    except IndexError as exc:
+        raise ValueError("partition key index out of the table") from exc
+
+
+def group_entries(entries, max_size=MAX_SIZE):
+    """
+    put_records entries, {"Data", "PartitionKey", "ExplicitHashKey", ...}, in groups
+    of a partition and explicit hash key whose aggregated data stays under max_size,
+    each group where its first entry was and the entries of a key in order
+    """
+    groups = []
+    open_groups = {}
+    for entry in entries:
+        key = (entry["PartitionKey"], entry.get("ExplicitHashKey"))
+        size = get_record_size(entry["Data"])
+        group = open_groups.get(key)
+        if group is None or group[0] + size > max_size:
+            group = open_groups[key] = [get_overhead(key[0]), []]
+            groups.append(group[1])
+        group[0] += size
+        group[1].append(entry)
+
+    return groups
+
+
+def aggregate_entries(entries, max_size=MAX_SIZE):
+    """
+    put_records entries with those of a partition key aggregated, an entry alone in
+    its group is left as it is
+    """
+    aggregated = []
+    for group in group_entries(entries, max_size):
+        if len(group) == 1:
+            aggregated.append(group[0])
+            continue
+        key = group[0]["PartitionKey"]
+        entry = {
+            "Data": aggregate(key, [entry["Data"] for entry in group]),
+            "PartitionKey": key,
+        }
+        if "ExplicitHashKey" in group[0]:
+            entry["ExplicitHashKey"] = group[0]["ExplicitHashKey"]
+        aggregated.append(entry)
+
+    return aggregated
+
+
+def deaggregate_records(records):
+    """
+    lambda kinesis records with the aggregated ones replaced by their user records,
+    in order, and without empty ones. A user record has the sequenceNumber of its
+    kinesis record and its subSequenceNumber, a failure reported for it replays the
+    whole kinesis record. Records whose data is not a valid aggregate, a corrupt
+    trailer or protobuf, are left as they are for the decoder to reject.
+    """
+    deaggregated = []
+    for record in records:
+        if not record:
+            continue
+        kinesis = record.get("kinesis") or {}
+        data = b""
+        if str(kinesis.get("data", "")).startswith(ENCODED_MAGIC):
+            try:
+                data = base64.b64decode(kinesis["data"])
+            except binascii.Error:
+                pass
+        if not is_aggregated(data):
+            deaggregated.append(record)
+            continue
+
+        try:
+            user_records = deaggregate(data)
+        except ValueError as exc:
+            LOGGER.warning(
+                {
+                    "message": "invalid aggregated record, left as it is",
+                    "sequence_number": kinesis.get("sequenceNumber"),
+                    "reason": str(exc),
+                }
+            )
+            deaggregated.append(record)
+            continue
+
+        for index, (partition_key, user_data) in enumerate(user_records):
+            user_kinesis = dict(
+                kinesis,
+                data=base64.b64encode(user_data).decode("utf-8"),
+                partitionKey=partition_key,
+                subSequenceNumber=index,
+            )
+            deaggregated.append(dict(record, kinesis=user_kinesis))
+
+    return deaggregated
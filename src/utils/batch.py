@@ -0,0 +1,99 @@
+"""
+helpers to report partial batch failures back to kinesis/dynamodb event source mappings
+"""
+import threading
+from contextlib import contextmanager
+
+from rpp_lib.logs import LOGGER
+
+RETRY_EXCEPTIONS = ("ProvisionedThroughputExceededException", "ThrottlingException")
+
+
+def get_sequence_number(record):
+    """
+    sequence number of a raw kinesis or dynamodb stream record
+    """
+    if "kinesis" in record:
+        return record["kinesis"]["sequenceNumber"]
+
+    return record["dynamodb"]["SequenceNumber"]
+
+
+def is_retryable(c_err):
+    """
+    true when the client error is a throttling error worth replaying
+    """
+    return c_err.response["Error"]["Code"] in RETRY_EXCEPTIONS
+
+
+class BatchItemFailures:
+    """
+    Iterates the records of a stream batch and keeps the first failed sequence number.
+
+    Lambda restarts a shard from the lowest reported sequence number, so every record
+    after a failure is replayed anyway: iteration stops at the first failure and only
+    that sequence number is reported. The event source mapping needs
+    FunctionResponseTypes: ReportBatchItemFailures for the response to be honoured.
+    Failures may be reported from several threads, the lowest sequence number wins.
+    """
+
+    def __init__(self, records):
+        self.records = records
+        self.sequence_number = None
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        for record in self.records:
+            if self.failed:
+                break
+            yield record
+
+    @property
+    def failed(self):
+        return self.sequence_number is not None
+
+    def skip(self, record):
+        """
+        true when the record is at or after the failed one and will be replayed anyway
+        """
+        return self.failed and int(get_sequence_number(record)) >= int(
+            self.sequence_number
+        )
+
+    def fail(self, record, reason=None):
+        """
+        mark the record as failed, the rest of the batch will not be processed
+        """
+        sequence_number = get_sequence_number(record)
+
+        with self._lock:
+            if self.failed and int(sequence_number) >= int(self.sequence_number):
+                return
+            self.sequence_number = sequence_number
+
+        LOGGER.error(
+            {
+                "message": "record failed, returning batch for reprocessing from it",
+                "sequence_number": sequence_number,
+                "reason": str(reason),
+                "batch_size": len(self.records),
+            }
+        )
+
+    @contextmanager
+    def guard(self, record):
+        """
+        any exception escaping the block fails the batch from this record onward
+        """
+        try:
+            yield
+        except Exception as exc:
+            self.fail(record, exc)
+
+    def response(self):
+        """
+        lambda partial batch response
+        """
+        failures = [{"itemIdentifier": self.sequence_number}] if self.failed else []
+
+        return {"batchItemFailures": failures}
@@ -0,0 +1,308 @@
+"""
+read through cache of the work order lookups, held by the container for a few
+seconds and invalidated by the changes the rpp-recon-work-order stream processor
+writes to the invalidation table
+"""
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from functools import lru_cache
+
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import BotoCoreError, ClientError
+from environs import Env
+from rpp_lib.logs import LOGGER
+
+from utils.metrics import COUNTS
+from utils.resources import table
+
+ENV = Env()
+READ_CACHE = ENV.bool("READ_CACHE", True)
+READ_CACHE_TTL = ENV.float("READ_CACHE_TTL", 10)
+READ_CACHE_SIZE = ENV.int("READ_CACHE_SIZE", 1024)
+# seconds between two reads of the invalidation table by a container
+READ_CACHE_POLL = ENV.float("READ_CACHE_POLL", 1)
+# an invalidation may be readable this many seconds after its time
+READ_CACHE_LAG = ENV.float("READ_CACHE_LAG", 5)
+INVALIDATION_TABLE = ENV("CACHE_INVALIDATION_TABLE", None)
+
+# invalidations of a minute share a partition, and expire after the hour
+BUCKET_SECONDS = 60
+RETENTION_SECONDS = 3600
+# tags of one invalidation item, well under the 400 KB of a dynamodb item
+MAX_TAGS = 5000
+
+# key attributes of rpp-recon-work-order and of its indexes, hash key first
+INDEX_KEYS = {
+    "table": ("pk", "sk"),
+    "index_sk_pk": ("sk", "pk"),
+    "index_site_id_sk": ("site_id", "sk"),
+    "index_site_work_order_number": ("site_id", "work_order_number"),
+    "index_work_order_number": ("work_order_number", "sk"),
+    "index_vin": ("vin", "sk"),
+    "index_manheim_account_number": ("manheim_account_number", "sk"),
+    "index_site_manheim_account_number": ("site_id", "manheim_account_number"),
+}
+
+
+def get_tag(**values):
+    """
+    tag of the items whose attributes have values, the same for a lookup and for a
+    change of an item it may return. Tags are hashed to keep vins and accounts out
+    of the invalidation table.
+    """
+    text = "&".join(f"{name}={values[name]}" for name in sorted(values))
+
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def can_invalidate(index, key):
+    """
+    True when the changes of the items a lookup of key finds invalidate it: a
+    lookup of the table or of one of INDEX_KEYS by its hash key, with or without
+    its range key. The changes only carry the tags of those.
+    """
+    hash_key, range_key = INDEX_KEYS.get(index, (None, None))
+
+    return hash_key in key and set(key) <= {hash_key, range_key}
+
+
+def get_item_tags(item):
+    """
+    tags of every lookup, by key or by the hash key of an index, item is found by
+    """
+    tags = set()
+    for hash_key, range_key in INDEX_KEYS.values():
+        if item.get(hash_key) is None:
+            continue
+        tags.add(get_tag(**{hash_key: item[hash_key]}))
+        if item.get(range_key) is not None:
+            tags.add(get_tag(**{hash_key: item[hash_key], range_key: item[range_key]}))
+
+    return tags
+
+
+def get_image_values(image):
+    """
+    values of the key attributes of an image in dynamodb json
+    """
+    names = {name for key in INDEX_KEYS.values() for name in key}
+    values = {}
+    for name in names & set(image or {}):
+        value = next(iter(image[name].values()), None)
+        if isinstance(value, (str, int, float)):
+            values[name] = value
+
+    return values
+
+
+def get_record_tags(record):
+    """
+    tags of the lookups a dynamodb stream record changes the result of, those of
+    its old image too as an item leaves the lookups of the values it had
+    """
+    dynamodb = record.get("dynamodb", {})
+    tags = set()
+    for name in ("Keys", "NewImage", "OldImage"):
+        tags |= get_item_tags(get_image_values(dynamodb.get(name)))
+
+    return tags
+
+
+@lru_cache(maxsize=None)
+def get_table(table_name):
+    """
+    Table of the invalidation table of each thread
+    """
+    return table(table_name)
+
+
+def get_bucket(seconds):
+    return f"invalidation#{int(seconds // BUCKET_SECONDS)}"
+
+
+def invalidate(records, table_name=INVALIDATION_TABLE):
+    """
+    write the tags the stream records change to the invalidation table, one item
+    for each MAX_TAGS of them
+    """
+    if not table_name:
+        return
+
+    tags = set()
+    for record in records:
+        tags |= get_record_tags(record)
+    if not tags:
+        return
+
+    now = time.time()
+    invalidations = get_table(table_name)
+    tags = sorted(tags)
+    for chunk, start in enumerate(range(0, len(tags), MAX_TAGS)):
+        milliseconds = int(now * 1000)
+        invalidations.put_item(
+            Item={
+                "pk": get_bucket(now),
+                "sk": f"{milliseconds:013d}#{chunk}#{tags[start]}",
+                "invalidated": milliseconds,
+                "tags": set(tags[start : start + MAX_TAGS]),
+                "expires": int(now) + RETENTION_SECONDS,
+            }
+        )
+
+    LOGGER.info({"message": "lookups invalidated", "tags": len(tags)})
+
+
+class ReadCache:
+    """
+    Values of lookups for ttl seconds, the least recently used dropped past size
+    entries. An entry has the tags of its lookup and of the items it found, it is
+    dropped when an invalidation of one of them, newer than the entry, is read from
+    the invalidation table. Without a table the entries only expire.
+
+    Hits and misses are counted as ReadCacheHits and ReadCacheMisses.
+    """
+
+    def __init__(
+        self,
+        ttl=READ_CACHE_TTL,
+        size=READ_CACHE_SIZE,
+        table_name=INVALIDATION_TABLE,
+        poll=READ_CACHE_POLL,
+        lag=READ_CACHE_LAG,
+    ):
+        self.ttl = ttl
+        self.size = size
+        self.table_name = table_name
+        self.poll = poll
+        self.lag = lag
+        self.table = None
+        self.entries = OrderedDict()
+        self.tags = defaultdict(set)
+        self.polled = None
+        self.lock = threading.RLock()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.tags.clear()
+
+    def drop(self, key):
+        _, _, tags, _ = self.entries.pop(key)
+        for tag in tags:
+            self.tags[tag].discard(key)
+            if not self.tags[tag]:
+                del self.tags[tag]
+
+    def read_invalidations(self, since, now):
+        """
+        (tag, epoch seconds) of the invalidations written since
+        """
+        if self.table is None:
+            self.table = get_table(self.table_name)
+
+        bucket = int(since // BUCKET_SECONDS)
+        while bucket <= int(now // BUCKET_SECONDS):
+            arguments = {
+                "KeyConditionExpression": Key("pk").eq(
+                    get_bucket(bucket * BUCKET_SECONDS)
+                )
+                & Key("sk").gt(f"{int(since * 1000):013d}"),
+            }
+            while True:
+                response = self.table.query(**arguments)
+                for item in response.get("Items", []):
+                    for tag in item.get("tags", ()):
+                        yield tag, int(item["invalidated"]) / 1000
+                if "LastEvaluatedKey" not in response:
+                    break
+                arguments["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+            bucket += 1
+
+    def refresh(self, now):
+        """
+        drop the entries invalidated since the last poll, every entry when the
+        invalidations can not be read. The thread that claims the poll reads the
+        table without the lock, the others keep using the entries meanwhile.
+        """
+        if not self.table_name:
+            return
+
+        with self.lock:
+            if self.polled is not None and now - self.polled < self.poll:
+                return
+
+            if self.polled is None or now - self.polled > self.ttl:
+                # every entry of the last poll has expired since
+                self.clear()
+                since = now - self.lag
+            else:
+                since = self.polled - self.lag
+            self.polled = now
+
+        try:
+            invalidations = list(self.read_invalidations(since, now))
+        except (BotoCoreError, ClientError) as exc:
+            LOGGER.warning(
+                {"message": "unable to read invalidations", "reason": str(exc)}
+            )
+            self.clear()
+            return
+
+        dropped = 0
+        with self.lock:
+            for tag, invalidated in invalidations:
+                for key in list(self.tags.get(tag, ())):
+                    if self.entries[key][0] <= invalidated:
+                        self.drop(key)
+                        dropped += 1
+        if dropped:
+            COUNTS.add("ReadCacheInvalidations", dropped)
+
+    def get(self, key, load, tags=()):
+        """
+        copy of the value of key, loaded and stored when it is not cached. The
+        entry has tags, those of the lookup, and the keys of the rpp-recon-work-order
+        items of the value, a dict or a list of them. Nothing is stored when load
+        raises or the value is empty, an item written later would not invalidate it.
+        """
+        if not READ_CACHE:
+            return load()
+
+        now = time.time()
+        self.refresh(now)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[1] > now:
+                self.entries.move_to_end(key)
+                COUNTS.add("ReadCacheHits")
+                return copy.deepcopy(entry[3])
+            if entry:
+                self.drop(key)
+
+        COUNTS.add("ReadCacheMisses")
+        value = load()
+        if not value:
+            return value
+
+        items = value if isinstance(value, list) else [value]
+        entry_tags = set(tags)
+        for item in items:
+            if isinstance(item, dict) and "pk" in item and "sk" in item:
+                entry_tags.add(get_tag(pk=item["pk"], sk=item["sk"]))
+
+        with self.lock:
+            if key in self.entries:
+                self.drop(key)
+            self.entries[key] = (now, now + self.ttl, entry_tags, copy.deepcopy(value))
+            for tag in entry_tags:
+                self.tags[tag].add(key)
+            while len(self.entries) > self.size:
+                self.drop(next(iter(self.entries)))
+
+        return value
+
+
+CACHE = ReadCache()
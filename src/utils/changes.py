@@ -0,0 +1,73 @@
+"""
+change detection of stream records, a MODIFY whose images only differ in attributes
+that move on every write of the source item is not worth a write of its own
+"""
+from environs import Env
+from rpp_lib.logs import LOGGER
+
+from utils.metrics import COUNTS
+
+ENV = Env()
+SKIP_UNCHANGED_WRITES = ENV.bool("SKIP_UNCHANGED_WRITES", False)
+# attributes of the source items that move on every write
+IGNORED_ATTRIBUTES = frozenset(
+    ENV.list("CHANGE_IGNORED_ATTRIBUTES", ["updated", "updated_hr", "hr_updated"])
+)
+
+MISSING = object()
+
+
+def get_changed_attributes(
+    new_image, old_image, attributes=None, ignored=IGNORED_ATTRIBUTES
+):
+    """
+    names of the attributes whose value differs between the images, or that only one
+    of them has, out of attributes when given and leaving out the ignored ones
+    """
+    names = set(new_image) | set(old_image) if attributes is None else set(attributes)
+
+    return sorted(
+        name
+        for name in names - set(ignored)
+        if new_image.get(name, MISSING) != old_image.get(name, MISSING)
+    )
+
+
+def get_image_attributes(record):
+    """
+    names of the attributes either image of the stream record has, what a handler
+    copying the whole item writes
+    """
+    dynamodb = record.get("dynamodb", {})
+
+    return set(dynamodb.get("NewImage") or {}) | set(dynamodb.get("OldImage") or {})
+
+
+def is_unchanged(record, attributes, ignored=IGNORED_ATTRIBUTES):
+    """
+    True for a MODIFY stream record, decoded or in dynamodb json, whose images do
+    not differ in the attributes the handler copies, leaving out the ignored ones.
+
+    The skipped write is counted as SkippedWrites. Records of streams without old
+    images, and every record unless SKIP_UNCHANGED_WRITES=true, count as changed.
+    """
+    if not SKIP_UNCHANGED_WRITES or record.get("eventName") != "MODIFY":
+        return False
+
+    dynamodb = record.get("dynamodb", {})
+    old_image = dynamodb.get("OldImage")
+    if not old_image:
+        return False
+
+    changed = get_changed_attributes(
+        dynamodb.get("NewImage") or {}, old_image, attributes, ignored
+    )
+    if changed:
+        return False
+
+    LOGGER.info(
+        {"message": "images unchanged, skipping write", "keys": dynamodb.get("Keys")}
+    )
+    COUNTS.add("SkippedWrites")
+
+    return True
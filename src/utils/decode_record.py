@@ -5,8 +5,14 @@ import simplejson as json
 from dynamodb_json import json_util
 from rpp_lib.logs import LOGGER
 
+from utils.aggregation import deaggregate_records
+from utils.envelope import unpack
+
 
 def decode_record(record):
+    """
+    dynamodb stream record of a kinesis record, its data enveloped or not
+    """
     decoded_record = None
 
     try:
@@ -14,7 +20,8 @@ def decode_record(record):
             json.dumps(
                 json_util.loads(
                     json.loads(
-                        base64.b64decode(record["kinesis"]["data"]), parse_float=Decimal
+                        unpack(base64.b64decode(record["kinesis"]["data"])),
+                        parse_float=Decimal,
                     )
                 )
             ),
@@ -39,3 +46,10 @@ def decode_record(record):
         )
 
     return decoded_record
+
+
+def decode_records(records):
+    """
+    decoded records of a batch, the user records of kpl aggregated ones in order
+    """
+    return [decode_record(record) for record in deaggregate_records(records) if record]
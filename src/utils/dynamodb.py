@@ -2,25 +2,39 @@
 Module to manage local vs non local dynamodb calls
 """
 
+import base64
+import binascii
+
 import boto3
 import os
+import simplejson
 import time
 
 from boto3.dynamodb.conditions import Key
 from rpp_lib.logs import LOGGER
 
+from utils.expression import build_update
+from utils import resources
+
 HEADERS = {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"}
 
+# BatchGetItem requests of each 100 keys, the first one included, about 2.5 s of
+# backoff before the keys still unprocessed are given up on
+BATCH_GET_ATTEMPTS = 6
+
+
+RESOURCE = (
+    resources.resource("dynamodb", endpoint_url="http://local-dynamodb:8000")
+    if os.getenv("AWS_SAM_LOCAL")
+    else resources.DYNAMODB
+)
+
 
 def get_resource():
     """
-    high-level service class recommended to be used by boto
+    high-level service class recommended to be used by boto, one for each thread
     """
-    return (
-        boto3.resource("dynamodb", endpoint_url="http://local-dynamodb:8000")
-        if os.getenv("AWS_SAM_LOCAL")
-        else boto3.resource("dynamodb")
-    )
+    return RESOURCE.get()
 
 
 def get_client():
@@ -85,6 +99,43 @@ def get_item_by_key(table_name, key):
     return response
 
 
+def batch_get_items(table_name, keys, attempts=BATCH_GET_ATTEMPTS):
+    """
+    Return the items found for a list of primary keys, read with BatchGetItem
+    100 keys at a time, and the keys still unprocessed. Unprocessed keys are
+    requested again with a short backoff, in attempts requests at most.
+    """
+    resource = get_resource()
+    items = []
+    unprocessed = []
+
+    for start in range(0, len(keys), 100):
+        request_items = {table_name: {"Keys": keys[start : start + 100]}}  # noqa E203
+        for attempt in range(attempts):
+            if attempt:
+                time.sleep(min(0.05 * 2**attempt, 1))
+
+            response = resource.batch_get_item(RequestItems=request_items)
+            items.extend(response["Responses"].get(table_name, []))
+            request_items = response.get("UnprocessedKeys")
+            if not request_items:
+                break
+
+        if request_items:
+            unprocessed.extend(request_items[table_name]["Keys"])
+
+    if unprocessed:
+        LOGGER.warning(
+            {
+                "message": "keys left unprocessed",
+                "table": table_name,
+                "keys": len(unprocessed),
+            }
+        )
+
+    return items, unprocessed
+
+
 def create_item(table_name, col_dict):
     """
     Add one item (row) to table. col_dict is a dictionary {col_name: value}.
@@ -200,30 +251,16 @@ def update(table_name, key, update_dict):
     and a dictionary is passed to update feilds of the record (new fields can be stored).
     """
     table = get_resource().Table(table_name)
-    update_expression = "set "
-    update_expression += ",".join(
-        ["#" + k + " = :" + k for k in update_dict.keys() if update_dict[k] is not None]
-    )
-
-    attribute_names = {
-        "#" + k: k for k in update_dict.keys() if update_dict[k] is not None
-    }
-
-    attribute_values = {
-        ":" + k: update_dict[k]
-        for k in update_dict.keys()
-        if update_dict[k] is not None
-    }
 
     condition_expression = "attribute_not_exists(#updated) OR #updated <= :updated"
 
     response = table.update_item(
         Key=key,
-        UpdateExpression=update_expression,
-        ConditionExpression=condition_expression,
-        ExpressionAttributeNames=attribute_names,
-        ExpressionAttributeValues=attribute_values,
         ReturnValues="UPDATED_NEW",
+        **build_update(
+            {k: v for k, v in update_dict.items() if v is not None},
+            condition=condition_expression,
+        ),
     )
     return response
 
@@ -244,6 +281,55 @@ def delete_field_item(table_name, key, attribute):
     return response
 
 
+def encode_cursor(last_evaluated_key):
+    """
+    opaque continuation token of a LastEvaluatedKey, None after the last page
+    """
+    if not last_evaluated_key:
+        return None
+
+    data = simplejson.dumps(last_evaluated_key, sort_keys=True, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """
+    ExclusiveStartKey of a continuation token, raises ValueError when it is not one
+    """
+    try:
+        key = simplejson.loads(
+            base64.urlsafe_b64decode(cursor.encode("ascii")), use_decimal=True
+        )
+    except (binascii.Error, UnicodeError, ValueError) as error:
+        raise ValueError("invalid cursor") from error
+
+    if not isinstance(key, dict):
+        raise ValueError("invalid cursor")
+
+    return key
+
+
+def get_projection(fields):
+    """
+    ProjectionExpression and ExpressionAttributeNames of a list of attribute paths,
+    like ["sk", "charge_l_status.shop_code"]
+    """
+    placeholders = {}
+    paths = []
+    for field in fields:
+        names = field.split(".")
+        for name in names:
+            placeholders.setdefault(name, f"#p{len(placeholders)}")
+        paths.append(".".join(placeholders[name] for name in names))
+
+    return {
+        "ProjectionExpression": ", ".join(paths),
+        "ExpressionAttributeNames": {
+            placeholder: name for name, placeholder in placeholders.items()
+        },
+    }
+
+
 def get_response(status_code, headers, body):
     """build success response"""
 
@@ -0,0 +1,87 @@
+"""
+versioned envelope of the kinesis records, the json of a record compressed when it
+is large. Records written before the envelope are json and read as they are.
+
+    NUL, version, codec, data
+
+a NUL byte never starts json, the version is ENVELOPE_VERSION and the codec one of
+CODECS
+"""
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b"\x00"
+ENVELOPE_VERSION = 1
+HEADER_SIZE = 3
+
+IDENTITY = 0
+ZLIB = 1
+ZSTD = 2
+CODECS = {"identity": IDENTITY, "zlib": ZLIB, "zstd": ZSTD}
+
+
+def compress(data, codec):
+    if codec == ZLIB:
+        return zlib.compress(data, 6)
+    if codec == ZSTD:
+        return zstandard.ZstdCompressor(level=3).compress(data)
+
+    return data
+
+
+def decompress(data, codec):
+    if codec == IDENTITY:
+        return data
+    if codec == ZLIB:
+        return zlib.decompress(data)
+    if codec == ZSTD and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == ZSTD:
+        raise ValueError("zstd record but zstandard is not installed")
+
+    raise ValueError(f"unknown envelope codec {codec}")
+
+
+def pack(data, codec="zlib", threshold=1024):
+    """
+    envelope of the json bytes of a record, compressed with codec when it has
+    threshold bytes or more and compressing makes it smaller. zstd falls back to
+    zlib without zstandard.
+    """
+    code = CODECS[codec]
+    if code == ZSTD and zstandard is None:
+        code = ZLIB
+
+    if code != IDENTITY and len(data) >= threshold:
+        compressed = compress(data, code)
+        if len(compressed) < len(data):
+            return MAGIC + bytes((ENVELOPE_VERSION, code)) + compressed
+
+    return MAGIC + bytes((ENVELOPE_VERSION, IDENTITY)) + data
+
+
+def is_packed(data):
+    return data[:1] == MAGIC
+
+
+def unpack(data):
+    """
+    json bytes of the data of a record, enveloped or not
+    """
+    if not is_packed(data):
+        return data
+    if len(data) < HEADER_SIZE:
+        raise ValueError("truncated envelope")
+
+    version, codec = data[1], data[2]
+    if version != ENVELOPE_VERSION:
+        raise ValueError(f"unknown envelope version {version}")
+
+    try:
+        return decompress(data[HEADER_SIZE:], codec)
+    except zlib.error as exc:
+        raise ValueError(f"invalid envelope data, {exc}") from exc
@@ -0,0 +1,178 @@
+"""
+run the records of a stream batch concurrently per work order
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from time import monotonic
+
+from aws_xray_sdk.core import xray_recorder
+from environs import Env
+
+from utils.batch import get_sequence_number
+from utils.metrics import TIMING
+from utils.prefetch import prefetch
+
+ENV = Env()
+MAX_WORKERS = int(ENV("BATCH_MAX_WORKERS", 10))
+# marks the threads of the pool
+WORKER = threading.local()
+POOL = None
+
+
+def get_work_order_key(record):
+    """
+    work order the decoded stream record belongs to, None if it can't be told
+    """
+    dynamodb = (record or {}).get("dynamodb", {})
+
+    for image in (dynamodb.get("NewImage") or {}, dynamodb.get("OldImage") or {}):
+        if image.get("work_order_key"):
+            return image["work_order_key"]
+        if image.get("sblu") and image.get("site_id"):
+            return f"{image['sblu']}#{image['site_id']}"
+        if isinstance(image.get("pk"), str):
+            return image["pk"].replace("workorder:", "", 1)
+
+    return None
+
+
+def get_event_type(record):
+    """
+    key attributes of the item a decoded stream record is about, the table name for
+    the pk/sk tables
+    """
+    dynamodb = (record or {}).get("dynamodb", {})
+    event_type = "".join(dynamodb.get("Keys", {}).keys())
+    if "pksk" in event_type:
+        return record.get("tableName", event_type)
+
+    return event_type or record.get("eventName", "unknown")
+
+
+def mark_worker():
+    WORKER.active = True
+
+
+def get_pool():
+    """
+    pool of BATCH_MAX_WORKERS threads kept across invocations, its threads keep the
+    boto3 resources they built (see utils.resources)
+    """
+    global POOL
+    if POOL is None:
+        POOL = ThreadPoolExecutor(max_workers=MAX_WORKERS, initializer=mark_worker)
+
+    return POOL
+
+
+def run_concurrently(func, items):
+    """
+    [func(item) for item in items] on the pool, the x-ray trace entity of the caller
+    is carried over to the workers. A call from a worker runs its items one after
+    the other, the pool is already busy with the call it is part of.
+    """
+    if MAX_WORKERS <= 1 or len(items) <= 1 or getattr(WORKER, "active", False):
+        return [func(item) for item in items]
+
+    trace_entity = xray_recorder.get_trace_entity()
+
+    def run(item):
+        if trace_entity:
+            xray_recorder.set_trace_entity(trace_entity)
+        else:
+            xray_recorder.clear_trace_entities()
+
+        return func(item)
+
+    return list(get_pool().map(run, items))
+
+
+def group_records(batch, decode, key, event_type=get_event_type):
+    """
+    decode the batch and group it by key, keeping the sequence order within a group
+    """
+    groups = {}
+
+    for record in batch.records:
+        decoded_record = None
+        start = monotonic()
+        with batch.guard(record):
+            decoded_record = decode(record)
+
+        if batch.failed:
+            break
+
+        if decoded_record is None:
+            continue
+
+        TIMING.add("decode", monotonic() - start, str(event_type(decoded_record)))
+
+        group_key = (
+            key(decoded_record)
+            or record.get("kinesis", {}).get("partitionKey")
+            or get_sequence_number(record)
+        )
+        groups.setdefault(group_key, []).append((record, decoded_record))
+
+    return list(groups.values())
+
+
+def process_by_work_order(
+    batch,
+    decode,
+    process,
+    key=get_work_order_key,
+    plan=None,
+    compact=None,
+    preload=None,
+    event_type=get_event_type,
+):
+    """
+    Decode every record of the batch and call process(decoded_record) for each one.
+
+    Records of different work orders run concurrently on a bounded thread pool while
+    records of the same work order run one after the other in sequence order. A
+    failure stops its own work order and is reported to the batch, records after
+    the lowest failed sequence number are skipped since lambda replays them.
+
+    boto3 resources are not thread safe, the tables and queues the workers use are
+    built for each thread by utils.resources.
+
+    When given, plan(decoded_record) lists the rpc lookups process will make for the
+    record, they are all fired before processing starts (see utils.prefetch).
+
+    When given, compact(groups) returns the groups worth processing, records it
+    leaves out are treated as processed.
+
+    When given, preload(decoded_records) returns a context manager entered around
+    processing, once the rpc lookups are fired, to read what the batch needs in bulk.
+
+    Decoding and processing are timed in utils.metrics.TIMING per event_type(record),
+    the key attributes of the item by default.
+
+    Returns the values returned by process.
+    """
+    groups = group_records(batch, decode, key, event_type)
+    if compact:
+        groups = compact(groups)
+
+    def process_group(group):
+        results = []
+        for record, decoded_record in group:
+            if batch.skip(record):
+                break
+            with batch.guard(record), TIMING.record(event_type(decoded_record)):
+                results.append(process(decoded_record))
+
+        return results
+
+    decoded_records = [decoded for group in groups for _, decoded in group]
+
+    with prefetch(decoded_records, plan):
+        with preload(decoded_records) if preload else nullcontext():
+            return [
+                result
+                for results in run_concurrently(process_group, groups)
+                for result in results
+            ]
@@ -0,0 +1,123 @@
+"""
+compile dynamodb update expressions, the expression of an attribute set is built once
+and reused for every record with the same attributes
+"""
+from collections import namedtuple
+from functools import lru_cache
+
+CompiledUpdate = namedtuple("CompiledUpdate", ["expression", "names", "values"])
+
+
+def is_alias_character(character):
+    return character == "_" or (character.isascii() and character.isalnum())
+
+
+def name_alias(name):
+    """
+    expression attribute name placeholder of an attribute, without the leading #.
+    Characters placeholders can not have are replaced by their code point.
+    """
+    if all(map(is_alias_character, name)):
+        return name
+
+    return "".join(c if is_alias_character(c) else f"_{ord(c):x}_" for c in name)
+
+
+def value_alias(path):
+    """
+    expression attribute value placeholder of a path, as conditions refer to it
+    """
+    return ":" + "_".join(name_alias(name) for name in path)
+
+
+def as_path(key):
+    return key if isinstance(key, tuple) else (key,)
+
+
+def unique(alias, seen):
+    """
+    alias, with a suffix when another name or path already has it
+    """
+    candidate = alias
+    suffix = 0
+    while candidate in seen:
+        suffix += 1
+        candidate = f"{alias}_{suffix}"
+    seen.add(candidate)
+
+    return candidate
+
+
+@lru_cache(maxsize=1024)
+def compile_update(set_keys, remove_keys=()):
+    """
+    UpdateExpression for SET set_keys and REMOVE remove_keys. A key is an attribute
+    name or a tuple of names, the path of a nested map attribute.
+
+    Returns the expression, the (placeholder, name) pairs and the value placeholders
+    in the order of set_keys. An attribute is aliased #name and a top level value
+    :name so conditions can refer to them. Names or paths whose aliases collide,
+    like "a-b" and "a_2d_b", get a suffix in the order they come.
+    """
+    set_paths = tuple(map(as_path, set_keys))
+    remove_paths = tuple(map(as_path, remove_keys))
+
+    names = {}
+    seen_names = set()
+    for path in set_paths + remove_paths:
+        for name in path:
+            if name not in names:
+                names[name] = unique("#" + name_alias(name), seen_names)
+
+    # top level values first, conditions refer to them
+    values = [None] * len(set_paths)
+    seen_values = set()
+    for top_level in (True, False):
+        for index, path in enumerate(set_paths):
+            if (len(path) == 1) == top_level:
+                values[index] = unique(value_alias(path), seen_values)
+
+    def placeholder(path):
+        return ".".join(names[name] for name in path)
+
+    clauses = []
+    if set_paths:
+        clauses.append(
+            "SET "
+            + ", ".join(
+                f"{placeholder(path)} = {value}"
+                for path, value in zip(set_paths, values)
+            )
+        )
+    if remove_paths:
+        clauses.append("REMOVE " + ", ".join(map(placeholder, remove_paths)))
+
+    return CompiledUpdate(
+        " ".join(clauses),
+        tuple((alias, name) for name, alias in names.items()),
+        tuple(values),
+    )
+
+
+def build_update(values, remove=(), condition=None):
+    """
+    update_item arguments that SET values and REMOVE remove.
+
+    values maps attribute names, or tuples of names for nested map attributes, to
+    their value. remove lists names or tuples of names. condition is passed through
+    as the ConditionExpression when given.
+    """
+    compiled = compile_update(tuple(values), tuple(remove))
+
+    update = {
+        "UpdateExpression": compiled.expression,
+        "ExpressionAttributeNames": dict(compiled.names),
+    }
+    if compiled.values:
+        update["ExpressionAttributeValues"] = dict(
+            zip(compiled.values, values.values())
+        )
+    if condition:
+        update["ConditionExpression"] = condition
+
+    return update
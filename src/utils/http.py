@@ -0,0 +1,147 @@
+"""
+api gateway bodies, read whether or not the api passed them base64 encoded, and
+written as json compressed for the clients accepting it
+"""
+import base64
+import gzip
+from decimal import Decimal
+
+import brotli
+import orjson
+import simplejson
+from environs import Env
+
+ENV = Env()
+# bodies shorter than this are not worth the compression
+COMPRESSION_THRESHOLD = ENV.int("RESPONSE_COMPRESSION_THRESHOLD", 1024)
+
+# x-amazon-apigateway-binary-media-types of the api, api gateway only decodes the
+# base64 body of a response for the clients accepting one of them
+BINARY_MEDIA_TYPES = ("application/json",)
+
+# content codings by preference, with the function compressing a body
+ENCODINGS = {
+    "br": lambda data: brotli.compress(data, quality=5),
+    "gzip": lambda data: gzip.compress(data, compresslevel=6),
+}
+
+
+def encode_decimal(value):
+    """
+    number of a Decimal, the float nearest to it is the one a client parses
+    """
+    if isinstance(value, Decimal):
+        if value == value.to_integral_value():
+            return int(value)
+        return float(value)
+
+    raise TypeError(f"{type(value).__name__} is not json serializable")
+
+
+def dumps(value):
+    """
+    json of a response value, Decimals of dynamodb items as numbers
+    """
+    try:
+        return orjson.dumps(value, default=encode_decimal).decode("utf-8")
+    except orjson.JSONEncodeError:
+        # integers over 64 bits
+        return simplejson.dumps(value)
+
+
+def get_header(event, name):
+    headers = event.get("headers") or {}
+    for header, value in headers.items():
+        if header.lower() == name:
+            return value or ""
+
+    return ""
+
+
+def get_body(event):
+    """
+    body of a request, api gateway passes the bodies of BINARY_MEDIA_TYPES base64
+    encoded
+    """
+    body = event.get("body")
+    if body and event.get("isBase64Encoded"):
+        return base64.b64decode(body).decode("utf-8")
+
+    return body
+
+
+def with_body(event):
+    """
+    event with its body decoded, for the validators reading event["body"]
+    """
+    if not event.get("isBase64Encoded"):
+        return event
+
+    return {**event, "body": get_body(event), "isBase64Encoded": False}
+
+
+def get_quality(parameters):
+    for parameter in parameters:
+        name, _, value = parameter.strip().partition("=")
+        if name.strip() == "q":
+            try:
+                return float(value)
+            except ValueError:
+                return 0.0
+
+    return 1.0
+
+
+def get_encoding(event):
+    """
+    content coding of the response, the one of ENCODINGS the client prefers out of
+    those its Accept-Encoding allows, None when none of them is
+    """
+    qualities = {}
+    for coding in get_header(event, "accept-encoding").split(","):
+        name, *parameters = coding.split(";")
+        qualities[name.strip().lower()] = get_quality(parameters)
+
+    accepted = [
+        (qualities.get(encoding, qualities.get("*", 0.0)), -index, encoding)
+        for index, encoding in enumerate(ENCODINGS)
+    ]
+    quality, _, encoding = max(accepted)
+
+    return encoding if quality > 0 else None
+
+
+def accepts_binary(event):
+    """
+    True when the first media type of the Accept header is one of
+    BINARY_MEDIA_TYPES, api gateway only looks at that one to decode a base64 body
+    """
+    media_type = get_header(event, "accept").split(",")[0].split(";")[0]
+
+    return media_type.strip().lower() in BINARY_MEDIA_TYPES
+
+
+def compress(event, response):
+    """
+    response with its body compressed, when the client accepts one of ENCODINGS and
+    api gateway decodes the base64 body for it, and the body is COMPRESSION_THRESHOLD
+    bytes or more
+    """
+    body = response.get("body")
+    if not isinstance(body, str) or response.get("isBase64Encoded"):
+        return response
+
+    data = body.encode("utf-8")
+    encoding = get_encoding(event)
+    if len(data) < COMPRESSION_THRESHOLD or not encoding or not accepts_binary(event):
+        return response
+
+    headers = dict(response.get("headers") or {})
+    headers.update({"Content-Encoding": encoding, "Vary": "Accept-Encoding"})
+
+    return {
+        **response,
+        "headers": headers,
+        "body": base64.b64encode(ENCODINGS[encoding](data)).decode("ascii"),
+        "isBase64Encoded": True,
+    }
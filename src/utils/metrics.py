@@ -0,0 +1,631 @@
+"""
+cloudwatch metrics written to the lambda log in embedded metric format
+"""
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from time import monotonic
+
+from aws_lambda_powertools.metrics import MetricUnit, single_metric
+from boto3.dynamodb.conditions import AttributeBase, ConditionBase
+from botocore.client import BaseClient
+from environs import Env
+from rpp_lib.logs import LOGGER
+
+ENV = Env()
+NAMESPACE = ENV("METRICS_NAMESPACE", "rpp-workorder")
+STAGE_METRICS = ENV.bool("STAGE_METRICS", True)
+CAPACITY_METRICS = ENV.bool("CAPACITY_METRICS", False)
+HOT_KEY_METRICS = ENV.bool("HOT_KEY_METRICS", True)
+HOT_KEY_CAPACITY = ENV.int("HOT_KEY_CAPACITY", 64)
+HOT_KEY_TOP = ENV.int("HOT_KEY_TOP", 10)
+HOT_KEY_INTERVAL = ENV.int("HOT_KEY_INTERVAL", 60)
+
+# time of a record spent in the handler itself, outside of the named stages
+PROCESS_STAGE = "process"
+
+# dynamodb operations taking ReturnConsumedCapacity, and those of them reading
+CAPACITY_OPERATIONS = {
+    "BatchGetItem",
+    "BatchWriteItem",
+    "DeleteItem",
+    "GetItem",
+    "PutItem",
+    "Query",
+    "Scan",
+    "TransactGetItems",
+    "TransactWriteItems",
+    "UpdateItem",
+}
+READ_OPERATIONS = {"BatchGetItem", "GetItem", "Query", "Scan", "TransactGetItems"}
+
+# index of the capacity consumed by the table itself
+TABLE_INDEX = "table"
+
+WRITE_OPERATIONS = {
+    "BatchWriteItem",
+    "DeleteItem",
+    "PutItem",
+    "TransactWriteItems",
+    "UpdateItem",
+}
+
+# key attributes of the tables, the first one is enough to tell an item's table
+KEY_ATTRIBUTES = (("pk", "sk"), ("work_order_key", "site_id"), ("key",))
+
+
+def add_count(name, value, **dimensions):
+    """
+    publish a count metric right away, dimensions are given as name=value
+    """
+    with single_metric(
+        name=name, unit=MetricUnit.Count, value=value, namespace=NAMESPACE
+    ) as metric:
+        for dimension, dimension_value in dimensions.items():
+            metric.add_dimension(name=dimension, value=str(dimension_value))
+
+
+def add_milliseconds(name, value, **dimensions):
+    """
+    publish a milliseconds metric right away, dimensions are given as name=value
+    """
+    with single_metric(
+        name=name, unit=MetricUnit.Milliseconds, value=value, namespace=NAMESPACE
+    ) as metric:
+        for dimension, dimension_value in dimensions.items():
+            metric.add_dimension(name=dimension, value=str(dimension_value))
+
+
+class StageTiming:
+    """
+    Time spent in each stage (decode, validate, rpc, dynamodb, sqs, es...) by the
+    records of an invocation, per event type.
+
+    Stages nest, a stage only counts its own time and not the time of the stages
+    opened inside of it, so the stages of a record add up to its processing time.
+    Records run on several threads, the record a thread is on is kept per thread.
+    Stages opened outside of a record, by the rpc prefetch workers for instance,
+    are not counted.
+    """
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.records = defaultdict(int)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def reset(self):
+        with self.lock:
+            self.totals.clear()
+            self.records.clear()
+
+    def add(self, stage, seconds, event_type):
+        with self.lock:
+            self.totals[(event_type, stage)] += seconds
+
+    @property
+    def stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    @contextmanager
+    def stage(self, name, event_type=None):
+        """
+        time the block as stage name of the record the thread is on, or of
+        event_type when given
+        """
+        stack = self.stack
+        if event_type is None and not stack:
+            yield
+            return
+
+        # [stage, event type, start, time of the stages nested in it]
+        entry = [name, event_type or stack[-1][1], monotonic(), 0.0]
+        stack.append(entry)
+        try:
+            yield
+        finally:
+            stack.pop()
+            elapsed = monotonic() - entry[2]
+            self.add(name, elapsed - entry[3], entry[1])
+            if stack:
+                stack[-1][3] += elapsed
+
+    @contextmanager
+    def record(self, event_type):
+        """
+        time the processing of one record, the stages opened in the block are
+        counted for event_type
+        """
+        with self.lock:
+            self.records[str(event_type)] += 1
+
+        with self.stage(PROCESS_STAGE, str(event_type)):
+            yield
+
+    def summary(self):
+        """
+        {event type: {stage: milliseconds}}
+        """
+        with self.lock:
+            totals = dict(self.totals)
+
+        summary = defaultdict(dict)
+        for (event_type, stage), seconds in sorted(totals.items()):
+            summary[event_type][stage] = round(seconds * 1000, 3)
+
+        return dict(summary)
+
+    def publish(self, function):
+        """
+        log the summary and publish a StageTime metric per event type and stage,
+        with a Records count per event type
+        """
+        summary = self.summary()
+        if not summary:
+            return
+
+        LOGGER.info(
+            {
+                "message": "stage timings",
+                "function": function,
+                "records": dict(self.records),
+                "stages": summary,
+            }
+        )
+
+        if not STAGE_METRICS:
+            return
+
+        for event_type, stages in summary.items():
+            for stage, milliseconds in stages.items():
+                add_milliseconds(
+                    "StageTime",
+                    milliseconds,
+                    function=function,
+                    event_type=event_type,
+                    stage=stage,
+                )
+            if self.records.get(event_type):
+                add_count(
+                    "Records",
+                    self.records[event_type],
+                    function=function,
+                    event_type=event_type,
+                )
+
+
+def get_value(value):
+    """
+    python value of a key attribute, given plain or as dynamodb json
+    """
+    if isinstance(value, dict) and len(value) == 1:
+        return next(iter(value.values()))
+
+    return value
+
+
+def get_condition_value(condition, name):
+    """
+    value attribute name is compared with in a key condition built with Key()
+    """
+    if not isinstance(condition, ConditionBase):
+        return None
+
+    values = condition.get_expression()["values"]
+    if len(values) > 1 and isinstance(values[0], AttributeBase):
+        return values[1] if values[0].name == name else None
+
+    for value in values:
+        found = get_condition_value(value, name)
+        if found is not None:
+            return found
+
+    return None
+
+
+def get_entity_type(sk):
+    """
+    entity type of an item of a pk/sk table, its sk up to the first # or :
+    """
+    if not isinstance(sk, str):
+        return "item"
+
+    for separator in ("#", ":"):
+        sk = sk.split(separator, 1)[0]
+
+    return sk or "item"
+
+
+def get_request_keys(operation, api_params):
+    """
+    {table name: [key]} of the items a dynamodb call reads or writes, put requests
+    give the whole item in place of the key
+    """
+    if operation in ("GetItem", "DeleteItem", "UpdateItem"):
+        return {api_params["TableName"]: [api_params["Key"]]}
+    if operation == "PutItem":
+        return {api_params["TableName"]: [api_params["Item"]]}
+    if operation == "BatchGetItem":
+        return {
+            table: list(request["Keys"])
+            for table, request in api_params["RequestItems"].items()
+        }
+    if operation == "BatchWriteItem":
+        return {
+            table: [
+                request.get("PutRequest", {}).get("Item")
+                or request.get("DeleteRequest", {}).get("Key")
+                or {}
+                for request in requests
+            ]
+            for table, requests in api_params["RequestItems"].items()
+        }
+    if operation == "TransactWriteItems":
+        keys = {}
+        for transact_item in api_params["TransactItems"]:
+            for action, request in transact_item.items():
+                if action != "ConditionCheck":
+                    keys.setdefault(request["TableName"], []).append(
+                        request.get("Key") or request.get("Item") or {}
+                    )
+        return keys
+
+    return {}
+
+
+def get_entity_types(operation, api_params):
+    """
+    {table name: entity type} of the items a dynamodb call is about, "mixed" when a
+    batch spans entity types
+    """
+    if operation == "Query":
+        sks = {
+            api_params["TableName"]: [
+                get_condition_value(api_params.get("KeyConditionExpression"), "sk")
+            ]
+        }
+    else:
+        sks = {
+            table: [get_value(key.get("sk")) for key in keys]
+            for table, keys in get_request_keys(operation, api_params).items()
+        }
+
+    if not sks:
+        return {api_params.get("TableName"): operation.lower()}
+
+    entity_types = {}
+    for table, table_sks in sks.items():
+        types = {get_entity_type(sk) for sk in table_sks}
+        entity_types[table] = types.pop() if len(types) == 1 else "mixed"
+
+    return entity_types
+
+
+def get_key_string(key):
+    """
+    pk|sk of a key or item, the key attributes of the tables not keyed by pk/sk are
+    known by name
+    """
+    for names in KEY_ATTRIBUTES:
+        if names[0] in key:
+            return "|".join(str(get_value(key[name])) for name in names if name in key)
+
+    if 0 < len(key) <= 2:
+        return "|".join(str(get_value(key[name])) for name in sorted(key))
+
+    return None
+
+
+class ConsumedCapacity:
+    """
+    Read and write capacity units consumed by the dynamodb calls of an invocation,
+    per table, index and entity type. The units a call consumes on a global
+    secondary index are counted for that index, the rest for the table.
+    """
+
+    def __init__(self):
+        self.units = defaultdict(lambda: [0.0, 0.0])
+        self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock:
+            self.units.clear()
+
+    def add(self, operation, api_params, response):
+        consumed = response.get("ConsumedCapacity") or []
+        if isinstance(consumed, dict):
+            consumed = [consumed]
+
+        try:
+            entity_types = get_entity_types(operation, api_params)
+        except (AttributeError, KeyError, TypeError):
+            entity_types = {}
+
+        side = 0 if operation in READ_OPERATIONS else 1
+        with self.lock:
+            for table_capacity in consumed:
+                table = table_capacity["TableName"]
+                entity_type = entity_types.get(table, operation.lower())
+                indexes = table_capacity.get("GlobalSecondaryIndexes") or {}
+                for index, index_capacity in indexes.items():
+                    units = index_capacity.get("CapacityUnits", 0)
+                    self.units[(table, index, entity_type)][side] += float(units)
+
+                units = table_capacity.get("Table", {}).get(
+                    "CapacityUnits",
+                    table_capacity.get("CapacityUnits", 0)
+                    - sum(i.get("CapacityUnits", 0) for i in indexes.values()),
+                )
+                self.units[(table, TABLE_INDEX, entity_type)][side] += float(units)
+
+    def summary(self):
+        """
+        [{"table", "index", "entity_type", "read", "write"}]
+        """
+        with self.lock:
+            units = dict(self.units)
+
+        return [
+            {
+                "table": table,
+                "index": index,
+                "entity_type": entity_type,
+                "read": round(read, 3),
+                "write": round(write, 3),
+            }
+            for (table, index, entity_type), (read, write) in sorted(units.items())
+        ]
+
+    def publish(self, function):
+        """
+        log the summary and publish ConsumedReadCapacity and ConsumedWriteCapacity
+        metrics per table, index and entity type
+        """
+        summary = self.summary()
+        if not summary:
+            return
+
+        LOGGER.info(
+            {"message": "consumed capacity", "function": function, "units": summary}
+        )
+
+        for units in summary:
+            dimensions = {
+                "function": function,
+                "table": units["table"],
+                "index": units["index"],
+                "entity_type": units["entity_type"],
+            }
+            if units["read"]:
+                add_count("ConsumedReadCapacity", units["read"], **dimensions)
+            if units["write"]:
+                add_count("ConsumedWriteCapacity", units["write"], **dimensions)
+
+
+class HotKeys:
+    """
+    Space-saving sketch of the keys written most by this container.
+
+    At most capacity keys are counted. A key that is not counted takes the place of
+    the least counted one and starts from its count, which is kept as the error of
+    the new count. A count is never under the real one and over it by at most its
+    error, any key written more than total / capacity times is sure to be counted.
+    Counting a write is a dict lookup, a full scan of the counters only happens when
+    a key is replaced.
+
+    Every interval seconds the top keys and their write rates are published and
+    counting starts over.
+    """
+
+    def __init__(self, capacity=HOT_KEY_CAPACITY, top=HOT_KEY_TOP):
+        self.capacity = capacity
+        self.top = top
+        self.counters = {}
+        self.total = 0
+        self.since = monotonic()
+        self.lock = threading.Lock()
+
+    def add(self, table, key):
+        key = (table, key)
+        with self.lock:
+            self.total += 1
+            counter = self.counters.get(key)
+            if counter:
+                counter[0] += 1
+            elif len(self.counters) < self.capacity:
+                self.counters[key] = [1, 0]
+            else:
+                least = min(self.counters, key=lambda k: self.counters[k][0])
+                count = self.counters.pop(least)[0]
+                self.counters[key] = [count + 1, count]
+
+    def add_request(self, operation, api_params):
+        for table, keys in get_request_keys(operation, api_params).items():
+            for key in keys:
+                key_string = get_key_string(key)
+                if key_string:
+                    self.add(table, key_string)
+
+    def top_keys(self):
+        """
+        [(table, key, count, error)] of the keys counted most
+        """
+        with self.lock:
+            counters = list(self.counters.items())
+
+        counters.sort(key=lambda counter: counter[1][0], reverse=True)
+
+        return [
+            (table, key, count, error)
+            for (table, key), (count, error) in counters[: self.top]
+        ]
+
+    def publish(self, function, interval=HOT_KEY_INTERVAL):
+        """
+        log the top keys and publish the write rate of the hottest key of each table
+        as HotKeyWriteRate, once interval seconds went by since counting started
+        """
+        elapsed = monotonic() - self.since
+        if elapsed < interval or not self.total:
+            return
+
+        top_keys = self.top_keys()
+        total = self.total
+        with self.lock:
+            self.counters.clear()
+            self.total = 0
+            self.since = monotonic()
+
+        LOGGER.info(
+            {
+                "message": "hot keys",
+                "function": function,
+                "seconds": round(elapsed, 3),
+                "writes": total,
+                "keys": [
+                    {
+                        "table": table,
+                        "key": key,
+                        "writes": count,
+                        "error": error,
+                        "writes_per_second": round(count / elapsed, 3),
+                    }
+                    for table, key, count, error in top_keys
+                ],
+            }
+        )
+
+        hottest = {}
+        for table, _, count, _ in top_keys:
+            hottest.setdefault(table, count)
+        for table, count in hottest.items():
+            with single_metric(
+                name="HotKeyWriteRate",
+                unit=MetricUnit.CountPerSecond,
+                value=count / elapsed,
+                namespace=NAMESPACE,
+            ) as metric:
+                metric.add_dimension(name="function", value=function)
+                metric.add_dimension(name="table", value=table)
+
+
+class Counts:
+    """
+    counts of an invocation, published as Count metrics with the function dimension
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock:
+            self.counts.clear()
+
+    def add(self, name, value=1):
+        with self.lock:
+            self.counts[name] += value
+
+    def publish(self, function):
+        with self.lock:
+            counts = dict(self.counts)
+
+        for name, value in sorted(counts.items()):
+            add_count(name, value, function=function)
+
+
+# a lambda container runs one invocation at a time
+TIMING = StageTiming()
+CAPACITY = ConsumedCapacity()
+COUNTS = Counts()
+# counts over the invocations of the container
+HOT_KEYS = HotKeys()
+
+
+@contextmanager
+def invocation(function):
+    """
+    collect the stage timings, consumed capacity and counts of one invocation of
+    function and publish them when the block exits, along with the hot keys when
+    their interval is up
+    """
+    TIMING.reset()
+    CAPACITY.reset()
+    COUNTS.reset()
+    try:
+        yield
+    finally:
+        for collector in (TIMING, CAPACITY, COUNTS, HOT_KEYS):
+            try:
+                collector.publish(function)
+            except Exception as exc:
+                # metrics are not worth failing a batch over
+                LOGGER.warning(
+                    {"message": "unable to publish metrics", "reason": str(exc)}
+                )
+
+
+def timed(function):
+    """
+    decorator running a handler in an invocation of function
+    """
+
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            with invocation(function):
+                return handler(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def patch_aws_calls():
+    """
+    time every aws api call as a stage named after its service, dynamodb, sqs,
+    kinesis... Like the x-ray patch_all this patches the botocore client class, so
+    clients built before and after the call are timed.
+
+    With CAPACITY_METRICS the dynamodb calls also ask for their consumed capacity,
+    per index, and add it to CAPACITY. With HOT_KEY_METRICS the keys of the dynamodb
+    writes are counted in HOT_KEYS.
+    """
+    make_api_call = BaseClient._make_api_call
+    if getattr(make_api_call, "stage_timed", False):
+        return
+
+    @wraps(make_api_call)
+    def timed_api_call(client, operation_name, api_params):
+        service_name = client.meta.service_model.service_name
+        account = (
+            CAPACITY_METRICS
+            and service_name == "dynamodb"
+            and operation_name in CAPACITY_OPERATIONS
+        )
+        if (
+            HOT_KEY_METRICS
+            and service_name == "dynamodb"
+            and operation_name in WRITE_OPERATIONS
+        ):
+            try:
+                HOT_KEYS.add_request(operation_name, api_params)
+            except (AttributeError, KeyError, TypeError) as exc:
+                LOGGER.debug({"message": "unable to count keys", "reason": str(exc)})
+
+        if account and "ReturnConsumedCapacity" not in api_params:
+            api_params = dict(api_params, ReturnConsumedCapacity="INDEXES")
+
+        with TIMING.stage(service_name):
+            response = make_api_call(client, operation_name, api_params)
+
+        if account:
+            CAPACITY.add(operation_name, api_params, response)
+
+        return response
+
+    timed_api_call.stage_timed = True
+    BaseClient._make_api_call = timed_api_call
@@ -0,0 +1,123 @@
+"""
+kinesis partition keys of the dynamodb stream records republished by the bridges,
+the same key for every change of an item so its changes stay on one shard in order
+"""
+import hashlib
+import json
+from collections import Counter
+
+from environs import Env
+from rpp_lib.logs import LOGGER
+
+from utils.metrics import COUNTS
+
+ENV = Env()
+# partition keys spread over several shards, their changes are only kept in order
+# for each item
+HOT_PARTITION_KEYS = frozenset(ENV.list("HOT_PARTITION_KEYS", []))
+# hash keys a hot partition key is spread over
+HOT_KEY_SPREAD = ENV.int("HOT_KEY_SPREAD", 4)
+# keys of a batch named in its distribution report
+PARTITION_REPORT_TOP = ENV.int("PARTITION_REPORT_TOP", 5)
+
+# partition keys are up to 256 characters
+MAX_PARTITION_KEY = 256
+
+
+def get_image_value(image, name):
+    value = (image or {}).get(name)
+    if isinstance(value, dict):
+        value = next(iter(value.values()), None)
+    if value is None or value == "":
+        return None
+
+    return str(value)
+
+
+def get_keys_string(keys):
+    """
+    name=value of the key attributes of a Keys block in dynamodb json, sorted by name
+    """
+    return "&".join(
+        f"{name}={get_image_value(keys, name)}" for name in sorted(keys or {})
+    )
+
+
+def hash_key(text):
+    """
+    md5 of text, the hash kinesis maps partition keys to shards with
+    """
+    return hashlib.md5(text.encode("utf-8"), usedforsecurity=False).hexdigest()
+
+
+def get_partition_key(record, attribute):
+    """
+    partition key of a dynamodb stream record, the attribute of its new or old image
+    or of its Keys, and when none has it a key derived from the Keys block. Records
+    without keys at all go by the hash of their content, the same on a retry.
+    """
+    dynamodb = record.get("dynamodb", {})
+    for name in ("NewImage", "OldImage", "Keys"):
+        value = get_image_value(dynamodb.get(name), attribute)
+        if value is not None:
+            return value
+
+    COUNTS.add("DerivedPartitionKeys")
+    keys = get_keys_string(dynamodb.get("Keys"))
+    if not keys:
+        keys = hash_key(json.dumps(record, sort_keys=True, default=str))
+    if len(keys) > MAX_PARTITION_KEY:
+        keys = hash_key(keys)
+
+    return keys
+
+
+def get_explicit_hash_key(record, partition_key, hot_keys=HOT_PARTITION_KEYS):
+    """
+    explicit hash key of a record of a hot partition key, one of HOT_KEY_SPREAD
+    picked by the Keys of its item, None for the other keys, which kinesis hashes
+    """
+    if partition_key not in hot_keys:
+        return None
+
+    keys = get_keys_string(record.get("dynamodb", {}).get("Keys"))
+    slot = int(hash_key(keys), 16) % max(HOT_KEY_SPREAD, 1)
+    COUNTS.add("BalancedRecords")
+
+    return str(int(hash_key(f"{partition_key}#{slot}"), 16))
+
+
+def with_hash_key(entry, record):
+    """
+    put_records entry with the explicit hash key of the record, when it has one
+    """
+    explicit_hash_key = get_explicit_hash_key(record, entry["PartitionKey"])
+    if explicit_hash_key is None:
+        return entry
+
+    return dict(entry, ExplicitHashKey=explicit_hash_key)
+
+
+def report_distribution(entries, stream=None, top=PARTITION_REPORT_TOP):
+    """
+    log how the records of a batch spread over partition keys, the busiest keys and
+    the share of the batch they have
+    """
+    if not entries:
+        return
+
+    counts = Counter(entry["PartitionKey"] for entry in entries)
+    records = len(entries)
+    LOGGER.info(
+        {
+            "message": "partition key distribution",
+            "stream": stream,
+            "records": records,
+            "keys": len(counts),
+            "balanced": sum(1 for entry in entries if "ExplicitHashKey" in entry),
+            "top": [
+                {"key": key, "records": count, "share": round(count / records, 3)}
+                for key, count in counts.most_common(top)
+            ],
+        }
+    )
@@ -0,0 +1,100 @@
+"""
+fire the rpc lookups of a stream batch ahead of processing it
+"""
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from aws_xray_sdk.core import xray_recorder
+from environs import Env
+from rpp_lib.logs import LOGGER
+
+from utils.metrics import TIMING
+
+ENV = Env()
+MAX_IN_FLIGHT = int(ENV("RPC_MAX_IN_FLIGHT", 16))
+
+# futures of the batch being processed, a lambda container runs one batch at a time
+PREFETCHED = {}
+
+
+def rpc(func, *args, **kwargs):
+    """
+    a planned call of func(*args, **kwargs)
+    """
+    return func, args, kwargs
+
+
+def get_call_key(func, args, kwargs):
+    return func, args, tuple(sorted(kwargs.items()))
+
+
+def call(func, *args, **kwargs):
+    """
+    result of func(*args, **kwargs), read from the prefetched future when the call
+    was planned and made inline otherwise. Errors of a prefetched call are raised here
+    just like an inline call would raise them.
+    """
+    future = PREFETCHED.get(get_call_key(func, args, kwargs))
+
+    with TIMING.stage("rpc"):
+        if future is None:
+            return func(*args, **kwargs)
+
+        return future.result()
+
+
+def plan_calls(records, plan):
+    """
+    unique calls plan(record) asks for over the records
+    """
+    calls = {}
+
+    for record in records:
+        try:
+            planned = plan(record)
+        except (KeyError, TypeError, AttributeError) as exc:
+            # the record is looked up inline, processing reports what is wrong with it
+            LOGGER.debug({"message": "unable to plan rpc calls", "reason": str(exc)})
+            continue
+
+        for func, args, kwargs in planned:
+            calls.setdefault(get_call_key(func, args, kwargs), (func, args, kwargs))
+
+    return calls
+
+
+@contextmanager
+def prefetch(records, plan=None):
+    """
+    Fire the rpc calls plan(record) returns for every record on a thread pool of at
+    most RPC_MAX_IN_FLIGHT workers, call() reads their results while the block runs.
+
+    plan returns a list of rpc(func, *args, **kwargs), the functions are called as
+    given so a stub rpc can be planned in their place.
+    """
+    calls = plan_calls(records, plan) if plan else {}
+
+    if not calls:
+        yield
+        return
+
+    trace_entity = xray_recorder.get_trace_entity()
+
+    def run(func, args, kwargs):
+        if trace_entity:
+            xray_recorder.set_trace_entity(trace_entity)
+
+        return func(*args, **kwargs)
+
+    LOGGER.debug({"message": "prefetching rpc calls", "count": len(calls)})
+
+    pool = ThreadPoolExecutor(max_workers=min(MAX_IN_FLIGHT, len(calls)))
+    try:
+        PREFETCHED.update(
+            {key: pool.submit(run, *planned) for key, planned in calls.items()}
+        )
+        yield
+    finally:
+        for key in calls:
+            PREFETCHED.pop(key, None)
+        pool.shutdown(wait=False, cancel_futures=True)
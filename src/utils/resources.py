@@ -0,0 +1,58 @@
+"""
+boto3 resources of the modules that run on the threads of utils.executor. Resources
+are not thread safe, unlike clients, so every thread gets its own, built from its
+own session the first time the thread uses it.
+"""
+import threading
+
+import boto3
+
+
+class ThreadLocal:
+    """
+    proxy to an object factory() builds once for each thread
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._local = threading.local()
+
+    def get(self):
+        instance = getattr(self._local, "instance", None)
+        if instance is None:
+            instance = self._local.instance = self._factory()
+
+        return instance
+
+    def __getattr__(self, name):
+        if name in ("_factory", "_local"):
+            raise AttributeError(name)
+
+        return getattr(self.get(), name)
+
+
+def resource(service_name, **kwargs):
+    """
+    boto3 resource of each thread
+    """
+    return ThreadLocal(lambda: boto3.Session().resource(service_name, **kwargs))
+
+
+DYNAMODB = resource("dynamodb")
+SQS = resource("sqs")
+
+
+def table(name):
+    """
+    dynamodb Table of each thread
+    """
+    return ThreadLocal(lambda: DYNAMODB.Table(name))
+
+
+def queue(name):
+    """
+    sqs Queue of each thread, its url is looked up once
+    """
+    url = SQS.get_queue_by_name(QueueName=name).url
+
+    return ThreadLocal(lambda: SQS.Queue(url))
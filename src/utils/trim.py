@@ -0,0 +1,74 @@
+"""
+trimming profiles of the dynamodb stream records republished to kinesis, what the
+consumers of a stream read of a record and nothing more
+
+A profile has
+    old_image   "always", "remove" to keep the OldImage of REMOVE records only, the
+                image a consumer deletes by, or "never"
+    drop        attributes left out of both images
+
+Keys, eventName and the other fields of a record are always kept, the event source
+mapping filters of the consumers match on them. Every consumer of a stream states
+the profile it needs next to its handler, a stream is trimmed with a profile that
+has what all of them read.
+"""
+from environs import Env
+from rpp_lib.logs import LOGGER
+from voluptuous import Any
+
+ENV = Env()
+
+# attributes of the rpp-recon-work-order items only there as keys of its indexes,
+# copies of other attributes
+RECON_INDEX_KEYS = (
+    "conditions_vin",
+    "conditions_updated",
+    "damage_work_order",
+    "damage_key",
+)
+
+PROFILES = {
+    # every attribute, the profile of streams read outside of rpp-workorder
+    "full": {"old_image": "always", "drop": ()},
+    # the rpp-recon-work-order stream without its index keys
+    "recon": {"old_image": "always", "drop": RECON_INDEX_KEYS},
+    # what repair_tracker_clocking reads of the rpp-recon-work-order stream
+    "recon_clocking": {"old_image": "remove", "drop": RECON_INDEX_KEYS},
+}
+
+TRIM_PROFILE = ENV("TRIM_PROFILE", "full", validate=Any(*PROFILES))
+
+
+def trim_image(image, drop):
+    if not drop:
+        return image
+
+    return {name: value for name, value in image.items() if name not in drop}
+
+
+def trim_record(record, profile=TRIM_PROFILE):
+    """
+    copy of a dynamodb stream record with what profile leaves of its images, the
+    record itself is left as it is
+    """
+    spec = PROFILES[profile]
+    dynamodb = record.get("dynamodb")
+    if not dynamodb or spec == PROFILES["full"]:
+        return record
+
+    trimmed = dict(dynamodb)
+    for name in ("NewImage", "OldImage"):
+        if name in trimmed:
+            trimmed[name] = trim_image(trimmed[name], spec["drop"])
+
+    keep_old_image = spec["old_image"] == "always" or (
+        spec["old_image"] == "remove" and record.get("eventName") == "REMOVE"
+    )
+    if not keep_old_image:
+        trimmed.pop("OldImage", None)
+
+    LOGGER.debug(
+        {"message": "record trimmed", "profile": profile, "keys": dynamodb.get("Keys")}
+    )
+
+    return dict(record, dynamodb=trimmed)
@@ -1,6 +1,6 @@
 from decimal import Decimal
 
-from voluptuous import REMOVE_EXTRA, All, Any, NotIn, Optional, Required, Schema, In, Length
+from voluptuous import REMOVE_EXTRA, All, Any, Match, NotIn, Optional, Required, Schema, In, Length
 from voluptuous.error import Invalid
 from voluptuous.schema_builder import ALLOW_EXTRA
 from utils.constants import COMPLETE_CR, INCOMPLETE_CR
@@ -518,6 +518,34 @@ def get_work_order_request():
     return schema
 
 
+def get_work_orders_request(max_work_orders):
+    def is_bounded(value):
+        count = len(value.get("work_order_keys", [])) + len(value.get("work_orders", []))
+        if not count:
+            raise Invalid("work_order_keys or work_orders are required")
+        if count > max_work_orders:
+            raise Invalid(f"at most {max_work_orders} work orders a request")
+        return value
+
+    schema = Schema(
+        All(
+            {
+                Optional("work_order_keys", default=[]): [Match(r"^[^#]+#[^#]+$")],
+                Optional("work_orders", default=[]): [
+                    {
+                        Required("site_id"): str,
+                        Required("work_order_number"): str,
+                    }
+                ],
+            },
+            is_bounded,
+        ),
+        extra=REMOVE_EXTRA,
+    )
+
+    return schema
+
+
 def get_labor_category():
     schema = Schema(
         {
@@ -1308,6 +1336,11 @@ def validate_work_order_request(event):
     return request_validator(event)
 
 
+def validate_work_orders_request(body, max_work_orders):
+    request_validator = get_work_orders_request(max_work_orders)
+    return request_validator(body)
+
+
 def valid_labor_category_request(event):
     request_validator = get_labor_category()
     return request_validator(event)
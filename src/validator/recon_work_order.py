@@ -2,8 +2,20 @@
 File for handling validation for recon_work_order events
 """
 import json
-from voluptuous import REMOVE_EXTRA, ALLOW_EXTRA, All, Any, Schema, Required, Optional, DefaultTo
+from voluptuous import REMOVE_EXTRA, ALLOW_EXTRA, All, Any, Length, Range, Schema, Required, Optional, DefaultTo
 from decimal import Decimal
+from utils.dynamodb import decode_cursor
+
+# items of a page of get_labors or an index find
+MAX_PAGE_SIZE = 1000
+
+PAGE = {
+    Optional("page_size"): All(int, Range(min=1, max=MAX_PAGE_SIZE)),
+    Optional("cursor"): All(str, decode_cursor, msg="invalid cursor"),
+    Optional("fields"): All([All(str, Length(min=1))], Length(min=1)),
+    # every page in one answer, for requests without a page_size or a cursor
+    Optional("all_pages"): bool,
+}
 
 
 def find_validator():
@@ -21,6 +33,7 @@ def find_validator():
                 extra=ALLOW_EXTRA
             ),
             Optional("index"): All(str),
+            **PAGE,
         },
         extra=REMOVE_EXTRA,
     )
@@ -127,6 +140,7 @@ def get_primary_key():
     return Schema(
         {
             Required("pk"): All(str),
+            **PAGE,
         },
         extra=REMOVE_EXTRA,
     )
@@ -240,3 +254,42 @@ def get_damage_request_validator():
 def validate_workorder_damage(event):
     validator = get_damage_request_validator()
     return validator(event)
+
+
+def get_damages_request_validator():
+    return Schema(
+        {
+            Required("httpMethod", msg="not a valid APIGW request"): All(
+                "POST", msg="expected a POST request"
+            ),
+            Required("body"): All(
+                DefaultTo("{}"),
+                lambda v: json.loads(v),
+                Schema(
+                    {
+                        Required("site_id"): Any(str),
+                        Required("work_order_number"): Any(str),
+                        Required("damages"): All(
+                            [
+                                Schema(
+                                    {
+                                        Required("item_code"): Any(str),
+                                        Required("damage"): Any(str)
+                                    },
+                                    extra=REMOVE_EXTRA
+                                )
+                            ],
+                            Length(min=1, max=100)
+                        )
+                    },
+                    extra=REMOVE_EXTRA
+                ),
+            ),
+        },
+        extra=ALLOW_EXTRA,
+    )
+
+
+def validate_workorder_damages(event):
+    validator = get_damages_request_validator()
+    return validator(event)
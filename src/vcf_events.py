@@ -4,7 +4,6 @@
 
 from decimal import Decimal
 
-import boto3
 from botocore.exceptions import ClientError
 from dateutil import parser
 from environs import Env
@@ -18,10 +17,10 @@ from validation import (
     valid_vcf_event_completed,
     valid_vcf_event_created,
 )
+from utils.resources import table
 
 ENV = Env()
-DYNAMO = boto3.resource("dynamodb")
-CATEGORY_TABLE = DYNAMO.Table(name=ENV("CATEGORY_TABLE", validate=Any(str)))
+CATEGORY_TABLE = table(ENV("CATEGORY_TABLE", validate=Any(str)))
 
 AD_HOC_DAMAGE = (
     ("MECH", "AP"),
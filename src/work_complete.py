@@ -21,8 +21,10 @@ from dynamodb_json import json_util as j_util
 from dynamodb.store import update_document_for_pk_and_sk
 from utils.sqs import send_message
 from utils.common import sanitize_for_logging
+from utils.metrics import patch_aws_calls, timed
 
 patch_all()
+patch_aws_calls()
 
 ENV = Env()
 
@@ -188,6 +190,7 @@ def process_work_complete_record(
 
 @with_lambda_profiler(profiling_group_name=PROFILE_GROUP)
 @xray_recorder.capture()
+@timed("work_complete")
 def lambda_handler(event: Union[DynamoDBStreamEvent, SQSEvent], _):
     """
     This function process work complete ingest event comes from
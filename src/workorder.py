@@ -1,19 +1,23 @@
 """ handler for find-work-order lambda function """
 import json
 
-import boto3
-import simplejson as simple_json
 from boto3.dynamodb.conditions import Key
 from environs import Env
 from rpp_lib.logs import LOGGER
 from voluptuous import Any, MultipleInvalid
 
-from validation import validate_work_order_request
+from utils.dynamodb import batch_get_items
+from utils.executor import run_concurrently
+from utils.http import compress, dumps, get_body
+from utils.metrics import timed
+from utils.resources import table
+from validation import validate_work_order_request, validate_work_orders_request
 
 ENV = Env()
 
-DYNAMO = boto3.resource("dynamodb")
-WORKORDER_TABLE = DYNAMO.Table(name=ENV("WORKORDER_TABLE", validate=Any(str)))
+WORKORDER_TABLE = table(ENV("WORKORDER_TABLE", validate=Any(str)))
+# work orders of a get_work_orders request, keys and numbers together
+MAX_BULK_WORK_ORDERS = ENV.int("MAX_BULK_WORK_ORDERS", 300)
 
 HEADERS = {
     'Content-Type': 'application/json',
@@ -23,6 +27,7 @@ HEADERS = {
 IGNORE_EXCEPTIONS = "ConditionalCheckFailedException"
 
 
+@timed("find_work_order")
 def find_work_order(event, _):
     """Retrieves a work order record from rpp-workorder table.
 
@@ -94,13 +99,110 @@ def get_work_order(event, _):
     try:
         body = find_work_order(params, None) or []
         status_code = 200
-        return {
+        return compress(event, {
             'statusCode': status_code,
             'headers': HEADERS,
-            'body': simple_json.dumps(body)
+            'body': dumps(body)
+        })
+
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': HEADERS,
+            'body': json.dumps({
+                "error": str(e)
+            })
+        }
+
+
+def query_work_order_number(work_order):
+    """
+    items of index_work_order_number for a site_id and work_order_number, the index
+    projects every attribute
+    """
+    key_expression = Key("work_order_number").eq(
+        work_order["work_order_number"]
+    ) & Key("site_id").eq(work_order["site_id"])
+
+    return WORKORDER_TABLE.query(
+        IndexName="index_work_order_number",
+        KeyConditionExpression=key_expression,
+    ).get("Items", [])
+
+
+@timed("get_work_orders")
+def get_work_orders(event, _):
+    """Retrieves many work order records from rpp-workorder table.
+
+    The body has up to MAX_BULK_WORK_ORDERS work_order_keys and work_orders, each
+    a site_id and work_order_number. Numbers are looked up in the index
+    concurrently and keys are read with BatchGetItem, 100 at a time. Keys still
+    unprocessed after BATCH_GET_ATTEMPTS are missing, and listed again in
+    missing.unprocessed_work_order_keys for the client to retry.
+
+    Arguments:
+        event {dict} -- The API gateway event of the POST request.
+    """
+    LOGGER.debug(event)
+
+    try:
+        request = validate_work_orders_request(
+            json.loads(get_body(event) or "{}"), MAX_BULK_WORK_ORDERS
+        )
+    except (MultipleInvalid, ValueError) as error:
+        return {
+            'statusCode': 400,
+            'headers': HEADERS,
+            'body': json.dumps({
+                "error": str(error)
+            })
+        }
+
+    try:
+        numbered = run_concurrently(query_work_order_number, request["work_orders"])
+
+        work_orders = {}
+        for items in numbered:
+            for item in items:
+                work_orders[item["work_order_key"]] = item
+
+        keys = [
+            {"work_order_key": work_order_key, "site_id": work_order_key.split("#")[1]}
+            for work_order_key in dict.fromkeys(request["work_order_keys"])
+            if work_order_key not in work_orders
+        ]
+        found, unprocessed = batch_get_items(WORKORDER_TABLE.name, keys)
+        for item in found:
+            work_orders[item["work_order_key"]] = item
+
+        missing = {
+            "work_order_keys": [
+                work_order_key
+                for work_order_key in request["work_order_keys"]
+                if work_order_key not in work_orders
+            ],
+            "work_orders": [
+                work_order
+                for work_order, items in zip(request["work_orders"], numbered)
+                if not items
+            ],
+            # throttled rather than absent, worth requesting again
+            "unprocessed_work_order_keys": [
+                key["work_order_key"] for key in unprocessed
+            ],
         }
 
+        return compress(event, {
+            'statusCode': 200,
+            'headers': HEADERS,
+            'body': dumps({
+                "work_orders": list(work_orders.values()),
+                "missing": missing,
+            })
+        })
+
     except Exception as e:
+        LOGGER.error({"message": "Unable to get work orders", "error": str(e)})
         return {
             'statusCode': 500,
             'headers': HEADERS,
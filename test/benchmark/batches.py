@@ -0,0 +1,204 @@
+"""
+lambda events of a configurable size built from template records, every copy of a
+template record is moved to a work order of its own
+"""
+import base64
+import copy
+import json
+from decimal import Decimal
+
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+SERIALIZER = TypeSerializer()
+DESERIALIZER = TypeDeserializer()
+
+FIRST_SBLU = 5000000
+FIRST_SEQUENCE_NUMBER = 49650000000000000000000000000000000000000000000000000000
+
+
+class Template:
+    """
+    Stream records a batch is built from and the items the tables are seeded with
+    for each work order. Records are kept the way lambda receives them.
+    """
+
+    def __init__(self, records, tables=None):
+        self.records = records
+        self.tables = tables or {}
+        self.sblu = get_sblu(get_payload(records[0]))
+
+    @classmethod
+    def load(cls, path):
+        """
+        A lambda event, like the test/unit_test request files, or a template of
+        plain stream records:
+
+            {"source": "kinesis" or "dynamodb", "records": [...], "tables": {...}}
+        """
+        with open(path) as template_file:
+            template = json.load(template_file, parse_float=Decimal)
+
+        if "Records" in template:
+            return cls(template["Records"])
+
+        records = [
+            wrap(type_record(record), template.get("source", "kinesis"))
+            for record in template["records"]
+        ]
+
+        return cls(records, template.get("tables"))
+
+
+def type_record(record):
+    """
+    stream record with its images in dynamodb json
+    """
+    record = copy.deepcopy(record)
+    for name in ("Keys", "NewImage", "OldImage"):
+        if name in record.get("dynamodb", {}):
+            record["dynamodb"][name] = SERIALIZER.serialize(record["dynamodb"][name])[
+                "M"
+            ]
+
+    return json.loads(json.dumps(record, default=str))
+
+
+def wrap(payload, source):
+    if source == "dynamodb":
+        return dict(payload, eventSource="aws:dynamodb")
+
+    return {
+        "eventSource": "aws:kinesis",
+        "eventName": "aws:kinesis:record",
+        "kinesis": {
+            "kinesisSchemaVersion": "1.0",
+            "partitionKey": "",
+            "sequenceNumber": "",
+            "data": encode(payload),
+        },
+    }
+
+
+def encode(payload):
+    return base64.b64encode(json.dumps(payload).encode("utf-8")).decode("utf-8")
+
+
+def get_payload(record):
+    """
+    dynamodb stream record a lambda record carries
+    """
+    if "kinesis" in record:
+        return json.loads(base64.b64decode(record["kinesis"]["data"]))
+
+    return record
+
+
+def get_image(image):
+    """
+    plain image of a stream record, some request files already carry plain images
+    """
+    try:
+        return DESERIALIZER.deserialize({"M": image or {}})
+    except (AttributeError, TypeError, ValueError):
+        return image
+
+
+def get_sblu(payload):
+    dynamodb = payload.get("dynamodb", {})
+
+    for name in ("NewImage", "OldImage", "Keys"):
+        image = get_image(dynamodb.get(name))
+        if image.get("work_order_key"):
+            return image["work_order_key"].split("#")[0]
+        if image.get("sblu"):
+            return str(image["sblu"])
+        if isinstance(image.get("pk"), str) and "#" in image["pk"]:
+            return image["pk"].replace("workorder:", "", 1).split("#")[0]
+
+    raise ValueError(f"no work order in template record {payload}")
+
+
+def move(value, template_sblu, sblu):
+    """
+    value with the template work order replaced by the work order sblu
+    """
+    if isinstance(value, str):
+        return value.replace(template_sblu, sblu)
+    if isinstance(value, dict):
+        return {
+            move(k, template_sblu, sblu): move(v, template_sblu, sblu)
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [move(v, template_sblu, sblu) for v in value]
+
+    return value
+
+
+def build_record(template, index, sblu, sequence_number):
+    record = template.records[index % len(template.records)]
+    payload = move(get_payload(record), template.sblu, sblu)
+
+    dynamodb = payload.get("dynamodb", {})
+    if isinstance(dynamodb.get("ApproximateCreationDateTime"), (int, float)):
+        # later copies are newer, like records read from a shard
+        dynamodb["ApproximateCreationDateTime"] += index
+    if "SequenceNumber" in dynamodb or "kinesis" not in record:
+        dynamodb["SequenceNumber"] = str(sequence_number)
+
+    if "kinesis" not in record:
+        return payload
+
+    record = move(record, template.sblu, sblu)
+    record["kinesis"].update(
+        {
+            "data": encode(payload),
+            "sequenceNumber": str(sequence_number),
+            "partitionKey": record["kinesis"].get("partitionKey") or sblu,
+        }
+    )
+
+    return record
+
+
+def get_sblus(work_orders):
+    return [str(FIRST_SBLU + index) for index in range(work_orders)]
+
+
+def build_events(template, batch_size, batches, work_orders):
+    """
+    batches events of batch_size records, spread round robin over work_orders
+    work orders
+    """
+    sblus = get_sblus(work_orders)
+    events = []
+
+    for batch in range(batches):
+        records = []
+        for offset in range(batch_size):
+            index = batch * batch_size + offset
+            records.append(
+                build_record(
+                    template,
+                    index,
+                    sblus[index % work_orders],
+                    FIRST_SEQUENCE_NUMBER + index,
+                )
+            )
+        events.append({"Records": records})
+
+    return events
+
+
+def build_tables(template, work_orders):
+    """
+    {table name: [items]} seeding every work order of the batches
+    """
+    return {
+        name: [
+            item
+            for sblu in get_sblus(work_orders)
+            for item in move(items, template.sblu, sblu)
+        ]
+        for name, items in template.tables.items()
+    }
@@ -0,0 +1,311 @@
+"""
+offline throughput benchmark of the stream handlers, batches built from templates run
+against in memory stand-ins of dynamodb, sqs, kinesis and rpp_lib.rpc
+
+    python test/benchmark/bench_handlers.py [scenario ...] [--batch-size 100]
+        [--batches 10] [--work-orders 20] [--aws-latency-ms 0] [--rpc-latency-ms 0]
+"""
+
+import argparse
+import functools
+import importlib
+import json
+import os
+import sys
+import time
+import uuid
+from collections import namedtuple
+
+BENCHMARK = os.path.dirname(os.path.abspath(__file__))
+REQUEST = os.path.join(BENCHMARK, "..", "unit_test", "test_data_files", "request")
+
+sys.path.insert(0, os.path.join(BENCHMARK, "..", "..", "src"))
+sys.path.insert(0, BENCHMARK)
+
+from batches import Template, build_events, build_tables  # noqa: E402
+from stand_ins import StandIns, install  # noqa: E402
+
+Scenario = namedtuple("Scenario", ["module", "handler", "template", "per_record"])
+
+SCENARIOS = {
+    "event_stream": Scenario(
+        "event_stream",
+        "process_stream",
+        os.path.join(BENCHMARK, "templates", "event_stream.json"),
+        "process_record",
+    ),
+    "aggregate_events": Scenario(
+        "aggregate_events",
+        "process_event",
+        os.path.join(BENCHMARK, "templates", "aggregate_events.json"),
+        "process_dynamodb_event",
+    ),
+    "charges_ingest": Scenario(
+        "charges_ingest",
+        "process_stream",
+        os.path.join(BENCHMARK, "templates", "charges_ingest.json"),
+        None,
+    ),
+    "storage_charges_ingest": Scenario(
+        "storage_charges_ingest",
+        "process_stream",
+        os.path.join(BENCHMARK, "templates", "storage_charges_ingest.json"),
+        None,
+    ),
+    "auction_pf_events": Scenario(
+        "auction_pf_events",
+        "process_stream",
+        os.path.join(BENCHMARK, "templates", "auction_pf_events.json"),
+        "process_dynamodb_event",
+    ),
+    "repair_tracker_clocking": Scenario(
+        "repair_tracker_clocking",
+        "process_stream",
+        os.path.join(BENCHMARK, "templates", "repair_tracker_clocking.json"),
+        "process_event",
+    ),
+    "rims_ingest": Scenario(
+        "rims_ingest",
+        "process_stream",
+        os.path.join(BENCHMARK, "templates", "rims_ingest.json"),
+        "process_record",
+    ),
+    "client_data_ingest": Scenario(
+        "client-data-ingest",
+        "process_stream",
+        os.path.join(BENCHMARK, "templates", "client_data_ingest.json"),
+        None,
+    ),
+    "recon_labor_ingest": Scenario(
+        "recon_labor_ingest",
+        "process_stream",
+        os.path.join(REQUEST, "recon_labor_ingest.json"),
+        "process_record",
+    ),
+    "recon_service_status_ingest": Scenario(
+        "recon_service_status_ingest",
+        "process_stream",
+        os.path.join(REQUEST, "recon_service_status_ingest.json"),
+        "process_record",
+    ),
+    "work_complete": Scenario(
+        "work_complete",
+        "lambda_handler",
+        os.path.join(REQUEST, "work_complete_ingest_stream_proc_recon.json"),
+        None,
+    ),
+    "kinesis": Scenario(
+        "kinesis",
+        "process_stream",
+        os.path.join(BENCHMARK, "templates", "kinesis.json"),
+        None,
+    ),
+    "dynamodb_stream_to_kinesis_stream": Scenario(
+        "dynamodb_stream_to_kinesis_stream",
+        "handler",
+        os.path.join(BENCHMARK, "templates", "dynamodb_stream_to_kinesis_stream.json"),
+        None,
+    ),
+}
+
+
+class LambdaContext:
+    """
+    the attributes of a lambda context the handlers and their decorators read
+    """
+
+    function_name = "rpp-workorder-benchmark"
+    function_version = "$LATEST"
+    invoked_function_arn = (
+        "arn:aws:lambda:us-east-1:000000000000:function:rpp-workorder-benchmark"
+    )
+    memory_limit_in_mb = 1024
+
+    def __init__(self):
+        self.aws_request_id = str(uuid.uuid4())
+
+    @staticmethod
+    def get_remaining_time_in_millis():
+        return 900000
+
+
+class Timer:
+    """
+    wall time of every call of the wrapped per record function and the calls that
+    raised
+    """
+
+    def __init__(self, function):
+        self.function = function
+        self.times = []
+        self.errors = 0
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            except Exception:
+                self.errors += 1
+                raise
+            finally:
+                self.times.append(time.perf_counter() - start)
+
+        self.timed = timed
+
+
+def percentile(times, fraction):
+    if not times:
+        return 0.0
+
+    ordered = sorted(times)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def get_failures(response):
+    """
+    records a handler response hands back to the event source mapping
+    """
+    if not isinstance(response, dict):
+        return 0
+
+    return len(response.get("batchItemFailures") or [])
+
+
+def run(stand_ins, name, batch_size, batches, work_orders, warmup):
+    scenario = SCENARIOS[name]
+    template = Template.load(scenario.template)
+    module = importlib.import_module(scenario.module)
+    handler = getattr(module, scenario.handler)
+
+    events = build_events(template, batch_size, warmup + batches, work_orders)
+    stand_ins.reset()
+    stand_ins.seed(build_tables(template, work_orders))
+
+    for event in events[:warmup]:
+        handler(event, LambdaContext())
+    stand_ins.recorder.reset()
+
+    dead_letters = stand_ins.sqs.get_queue(os.environ["DL_QUEUE"])
+    dead_lettered = len(dead_letters.messages)
+    failures = 0
+
+    timer = None
+    if scenario.per_record:
+        timer = Timer(getattr(module, scenario.per_record))
+        setattr(module, scenario.per_record, timer.timed)
+
+    batch_times = []
+    try:
+        for event in events[warmup:]:
+            start = time.perf_counter()
+            response = handler(event, LambdaContext())
+            batch_times.append(time.perf_counter() - start)
+            failures += get_failures(response)
+    finally:
+        if timer:
+            setattr(module, scenario.per_record, timer.function)
+
+    records = batch_size * batches
+    if timer and timer.times:
+        record_times = timer.times
+    else:
+        # handlers without a per record function loop inline, only the batch is timed
+        record_times = [t / batch_size for t in batch_times for _ in range(batch_size)]
+
+    calls = dict(stand_ins.recorder.calls)
+    return {
+        "scenario": name,
+        "records": records,
+        "records_per_sec": records / sum(batch_times) if sum(batch_times) else 0.0,
+        "p50_ms": percentile(record_times, 0.5) * 1000,
+        "p99_ms": percentile(record_times, 0.99) * 1000,
+        "aws_calls_per_record": sum(
+            count for call, count in calls.items() if not call.startswith("rpc.")
+        )
+        / records,
+        "rpc_calls_per_record": sum(
+            count for call, count in calls.items() if call.startswith("rpc.")
+        )
+        / records,
+        "calls": dict(sorted(calls.items())),
+        # records that raised, were reported back to the stream or sent to the dlq,
+        # a scenario whose records fail only measures the error path
+        "errors": timer.errors if timer else 0,
+        "batch_item_failures": failures,
+        "dead_letters": len(dead_letters.messages) - dead_lettered,
+    }
+
+
+def is_failed(result):
+    return bool(
+        result["errors"] or result["batch_item_failures"] or result["dead_letters"]
+    )
+
+
+def report(result):
+    print(
+        f"{result['scenario']:>34}: {result['records_per_sec']:9.1f} records/s"
+        f"  p50 {result['p50_ms']:7.3f} ms  p99 {result['p99_ms']:7.3f} ms"
+        f"  aws {result['aws_calls_per_record']:5.2f}/record"
+        f"  rpc {result['rpc_calls_per_record']:5.2f}/record"
+    )
+    for call, count in result["calls"].items():
+        print(f"{'':>36}{call}: {count / result['records']:.2f}/record")
+    if is_failed(result):
+        print(
+            f"{'':>36}FAILED: {result['errors']} raised,"
+            f" {result['batch_item_failures']} batch item failures,"
+            f" {result['dead_letters']} dead letters"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("scenarios", nargs="*", help=", ".join(sorted(SCENARIOS)))
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--batches", type=int, default=10)
+    parser.add_argument("--work-orders", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--aws-latency-ms", type=float, default=0.0)
+    parser.add_argument("--rpc-latency-ms", type=float, default=0.0)
+    parser.add_argument("--json", action="store_true", help="print results as json")
+    parser.add_argument(
+        "--allow-failures",
+        action="store_true",
+        help="exit 0 when records of a scenario fail",
+    )
+    args = parser.parse_args(argv)
+    unknown = sorted(set(args.scenarios) - set(SCENARIOS))
+    if unknown:
+        parser.error(f"unknown scenarios {', '.join(unknown)}")
+
+    stand_ins = StandIns(args.aws_latency_ms / 1000, args.rpc_latency_ms / 1000)
+    install(stand_ins)
+
+    results = []
+    for name in args.scenarios or sorted(SCENARIOS):
+        result = run(
+            stand_ins,
+            name,
+            args.batch_size,
+            args.batches,
+            args.work_orders,
+            args.warmup,
+        )
+        results.append(result)
+        if not args.json:
+            report(result)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+    failed = [result["scenario"] for result in results if is_failed(result)]
+    if failed and not args.allow_failures:
+        parser.exit(1, f"records failed in {', '.join(failed)}\n")
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+microbenchmark of utils.expression against the per call expression building it replaced
+
+    python test/benchmark/bench_update_expression.py [attributes] [iterations]
+"""
+import os
+import sys
+import timeit
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src"))
+
+from utils.expression import build_update  # noqa: E402
+
+
+def legacy_update(record, remove_attributes):
+    """
+    expression building of put_work_order before utils.expression
+    """
+    attribute_names = {}
+    attribute_values = {}
+
+    update_expression = "set "
+    update_expression += ",".join(["#" + k + " = :" + k for k in record.keys()])
+
+    if remove_attributes:
+        update_expression += " remove "
+        update_expression += ", ".join(remove_attributes)
+
+    attribute_names.update({"#" + k: k for k in record.keys()})
+    attribute_values.update({":" + k: record[k] for k in record.keys()})
+
+    return update_expression, attribute_names, attribute_values
+
+
+def legacy_nested_update(name, data):
+    """
+    nested column expression building of event_stream.store_wo_record before
+    utils.expression
+    """
+    update_expression = "set #column_updated = :updated"
+    update_expression += "," + ",".join(
+        [
+            "#rpp_" + name + ".#rpp_" + k + " = :" + name + "_" + k
+            for k in data.keys()
+            if data[k] != "Remove"
+        ]
+    )
+    expression_attribute_names = {"#column_updated": name + "_updated"}
+    expression_attribute_names.update({"#rpp_" + name: name})
+    expression_attribute_names.update({"#rpp_" + k: k for k in data.keys()})
+    expression_attribute_values = {
+        ":" + name + "_" + k: data[k] for k in data.keys() if data[k] != "Remove"
+    }
+    remove_fields = [
+        "#rpp_" + name + ".#rpp_" + k for k in data.keys() if data[k] == "Remove"
+    ]
+    if remove_fields:
+        update_expression += " REMOVE " + ",".join(remove_fields)
+
+    return update_expression, expression_attribute_names, expression_attribute_values
+
+
+def compiled_nested_update(name, data):
+    values = {name + "_updated": Decimal("1")}
+    values.update({(name, k): v for k, v in data.items() if v != "Remove"})
+    remove = [(name, k) for k, v in data.items() if v == "Remove"]
+
+    return build_update(values, remove)
+
+
+def main(attributes=30, iterations=20000):
+    record = {f"attribute_{i}": Decimal(i) for i in range(attributes)}
+    remove_attributes = ["charge_l_status", "charge_p_status"]
+    data = dict(record, removed_attribute="Remove")
+
+    cases = {
+        "flat legacy": lambda: legacy_update(record, remove_attributes),
+        "flat compiled": lambda: build_update(record, remove_attributes),
+        "nested legacy": lambda: legacy_nested_update("order_service", data),
+        "nested compiled": lambda: compiled_nested_update("order_service", data),
+    }
+
+    print(f"{attributes} attributes, {iterations} iterations")
+    for name, case in cases.items():
+        seconds = min(timeit.repeat(case, number=iterations, repeat=5))
+        print(f"{name:>16}: {seconds / iterations * 1e6:8.2f} us/call")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:3]))
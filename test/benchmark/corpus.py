@@ -0,0 +1,337 @@
+"""
+sanitized corpus of recorded lambda batches, captured from a kinesis stream or
+imported from event files, stored as one gzipped json line per batch
+
+    python test/benchmark/corpus.py capture STREAM corpus.jsonl.gz [--batches 20]
+    python test/benchmark/corpus.py import corpus.jsonl.gz event.json [event.json ...]
+"""
+import argparse
+import base64
+import binascii
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import re
+import string
+import sys
+import time
+
+import boto3
+
+VERSION = 1
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "src")
+
+# attributes whose values are personal or account data, matched on the lower case
+# attribute name
+SENSITIVE = re.compile(
+    r"(^|_)vin$|_by$|(^|_)user(_?id|_?name)?$|mod_?user$|contact|company|seller"
+    r"|shipper|driver|customer|email"
+    r"|phone|address|license_plate|first_name|last_name|firstname|lastname"
+)
+
+# values replaced where they are part of another string too, identifiers like vins,
+# shorter or digitless values are too common
+MIN_REPLACED = 6
+
+
+class Corpus:
+    """
+    header, {"version", "source", "captured", "tables", "rpc"}, and the batches,
+    each {"time": epoch seconds, "Records": [...]}
+    """
+
+    def __init__(self, header, batches):
+        self.header = header
+        self.batches = batches
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, "rt", encoding="utf-8") as corpus_file:
+            lines = [json.loads(line) for line in corpus_file if line.strip()]
+
+        header = lines[0]
+        if header.get("version") != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} corpus")
+
+        return cls(header, lines[1:])
+
+    def save(self, path):
+        with gzip.open(path, "wt", encoding="utf-8") as corpus_file:
+            for line in [self.header] + self.batches:
+                corpus_file.write(json.dumps(line, separators=(",", ":")) + "\n")
+
+    @property
+    def records(self):
+        return sum(len(batch["Records"]) for batch in self.batches)
+
+
+class Sanitizer:
+    """
+    Replaces sensitive values with tokens of the same length and character classes,
+    keyed on the value so a vin or a user is the same token everywhere in the corpus
+    and records of one vehicle still join. A value is also replaced where it is
+    part of another string, like a key.
+    """
+
+    def __init__(self, salt):
+        self.salt = salt.encode("utf-8")
+        self.tokens = {}
+
+    def token(self, value):
+        if value not in self.tokens:
+            digest = hmac.new(self.salt, value.encode("utf-8"), hashlib.sha256)
+            stream = iter(digest.digest() * (len(value) // 32 + 1))
+            self.tokens[value] = "".join(
+                self.replace_character(character, next(stream)) for character in value
+            )
+
+        return self.tokens[value]
+
+    @staticmethod
+    def replace_character(character, byte):
+        if character.isdigit():
+            return string.digits[byte % 10]
+        if character.isupper():
+            return string.ascii_uppercase[byte % 26]
+        if character.islower():
+            return string.ascii_lowercase[byte % 26]
+
+        return character
+
+    def collect(self, value, sensitive=False):
+        """
+        the sensitive strings of value, dynamodb json or plain
+        """
+        if isinstance(value, dict):
+            for name, item in value.items():
+                yield from self.collect(
+                    item, sensitive or bool(SENSITIVE.search(str(name).lower()))
+                )
+        elif isinstance(value, list):
+            for item in value:
+                yield from self.collect(item, sensitive)
+        elif sensitive and isinstance(value, str) and value:
+            yield value
+
+    def replace(self, value, originals):
+        if isinstance(value, dict):
+            return {
+                self.replace(name, originals): self.replace(item, originals)
+                for name, item in value.items()
+            }
+        if isinstance(value, list):
+            return [self.replace(item, originals) for item in value]
+        if not isinstance(value, str):
+            return value
+        if value in originals:
+            return self.token(value)
+
+        for original in originals:
+            if is_identifier(original) and original in value:
+                value = value.replace(original, self.token(original))
+
+        return value
+
+    def sanitize(self, payload):
+        originals = sorted(set(self.collect(payload)), key=len, reverse=True)
+        if not originals:
+            return payload
+
+        return self.replace(payload, originals)
+
+    def sanitize_record(self, record):
+        """
+        lambda record with its payload sanitized, kinesis data is decoded first and
+        kept as json, out of its envelope
+        """
+        if "kinesis" not in record:
+            return self.sanitize(record)
+
+        # src only on the path of capture and import, replay puts the src of a
+        # revision there
+        if SRC not in sys.path:
+            sys.path.append(SRC)
+        from utils.envelope import unpack
+
+        data = record["kinesis"]["data"]
+        try:
+            payload = json.loads(unpack(base64.b64decode(data)))
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            # not json, nothing to look into
+            return record
+
+        kinesis = dict(
+            record["kinesis"],
+            data=base64.b64encode(
+                json.dumps(self.sanitize(payload)).encode("utf-8")
+            ).decode("utf-8"),
+            partitionKey=self.sanitize(
+                {"pk": record["kinesis"].get("partitionKey", "")}
+            )["pk"],
+        )
+        return dict(record, kinesis=kinesis)
+
+
+def is_identifier(value):
+    return len(value) >= MIN_REPLACED and any(c.isdigit() for c in value)
+
+
+def batch_time(records, default):
+    """
+    epoch seconds the newest record of a batch was written
+    """
+    times = [
+        record.get("kinesis", {}).get("approximateArrivalTimestamp")
+        or record.get("dynamodb", {}).get("ApproximateCreationDateTime")
+        for record in records
+    ]
+    times = [float(t) for t in times if t]
+    if not times:
+        return default
+
+    newest = max(times)
+    # ApproximateCreationDateTime is in milliseconds once it passed a kinesis stream
+    return newest / 1000 if newest > 1e11 else newest
+
+
+def lambda_record(record, shard_id, stream_arn, region):
+    """
+    a get_records record the way the lambda event source mapping hands it over
+    """
+    return {
+        "kinesis": {
+            "kinesisSchemaVersion": "1.0",
+            "partitionKey": record["PartitionKey"],
+            "sequenceNumber": record["SequenceNumber"],
+            "data": base64.b64encode(record["Data"]).decode("utf-8"),
+            "approximateArrivalTimestamp": record[
+                "ApproximateArrivalTimestamp"
+            ].timestamp(),
+        },
+        "eventSource": "aws:kinesis",
+        "eventVersion": "1.0",
+        "eventID": f"{shard_id}:{record['SequenceNumber']}",
+        "eventName": "aws:kinesis:record",
+        "awsRegion": region,
+        "eventSourceARN": stream_arn,
+    }
+
+
+def capture(stream, batches, batch_size, iterator_type, since=None):
+    """
+    batches of batch_size records read from every shard of stream
+    """
+    client = boto3.client("kinesis")
+    description = client.describe_stream_summary(StreamName=stream)
+    stream_arn = description["StreamDescriptionSummary"]["StreamARN"]
+    region = client.meta.region_name
+
+    captured = []
+    shards = client.list_shards(StreamName=stream)["Shards"]
+    for shard in shards:
+        arguments = {
+            "StreamName": stream,
+            "ShardId": shard["ShardId"],
+            "ShardIteratorType": iterator_type,
+        }
+        if since:
+            arguments["Timestamp"] = since
+        iterator = client.get_shard_iterator(**arguments)["ShardIterator"]
+
+        while iterator and len(captured) < batches:
+            response = client.get_records(ShardIterator=iterator, Limit=batch_size)
+            iterator = response.get("NextShardIterator")
+            if response["Records"]:
+                captured.append(
+                    [
+                        lambda_record(record, shard["ShardId"], stream_arn, region)
+                        for record in response["Records"]
+                    ]
+                )
+            if not response.get("MillisBehindLatest"):
+                break
+            if not response["Records"]:
+                # get_records is limited to 5 calls a second for each shard
+                time.sleep(0.2)
+
+        if len(captured) >= batches:
+            break
+
+    return captured, stream_arn
+
+
+def build(record_batches, source, salt):
+    sanitizer = Sanitizer(salt)
+    now = time.time()
+
+    batches = []
+    for index, records in enumerate(record_batches):
+        records = [sanitizer.sanitize_record(record) for record in records]
+        batches.append({"time": batch_time(records, now + index), "Records": records})
+
+    header = {
+        "version": VERSION,
+        "source": source,
+        "captured": now,
+        "tables": {},
+        "rpc": {},
+    }
+    return Corpus(header, batches)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--salt",
+        default=os.environ.get("CORPUS_SALT", ""),
+        help="key of the sanitizing tokens, CORPUS_SALT by default",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    capture_parser = commands.add_parser("capture", help="read a kinesis stream")
+    capture_parser.add_argument("stream")
+    capture_parser.add_argument("corpus")
+    capture_parser.add_argument("--batches", type=int, default=20)
+    capture_parser.add_argument("--batch-size", type=int, default=100)
+    capture_parser.add_argument(
+        "--iterator-type",
+        default="TRIM_HORIZON",
+        choices=["TRIM_HORIZON", "LATEST", "AT_TIMESTAMP"],
+    )
+    capture_parser.add_argument(
+        "--since", type=float, help="epoch seconds, for AT_TIMESTAMP"
+    )
+
+    import_parser = commands.add_parser("import", help="read lambda event files")
+    import_parser.add_argument("corpus")
+    import_parser.add_argument("events", nargs="+")
+
+    args = parser.parse_args(argv)
+    if not args.salt:
+        parser.error("a salt is required, --salt or CORPUS_SALT")
+
+    if args.command == "capture":
+        record_batches, source = capture(
+            args.stream,
+            args.batches,
+            args.batch_size,
+            args.iterator_type,
+            args.since,
+        )
+    else:
+        record_batches = []
+        for path in args.events:
+            with open(path) as event_file:
+                record_batches.append(json.load(event_file)["Records"])
+        source = ",".join(os.path.basename(path) for path in args.events)
+
+    corpus = build(record_batches, source, args.salt)
+    corpus.save(args.corpus)
+    print(f"{len(corpus.batches)} batches, {corpus.records} records in {args.corpus}")
+
+
+if __name__ == "__main__":
+    main()
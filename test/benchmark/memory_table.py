@@ -0,0 +1,857 @@
+"""
+in memory stand-in of a dynamodb table, evaluates the key, condition, filter, update
+and projection expressions the handlers send
+"""
+import copy
+import re
+import threading
+from decimal import Decimal
+
+from boto3.dynamodb.conditions import ConditionBase, ConditionExpressionBuilder
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.exceptions import ClientError
+
+SERIALIZER = TypeSerializer()
+DESERIALIZER = TypeDeserializer()
+
+MISSING = object()
+
+TOKEN = re.compile(
+    r"\s*(?:(?P<name>#[A-Za-z0-9_]+)|(?P<value>:[A-Za-z0-9_]+)|(?P<number>\d+)"
+    r"|(?P<word>[A-Za-z_][A-Za-z0-9_]*)|(?P<op><>|<=|>=|[=<>(),.\[\]+-]))"
+)
+CLAUSES = ("SET", "REMOVE", "ADD", "DELETE")
+COMPARATORS = ("=", "<>", "<", "<=", ">", ">=")
+CONDITION_FUNCTIONS = (
+    "attribute_exists",
+    "attribute_not_exists",
+    "attribute_type",
+    "begins_with",
+    "contains",
+)
+INVALID_PATH = (
+    "The document path provided in the update expression is invalid for update"
+)
+
+
+def client_error(code, message, operation):
+    return ClientError({"Error": {"Code": code, "Message": message}}, operation)
+
+
+def normalize(value):
+    """
+    value as boto3 would send it and dynamodb return it, numbers become Decimal and
+    floats are rejected just like boto3 rejects them
+    """
+    return DESERIALIZER.deserialize(SERIALIZER.serialize(value))
+
+
+def tokenize(expression):
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+
+    while position < len(expression):
+        match = TOKEN.match(expression, position)
+        if not match or match.end() == position:
+            raise client_error(
+                "ValidationException",
+                f"Invalid expression: unexpected token at {expression[position:]!r}",
+                "Expression",
+            )
+        tokens.append((match.lastgroup, match.group(match.lastgroup)))
+        position = match.end()
+
+    return tokens
+
+
+class Parser:
+    """
+    recursive descent parser of the dynamodb expression grammar, nodes are tuples
+    """
+    def __init__(self, expression, names=None, values=None):
+        self.tokens = tokenize(expression)
+        self.position = 0
+        self.names = names or {}
+        self.values = values or {}
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None, None
+
+    def next(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def accept(self, text):
+        kind, token = self.peek()
+        if token is not None and (
+            token == text or (kind == "word" and token.upper() == text)
+        ):
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, text):
+        if not self.accept(text):
+            raise self.error(f"expected {text!r}")
+
+    def error(self, message):
+        return client_error(
+            "ValidationException", f"Invalid expression: {message}", "Expression"
+        )
+
+    def done(self):
+        return self.position >= len(self.tokens)
+
+    def name(self):
+        kind, text = self.next()
+        if kind == "name":
+            if text not in self.names:
+                raise self.error(f"undefined attribute name {text}")
+            return self.names[text]
+        if kind == "word":
+            return text
+        raise self.error(f"expected an attribute name, got {text!r}")
+
+    def path(self):
+        elements = [self.name()]
+        while True:
+            if self.accept("."):
+                elements.append(self.name())
+            elif self.accept("["):
+                kind, text = self.next()
+                if kind != "number":
+                    raise self.error("expected a list index")
+                elements.append(int(text))
+                self.expect("]")
+            else:
+                return ("path", tuple(elements))
+
+    def operand(self):
+        kind, text = self.peek()
+        if kind == "value":
+            self.position += 1
+            if text not in self.values:
+                raise self.error(f"undefined attribute value {text}")
+            return ("value", self.values[text])
+
+        if kind == "word" and self.tokens[self.position + 1 : self.position + 2] == [
+            ("op", "(")
+        ]:
+            self.position += 2
+            arguments = [self.value()]
+            while self.accept(","):
+                arguments.append(self.value())
+            self.expect(")")
+            return ("function", text.lower(), tuple(arguments))
+
+        return self.path()
+
+    def value(self):
+        node = self.operand()
+        for op in ("+", "-"):
+            if self.accept(op):
+                return (op, node, self.operand())
+        return node
+
+    # conditions
+    def condition(self):
+        node = self.conjunction()
+        while self.accept("OR"):
+            node = ("or", node, self.conjunction())
+        return node
+
+    def conjunction(self):
+        node = self.negation()
+        while self.accept("AND"):
+            node = ("and", node, self.negation())
+        return node
+
+    def negation(self):
+        if self.accept("NOT"):
+            return ("not", self.negation())
+        return self.comparison()
+
+    def comparison(self):
+        if self.accept("("):
+            node = self.condition()
+            self.expect(")")
+            return node
+
+        left = self.operand()
+        kind, text = self.peek()
+
+        if kind == "op" and text in COMPARATORS:
+            self.position += 1
+            return ("compare", text, left, self.operand())
+
+        if self.accept("BETWEEN"):
+            low = self.operand()
+            self.expect("AND")
+            return ("between", left, low, self.operand())
+
+        if self.accept("IN"):
+            self.expect("(")
+            candidates = [self.operand()]
+            while self.accept(","):
+                candidates.append(self.operand())
+            self.expect(")")
+            return ("in", left, tuple(candidates))
+
+        if left[0] == "function" and left[1] in CONDITION_FUNCTIONS:
+            return left
+
+        raise self.error(f"expected a comparison, got {text!r}")
+
+    def parse_condition(self):
+        node = self.condition()
+        if not self.done():
+            raise self.error(f"unexpected {self.peek()[1]!r}")
+        return node
+
+    # updates
+    def parse_update(self):
+        actions = {clause: [] for clause in CLAUSES}
+
+        while not self.done():
+            kind, text = self.next()
+            clause = text.upper() if kind == "word" else None
+            if clause not in CLAUSES:
+                raise self.error(f"expected SET, REMOVE, ADD or DELETE, got {text!r}")
+
+            while True:
+                path = self.path()
+                if clause == "SET":
+                    self.expect("=")
+                    actions[clause].append((path, self.value()))
+                elif clause == "REMOVE":
+                    actions[clause].append((path, None))
+                else:
+                    actions[clause].append((path, self.operand()))
+
+                if not self.accept(","):
+                    break
+
+        return actions
+
+    def parse_projection(self):
+        paths = [self.path()]
+        while self.accept(","):
+            paths.append(self.path())
+        if not self.done():
+            raise self.error(f"unexpected {self.peek()[1]!r}")
+        return paths
+
+
+def resolve(item, path):
+    value = item
+    for element in path:
+        if isinstance(element, int):
+            if not isinstance(value, list) or element >= len(value):
+                return MISSING
+            value = value[element]
+        else:
+            if not isinstance(value, dict) or element not in value:
+                return MISSING
+            value = value[element]
+    return value
+
+
+def is_number(value):
+    return isinstance(value, (int, Decimal)) and not isinstance(value, bool)
+
+
+def comparable(left, right):
+    if is_number(left) and is_number(right):
+        return True
+    return type(left) is type(right)
+
+
+def evaluate(node, item):
+    kind = node[0]
+
+    if kind == "path":
+        return resolve(item, node[1])
+
+    if kind == "value":
+        return node[1]
+
+    if kind in ("+", "-"):
+        left, right = evaluate(node[1], item), evaluate(node[2], item)
+        if not (is_number(left) and is_number(right)):
+            raise client_error(
+                "ValidationException",
+                "An operand in the update expression has an incorrect data type",
+                "UpdateItem",
+            )
+        return (
+            Decimal(left) + Decimal(right)
+            if kind == "+"
+            else Decimal(left) - Decimal(right)
+        )
+
+    if kind == "function":
+        name, arguments = node[1], node[2]
+        if name == "if_not_exists":
+            value = evaluate(arguments[0], item)
+            return evaluate(arguments[1], item) if value is MISSING else value
+        if name == "list_append":
+            return list(evaluate(arguments[0], item)) + list(
+                evaluate(arguments[1], item)
+            )
+        if name == "size":
+            value = evaluate(arguments[0], item)
+            return MISSING if value is MISSING else Decimal(len(value))
+        return test(node, item)
+
+    return test(node, item)
+
+
+def test(node, item):
+    """
+    truth of a condition node for the item
+    """
+    kind = node[0]
+
+    if kind == "or":
+        return test(node[1], item) or test(node[2], item)
+    if kind == "and":
+        return test(node[1], item) and test(node[2], item)
+    if kind == "not":
+        return not test(node[1], item)
+
+    if kind == "compare":
+        op = node[1]
+        left, right = evaluate(node[2], item), evaluate(node[3], item)
+        if left is MISSING or right is MISSING:
+            return False
+        if not comparable(left, right):
+            return op == "<>"
+        if op == "=":
+            return left == right
+        if op == "<>":
+            return left != right
+        if isinstance(left, (dict, list, set, bool)) or left is None:
+            return False
+        return {
+            "<": left < right,
+            "<=": left <= right,
+            ">": left > right,
+            ">=": left >= right,
+        }[op]
+
+    if kind == "between":
+        value = evaluate(node[1], item)
+        low, high = evaluate(node[2], item), evaluate(node[3], item)
+        if MISSING in (value, low, high):
+            return False
+        return (
+            comparable(value, low) and comparable(value, high) and low <= value <= high
+        )
+
+    if kind == "in":
+        value = evaluate(node[1], item)
+        return value is not MISSING and any(
+            comparable(value, candidate) and value == candidate
+            for candidate in (evaluate(operand, item) for operand in node[2])
+        )
+
+    if kind == "function":
+        name, arguments = node[1], node[2]
+        value = evaluate(arguments[0], item)
+        if name == "attribute_exists":
+            return value is not MISSING
+        if name == "attribute_not_exists":
+            return value is MISSING
+        if value is MISSING:
+            return False
+        other = evaluate(arguments[1], item)
+        if name == "begins_with":
+            return (
+                isinstance(value, (str, bytes))
+                and comparable(value, other)
+                and value.startswith(other)
+            )
+        if name == "contains":
+            if isinstance(value, str):
+                return isinstance(other, str) and other in value
+            return isinstance(value, (list, set)) and other in value
+        if name == "attribute_type":
+            return next(iter(SERIALIZER.serialize(value))) == other
+
+    raise client_error(
+        "ValidationException", f"Invalid condition: {kind}", "Expression"
+    )
+
+
+def set_path(item, path, value, operation):
+    parent = resolve(item, path[:-1]) if len(path) > 1 else item
+    element = path[-1]
+
+    if isinstance(element, int):
+        if not isinstance(parent, list):
+            raise client_error("ValidationException", INVALID_PATH, operation)
+        if element < len(parent):
+            parent[element] = value
+        else:
+            parent.append(value)
+    else:
+        if not isinstance(parent, dict):
+            raise client_error("ValidationException", INVALID_PATH, operation)
+        parent[element] = value
+
+
+def remove_path(item, path, operation):
+    parent = resolve(item, path[:-1]) if len(path) > 1 else item
+    element = path[-1]
+
+    if isinstance(element, int):
+        if not isinstance(parent, list):
+            raise client_error("ValidationException", INVALID_PATH, operation)
+        if element < len(parent):
+            del parent[element]
+    else:
+        if not isinstance(parent, dict):
+            raise client_error("ValidationException", INVALID_PATH, operation)
+        parent.pop(element, None)
+
+
+def project(item, paths):
+    projected = {}
+    for _, path in paths:
+        value = resolve(item, path)
+        if value is MISSING:
+            continue
+
+        target = projected
+        names = [element for element in path if not isinstance(element, int)]
+        if len(names) != len(path):
+            # list elements are projected with their whole top level attribute
+            projected[path[0]] = copy.deepcopy(item[path[0]])
+            continue
+        for name in names[:-1]:
+            target = target.setdefault(name, {})
+        target[names[-1]] = copy.deepcopy(value)
+
+    return projected
+
+
+class MemoryTable:
+    """
+    A table held in a dict, thread safe like the boto3 Table resource. Items are
+    kept as the resource returns them, numbers as Decimal.
+
+    record(operation) is called for every request the table serves.
+    """
+
+    def __init__(self, name, key_names, record):
+        self.name = name
+        self.table_name = name
+        self.key_names = tuple(key_names)
+        self.key_schema = [
+            {"AttributeName": key_name, "KeyType": key_type}
+            for key_name, key_type in zip(self.key_names, ("HASH", "RANGE"))
+        ]
+        self.record = record
+        self.items = {}
+        self.lock = threading.RLock()
+
+    def get_key(self, item, operation):
+        try:
+            return tuple(item[key_name] for key_name in self.key_names)
+        except KeyError as exc:
+            raise client_error(
+                "ValidationException",
+                f"One of the required keys was not given a value: {exc}",
+                operation,
+            )
+
+    def build(self, operation, names=None, values=None, **expressions):
+        """
+        parse the expressions of a request, boto3 conditions are built into
+        placeholders the way the resource builds them
+        """
+        builder = ConditionExpressionBuilder()
+        names = dict(names or {})
+        values = {k: normalize(v) for k, v in (values or {}).items()}
+        strings = {}
+
+        for argument, expression in expressions.items():
+            if expression is None:
+                continue
+            if isinstance(expression, ConditionBase):
+                built = builder.build_expression(
+                    expression, is_key_condition=argument == "KeyConditionExpression"
+                )
+                names.update(built.attribute_name_placeholders)
+                values.update(
+                    {
+                        k: normalize(v)
+                        for k, v in built.attribute_value_placeholders.items()
+                    }
+                )
+                expression = built.condition_expression
+            strings[argument] = expression
+
+        parsed = {}
+        for argument, expression in strings.items():
+            parser = Parser(expression, names, values)
+            if argument == "UpdateExpression":
+                parsed[argument] = parser.parse_update()
+            elif argument == "ProjectionExpression":
+                parsed[argument] = parser.parse_projection()
+            else:
+                parsed[argument] = parser.parse_condition()
+
+        return parsed
+
+    def check(self, condition, item, operation):
+        if condition is not None and not test(condition, item or {}):
+            raise client_error(
+                "ConditionalCheckFailedException",
+                "The conditional request failed",
+                operation,
+            )
+
+    def returned(self, return_values, old, new, touched=()):
+        if return_values == "ALL_NEW":
+            return {"Attributes": copy.deepcopy(new)} if new else {}
+        if return_values == "ALL_OLD":
+            return {"Attributes": copy.deepcopy(old)} if old else {}
+        if return_values in ("UPDATED_NEW", "UPDATED_OLD"):
+            source = new if return_values == "UPDATED_NEW" else old
+            attributes = {
+                name: copy.deepcopy(source[name])
+                for name in touched
+                if source and name in source
+            }
+            return {"Attributes": attributes} if attributes else {}
+        return {}
+
+    def get_item(
+        self, Key, ProjectionExpression=None, ExpressionAttributeNames=None, **_
+    ):
+        self.record("GetItem")
+        item = self.fetch(Key, ProjectionExpression, ExpressionAttributeNames)
+        if item is None:
+            return {"ResponseMetadata": {"HTTPStatusCode": 200}}
+        return {"Item": item, "ResponseMetadata": {"HTTPStatusCode": 200}}
+
+    def fetch(self, key, projection=None, names=None):
+        """
+        copy of the item stored under key, None when there is none
+        """
+        parsed = self.build("GetItem", names, ProjectionExpression=projection)
+        with self.lock:
+            item = self.items.get(self.get_key(normalize(key), "GetItem"))
+            if item is None:
+                return None
+            if "ProjectionExpression" in parsed:
+                return project(item, parsed["ProjectionExpression"])
+            return copy.deepcopy(item)
+
+    def put_item(
+        self,
+        Item,
+        ConditionExpression=None,
+        ExpressionAttributeNames=None,
+        ExpressionAttributeValues=None,
+        ReturnValues="NONE",
+        **_,
+    ):
+        self.record("PutItem")
+        parsed = self.build(
+            "PutItem",
+            ExpressionAttributeNames,
+            ExpressionAttributeValues,
+            ConditionExpression=ConditionExpression,
+        )
+        item = normalize(Item)
+        key = self.get_key(item, "PutItem")
+        with self.lock:
+            old = self.items.get(key)
+            self.check(parsed.get("ConditionExpression"), old, "PutItem")
+            self.items[key] = item
+        response = self.returned(ReturnValues, old, None)
+        response["ResponseMetadata"] = {"HTTPStatusCode": 200}
+        return response
+
+    def update_item(
+        self,
+        Key,
+        UpdateExpression=None,
+        ConditionExpression=None,
+        ExpressionAttributeNames=None,
+        ExpressionAttributeValues=None,
+        ReturnValues="NONE",
+        **_,
+    ):
+        self.record("UpdateItem")
+        parsed = self.build(
+            "UpdateItem",
+            ExpressionAttributeNames,
+            ExpressionAttributeValues,
+            UpdateExpression=UpdateExpression,
+            ConditionExpression=ConditionExpression,
+        )
+        key_item = normalize(Key)
+        key = self.get_key(key_item, "UpdateItem")
+        actions = parsed.get("UpdateExpression", {clause: [] for clause in CLAUSES})
+
+        with self.lock:
+            old = self.items.get(key)
+            self.check(parsed.get("ConditionExpression"), old, "UpdateItem")
+
+            new = copy.deepcopy(old) if old else dict(key_item)
+            # operands are evaluated against the item before the update
+            assignments = [
+                (path[1], evaluate(value, old or {})) for path, value in actions["SET"]
+            ]
+            for path, value in assignments:
+                if value is MISSING:
+                    raise client_error(
+                        "ValidationException",
+                        "The provided expression refers to an attribute that does not "
+                        "exist in the item",
+                        "UpdateItem",
+                    )
+                set_path(new, path, copy.deepcopy(value), "UpdateItem")
+            for path, _ in actions["REMOVE"]:
+                remove_path(new, path[1], "UpdateItem")
+            for path, value in actions["ADD"]:
+                current, value = resolve(new, path[1]), evaluate(value, old or {})
+                if current is MISSING:
+                    set_path(new, path[1], value, "UpdateItem")
+                elif isinstance(current, set):
+                    current |= value
+                else:
+                    set_path(new, path[1], current + value, "UpdateItem")
+            for path, value in actions["DELETE"]:
+                current = resolve(new, path[1])
+                if isinstance(current, set):
+                    current -= evaluate(value, old or {})
+
+            self.items[key] = new
+
+        touched = {path[1][0] for clause in CLAUSES for path, _ in actions[clause]}
+        response = self.returned(ReturnValues, old, new, touched)
+        response["ResponseMetadata"] = {"HTTPStatusCode": 200}
+        return response
+
+    def delete_item(
+        self,
+        Key,
+        ConditionExpression=None,
+        ExpressionAttributeNames=None,
+        ExpressionAttributeValues=None,
+        ReturnValues="NONE",
+        **_,
+    ):
+        self.record("DeleteItem")
+        parsed = self.build(
+            "DeleteItem",
+            ExpressionAttributeNames,
+            ExpressionAttributeValues,
+            ConditionExpression=ConditionExpression,
+        )
+        key = self.get_key(normalize(Key), "DeleteItem")
+        with self.lock:
+            old = self.items.get(key)
+            self.check(parsed.get("ConditionExpression"), old, "DeleteItem")
+            self.items.pop(key, None)
+        response = self.returned(ReturnValues, old, None)
+        response["ResponseMetadata"] = {"HTTPStatusCode": 200}
+        return response
+
+    def read_page(
+        self, operation, candidates, parsed, Limit, ExclusiveStartKey, Select
+    ):
+        if ExclusiveStartKey:
+            start = self.get_key(normalize(ExclusiveStartKey), operation)
+            keys = [self.get_key(item, operation) for item in candidates]
+            candidates = candidates[keys.index(start) + 1 :] if start in keys else []
+
+        page = candidates[:Limit] if Limit else candidates
+        items = [
+            item
+            for item in page
+            if "FilterExpression" not in parsed
+            or test(parsed["FilterExpression"], item)
+        ]
+
+        response = {
+            "Count": len(items),
+            "ScannedCount": len(page),
+            "ResponseMetadata": {"HTTPStatusCode": 200},
+        }
+        if Select != "COUNT":
+            if "ProjectionExpression" in parsed:
+                items = [
+                    project(item, parsed["ProjectionExpression"]) for item in items
+                ]
+            response["Items"] = copy.deepcopy(items)
+        if Limit and len(candidates) > Limit:
+            response["LastEvaluatedKey"] = {
+                key_name: page[-1][key_name] for key_name in self.key_names
+            }
+
+        return response
+
+    def query(
+        self,
+        KeyConditionExpression,
+        FilterExpression=None,
+        ProjectionExpression=None,
+        ExpressionAttributeNames=None,
+        ExpressionAttributeValues=None,
+        IndexName=None,
+        Limit=None,
+        ExclusiveStartKey=None,
+        ScanIndexForward=True,
+        Select=None,
+        **_,
+    ):
+        self.record("Query")
+        parsed = self.build(
+            "Query",
+            ExpressionAttributeNames,
+            ExpressionAttributeValues,
+            KeyConditionExpression=KeyConditionExpression,
+            FilterExpression=FilterExpression,
+            ProjectionExpression=ProjectionExpression,
+        )
+        key_condition = parsed["KeyConditionExpression"]
+        sort_key = self.get_sort_key(key_condition, IndexName)
+
+        with self.lock:
+            candidates = [
+                item for item in self.items.values() if test(key_condition, item)
+            ]
+        if sort_key:
+            candidates.sort(key=lambda item: item.get(sort_key, ""))
+        if not ScanIndexForward:
+            candidates.reverse()
+
+        return self.read_page(
+            "Query", candidates, parsed, Limit, ExclusiveStartKey, Select
+        )
+
+    def get_sort_key(self, key_condition, index_name):
+        """
+        attribute the query results are ordered by, the range key of the table or the
+        second attribute of an index key condition
+        """
+        if not index_name:
+            return self.key_names[1] if len(self.key_names) > 1 else None
+
+        names = []
+
+        def collect(node):
+            if isinstance(node, tuple) and node and node[0] == "path":
+                names.append(node[1][0])
+            elif isinstance(node, tuple):
+                for child in node[1:]:
+                    collect(child)
+
+        collect(key_condition)
+        names = list(dict.fromkeys(names))
+
+        return names[1] if len(names) > 1 else None
+
+    def scan(
+        self,
+        FilterExpression=None,
+        ProjectionExpression=None,
+        ExpressionAttributeNames=None,
+        ExpressionAttributeValues=None,
+        Limit=None,
+        ExclusiveStartKey=None,
+        Select=None,
+        **_,
+    ):
+        self.record("Scan")
+        parsed = self.build(
+            "Scan",
+            ExpressionAttributeNames,
+            ExpressionAttributeValues,
+            FilterExpression=FilterExpression,
+            ProjectionExpression=ProjectionExpression,
+        )
+        with self.lock:
+            candidates = list(self.items.values())
+
+        return self.read_page(
+            "Scan", candidates, parsed, Limit, ExclusiveStartKey, Select
+        )
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        return BatchWriter(self)
+
+    def write(self, requests):
+        """
+        apply ("put", item) and ("delete", key) requests
+        """
+        with self.lock:
+            for action, value in requests:
+                value = normalize(value)
+                key = self.get_key(value, "BatchWriteItem")
+                if action == "put":
+                    self.items[key] = value
+                else:
+                    self.items.pop(key, None)
+
+    def load(self, items):
+        """
+        seed the table with items, bypassing the request accounting
+        """
+        with self.lock:
+            for item in items:
+                item = normalize(item)
+                self.items[self.get_key(item, "Load")] = item
+
+    def dump(self):
+        """
+        items of the table ordered by key
+        """
+        with self.lock:
+            return [
+                copy.deepcopy(self.items[key])
+                for key in sorted(self.items, key=lambda key: tuple(map(str, key)))
+            ]
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+class BatchWriter:
+    """
+    Table.batch_writer stand-in, buffered writes are flushed 25 at a time
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.buffer = []
+
+    def put_item(self, Item):
+        self.buffer.append(("put", Item))
+        self.flush(full=True)
+
+    def delete_item(self, Key):
+        self.buffer.append(("delete", Key))
+        self.flush(full=True)
+
+    def flush(self, full=False):
+        while self.buffer and (not full or len(self.buffer) >= 25):
+            chunk, self.buffer = self.buffer[:25], self.buffer[25:]
+            self.table.record("BatchWriteItem")
+            self.table.write(chunk)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.flush()
@@ -0,0 +1,378 @@
+"""
+replay a recorded corpus through a handler against the stand-ins, with a frozen
+clock, seeded uuids and fixed rpc results, and diff the outcome of two revisions
+
+    python test/benchmark/replay.py run FUNCTION corpus.jsonl.gz [--out result.json]
+    python test/benchmark/replay.py compare FUNCTION corpus.jsonl.gz --base REV
+        [--head REV]
+
+FUNCTION is a function of template.yml, by logical id or handler, like
+RPPWorkorderOrderOfferingKStreamProcessor or event_stream.process_stream.
+"""
+import argparse
+import datetime
+import importlib
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+from decimal import Decimal
+
+BENCHMARK = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.abspath(os.path.join(BENCHMARK, "..", ".."))
+
+sys.path.insert(0, BENCHMARK)
+
+from corpus import Corpus  # noqa: E402
+
+# one worker keeps the order of writes, messages and uuids the same between runs
+REPLAY_ENVIRONMENT = {
+    "BATCH_MAX_WORKERS": "1",
+    "RPC_MAX_IN_FLIGHT": "1",
+}
+
+SEED = 1000000
+
+
+class Clock:
+    """
+    time.time(), datetime.now() and datetime.utcnow() of the handlers, set to the
+    time of the batch being replayed
+    """
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def time_ns(self):
+        return int(self.now * 1e9)
+
+
+def freeze(clock, seed=SEED):
+    """
+    route the clock and uuid4 of every module imported from now on to clock and a
+    seeded generator
+    """
+    real_datetime = datetime.datetime
+
+    class FrozenDateTime(real_datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return cls.fromtimestamp(clock.now, tz)
+
+        @classmethod
+        def utcnow(cls):
+            return cls.fromtimestamp(clock.now, datetime.timezone.utc).replace(
+                tzinfo=None
+            )
+
+        @classmethod
+        def today(cls):
+            return cls.now()
+
+    time.time = clock.time
+    time.time_ns = clock.time_ns
+    datetime.datetime = FrozenDateTime
+
+    generator = random.Random(seed)
+    uuid.uuid4 = lambda: uuid.UUID(int=generator.getrandbits(128), version=4)
+
+
+def cloudformation_loader():
+    """
+    yaml loader that keeps the value of intrinsic functions, !Ref and the like
+    """
+    import yaml
+
+    class Loader(yaml.SafeLoader):
+        pass
+
+    def intrinsic(loader, tag, node):
+        if isinstance(node, yaml.ScalarNode):
+            value = loader.construct_scalar(node)
+        elif isinstance(node, yaml.SequenceNode):
+            value = loader.construct_sequence(node)
+        else:
+            value = loader.construct_mapping(node)
+        return {tag: value}
+
+    Loader.add_multi_constructor("!", intrinsic)
+    return Loader
+
+
+def find_function(name, template_path=os.path.join(ROOT, "template.yml")):
+    """
+    handler and literal environment of a template.yml function, intrinsic values
+    are left to the stand-in defaults
+    """
+    import yaml
+
+    with open(template_path) as template_file:
+        template = yaml.load(template_file, Loader=cloudformation_loader())
+
+    environment = {}
+    variables = (
+        template.get("Globals", {})
+        .get("Function", {})
+        .get("Environment", {})
+        .get("Variables", {})
+    )
+    environment.update(variables)
+
+    functions = {
+        logical_id: resource["Properties"]
+        for logical_id, resource in template["Resources"].items()
+        if resource.get("Type") == "AWS::Serverless::Function"
+    }
+    if name in functions:
+        properties = functions[name]
+    else:
+        matches = [p for p in functions.values() if p.get("Handler") == name]
+        if not matches:
+            raise ValueError(f"no function {name} in {template_path}")
+        properties = matches[0]
+
+    environment.update(properties.get("Environment", {}).get("Variables", {}))
+    literals = {
+        key: str(value).lower() if isinstance(value, bool) else str(value)
+        for key, value in environment.items()
+        if not isinstance(value, dict)
+    }
+
+    return properties["Handler"], literals
+
+
+def to_json(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace")
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=str)
+
+    return str(value)
+
+
+def replay(function, corpus_path, src, repeat=1):
+    """
+    result of replaying the corpus repeat times, the state and calls of the last run
+    """
+    handler_name, environment = find_function(function)
+    for key, value in dict(environment, **REPLAY_ENVIRONMENT).items():
+        os.environ[key] = value
+
+    clock = Clock()
+    freeze(clock)
+
+    from bench_handlers import LambdaContext
+    from stand_ins import StandIns, install
+
+    # ahead of the src bench_handlers put on the path
+    sys.path.insert(0, src)
+
+    corpus = Corpus.load(corpus_path)
+    fixtures = {
+        name: (lambda value: lambda *_, **__: value)(value)
+        for name, value in corpus.header.get("rpc", {}).items()
+    }
+    stand_ins = StandIns(rpc=fixtures)
+    install(stand_ins)
+
+    module_name, _, function_name = handler_name.rpartition(".")
+    handler = getattr(importlib.import_module(module_name), function_name)
+
+    seconds = []
+    for _ in range(repeat):
+        stand_ins.reset()
+        stand_ins.seed(corpus.header.get("tables", {}))
+        elapsed = 0.0
+        for batch in corpus.batches:
+            clock.now = batch["time"]
+            event = {"Records": batch["Records"]}
+            start = time.perf_counter()
+            handler(event, LambdaContext())
+            elapsed += time.perf_counter() - start
+        seconds.append(elapsed)
+
+    return {
+        "function": function,
+        "handler": handler_name,
+        "src": src,
+        "records": corpus.records,
+        "seconds": min(seconds),
+        "calls": dict(sorted(stand_ins.recorder.calls.items())),
+        "state": json.loads(json.dumps(stand_ins.state(), default=to_json)),
+    }
+
+
+def diff_items(base, head):
+    """
+    (added, removed) of two lists, compared as multisets
+    """
+    base_counts = Counter(json.dumps(item, sort_keys=True) for item in base)
+    head_counts = Counter(json.dumps(item, sort_keys=True) for item in head)
+
+    return (
+        sorted((head_counts - base_counts).elements()),
+        sorted((base_counts - head_counts).elements()),
+    )
+
+
+def diff_state(base, head):
+    """
+    {"tables/<name>": (added, removed), ...} of the parts of the state that differ
+    """
+    differences = {}
+    for part in sorted(set(base) | set(head)):
+        base_part = base.get(part, {})
+        head_part = head.get(part, {})
+        for name in sorted(set(base_part) | set(head_part)):
+            base_items = base_part.get(name, [])
+            head_items = head_part.get(name, [])
+            if not isinstance(base_items, list):
+                base_items, head_items = [base_items], [head_items]
+            added, removed = diff_items(base_items, head_items)
+            if added or removed:
+                differences[f"{part}/{name}"] = (added, removed)
+
+    return differences
+
+
+def diff_calls(base, head):
+    return {
+        call: (base.get(call, 0), head.get(call, 0))
+        for call in sorted(set(base) | set(head))
+        if base.get(call, 0) != head.get(call, 0)
+    }
+
+
+def checkout(revision, directory):
+    """
+    src of revision, the working tree when revision is None
+    """
+    if revision is None:
+        return os.path.join(ROOT, "src")
+
+    subprocess.run(
+        ["git", "-C", ROOT, "worktree", "add", "--detach", directory, revision],
+        check=True,
+        capture_output=True,
+    )
+    return os.path.join(directory, "src")
+
+
+def run_revision(args, revision):
+    with tempfile.TemporaryDirectory() as directory:
+        worktree = os.path.join(directory, "worktree")
+        src = checkout(revision, worktree)
+        out = os.path.join(directory, "result.json")
+        try:
+            subprocess.run(
+                [
+                    sys.executable,
+                    os.path.abspath(__file__),
+                    "run",
+                    args.function,
+                    args.corpus,
+                    "--src",
+                    src,
+                    "--repeat",
+                    str(args.repeat),
+                    "--out",
+                    out,
+                ],
+                check=True,
+            )
+            with open(out) as result_file:
+                return json.load(result_file)
+        finally:
+            if revision is not None:
+                subprocess.run(
+                    ["git", "-C", ROOT, "worktree", "remove", "--force", worktree],
+                    check=False,
+                    capture_output=True,
+                )
+
+
+def compare(args):
+    """
+    replay the corpus on base and head, each in a process of its own, and report
+    the differences, the exit status is 1 when the state differs
+    """
+    base = run_revision(args, args.base)
+    head = run_revision(args, args.head)
+
+    records = base["records"]
+    print(f"{args.function}, {records} records")
+    for name, result in (("base", base), ("head", head)):
+        rate = records / result["seconds"] if result["seconds"] else 0.0
+        print(f"{name:>6}: {result['seconds']:8.3f} s {rate:10.1f} records/s")
+    if head["seconds"]:
+        print(f"speedup: {base['seconds'] / head['seconds']:.2f}x")
+
+    for call, (base_count, head_count) in diff_calls(
+        base["calls"], head["calls"]
+    ).items():
+        print(f"  {call}: {base_count} -> {head_count}")
+
+    differences = diff_state(base["state"], head["state"])
+    if not differences:
+        print("state: identical")
+        return 0
+
+    for name, (added, removed) in differences.items():
+        print(f"state {name}: {len(added)} added, {len(removed)} removed")
+        for item in removed[: args.show]:
+            print(f"  - {item}")
+        for item in added[: args.show]:
+            print(f"  + {item}")
+
+    return 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="replay in this process")
+    run_parser.add_argument("function")
+    run_parser.add_argument("corpus")
+    run_parser.add_argument("--src", default=os.path.join(ROOT, "src"))
+    run_parser.add_argument("--repeat", type=int, default=1)
+    run_parser.add_argument("--out", help="result file, stdout by default")
+
+    compare_parser = commands.add_parser("compare", help="diff two revisions")
+    compare_parser.add_argument("function")
+    compare_parser.add_argument("corpus")
+    compare_parser.add_argument("--base", required=True, help="git revision")
+    compare_parser.add_argument(
+        "--head", help="git revision, the working tree by default"
+    )
+    compare_parser.add_argument("--repeat", type=int, default=3)
+    compare_parser.add_argument(
+        "--show", type=int, default=5, help="differing items shown of each part"
+    )
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        return compare(args)
+
+    result = replay(args.function, args.corpus, args.src, args.repeat)
+    if args.out:
+        with open(args.out, "w") as result_file:
+            json.dump(result, result_file)
+    else:
+        print(json.dumps(result, indent=2))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,409 @@
+"""
+in memory stand-ins of the aws services and rpc lookups the handlers call, install()
+has to run before a handler module is imported since handlers build their clients
+at import time
+"""
+import copy
+import io
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+import boto3
+
+from memory_table import MemoryTable
+
+# what template.yml gives the functions, table and queue names are the ones the
+# stand-ins are seeded with
+ENVIRONMENT = {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "benchmark",
+    "AWS_SECRET_ACCESS_KEY": "benchmark",
+    "AWS_XRAY_SDK_ENABLED": "false",
+    "AWS_XRAY_CONTEXT_MISSING": "IGNORE_ERROR",
+    "AWS_CODEGURU_PROFILER_ENABLED": "false",
+    "AWS_CODEGURU_PROFILER_GROUP_NAME": "rpp-workorder-benchmark",
+    "POWERTOOLS_SERVICE_NAME": "rpp-workorder-benchmark",
+    "POWERTOOLS_TRACE_DISABLED": "true",
+    "POWERTOOLS_METRICS_NAMESPACE": "rpp-workorder-benchmark",
+    "LOG_LEVEL": "ERROR",
+    "POWERTOOLS_LOG_LEVEL": "ERROR",
+    "STAGE_METRICS": "false",
+    "WORKORDER_TABLE": "rpp-workorder",
+    "WORKORDER_AM_TABLE": "rpp-recon-work-order",
+    "RPP_RECON_WORK_ORDER_TABLE": "rpp-recon-work-order",
+    "CATEGORY_TABLE": "rpp-labor-category",
+    "SALE_EVENT_TABLE": "rpp-sale-event",
+    "WORKORDER_QUEUE": "rpp-workorder-queue",
+    "QUEUE": "rpp-workorder-queue",
+    "RETRY_QUEUE": "rpp-workorder-queue",
+    "WCI_RETRY_QUEUE": "rpp-work-complete-retry-queue",
+    "DL_QUEUE": "rpp-workorder-dlq",
+    "RETRY_DELAY_SEC": "900",
+    "STREAM": "rpp-workorder-stream",
+    "CHUNK_SIZE": "500",
+    "ES_ENDPOINT": "localhost",
+    "RECON_WORKORDER_KINESIS_STREAM_ARN": (
+        "arn:aws:kinesis:us-east-1:000000000000:stream/rpp-recon-workorder"
+    ),
+}
+
+# key attributes of the tables, the others are keyed by pk and sk
+KEY_NAMES = {
+    "rpp-workorder": ("work_order_key", "site_id"),
+    "rpp-labor-category": ("key",),
+}
+
+OK = {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+
+class Recorder:
+    """
+    Counts the calls made to the stand-ins as "service.Operation", each call
+    sleeps for the latency of its kind to stand in for the network round trip.
+    """
+
+    def __init__(self, aws_latency=0.0, rpc_latency=0.0):
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        self.aws_latency = aws_latency
+        self.rpc_latency = rpc_latency
+
+    def record(self, service, operation):
+        with self.lock:
+            self.calls[f"{service}.{operation}"] += 1
+
+        latency = self.rpc_latency if service == "rpc" else self.aws_latency
+        if latency:
+            time.sleep(latency)
+
+    def recorder(self, service):
+        return lambda operation: self.record(service, operation)
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+
+
+class DynamoDBResource:
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self.tables = {}
+        self.lock = threading.Lock()
+
+    def Table(self, name):
+        with self.lock:
+            if name not in self.tables:
+                self.tables[name] = MemoryTable(
+                    name,
+                    KEY_NAMES.get(name, ("pk", "sk")),
+                    self.recorder.recorder("dynamodb"),
+                )
+            return self.tables[name]
+
+    def batch_get_item(self, RequestItems, **_):
+        self.recorder.record("dynamodb", "BatchGetItem")
+        responses = {}
+        for name, request in RequestItems.items():
+            table = self.Table(name)
+            items = (
+                table.fetch(
+                    key,
+                    request.get("ProjectionExpression"),
+                    request.get("ExpressionAttributeNames"),
+                )
+                for key in request["Keys"]
+            )
+            responses[name] = [item for item in items if item is not None]
+        return dict(OK, Responses=responses, UnprocessedKeys={})
+
+    def batch_write_item(self, RequestItems, **_):
+        self.recorder.record("dynamodb", "BatchWriteItem")
+        for name, requests in RequestItems.items():
+            self.Table(name).write(
+                (
+                    ("put", request["PutRequest"]["Item"])
+                    if "PutRequest" in request
+                    else ("delete", request["DeleteRequest"]["Key"])
+                )
+                for request in requests
+            )
+        return dict(OK, UnprocessedItems={})
+
+
+class Queue:
+    def __init__(self, name, recorder):
+        self.name = name
+        self.url = f"https://sqs.us-east-1.amazonaws.com/000000000000/{name}"
+        self.recorder = recorder
+        self.messages = []
+
+    def send_message(self, MessageBody, **kwargs):
+        self.recorder.record("sqs", "SendMessage")
+        self.messages.append(dict(kwargs, MessageBody=MessageBody))
+        return dict(OK, MessageId=str(len(self.messages)))
+
+    def send_messages(self, Entries):
+        self.recorder.record("sqs", "SendMessageBatch")
+        self.messages.extend(Entries)
+        return dict(OK, Successful=[{"Id": entry["Id"]} for entry in Entries])
+
+
+class SQS:
+    """
+    both the sqs resource and client
+    """
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self.queues = {}
+
+    def get_queue(self, name_or_url):
+        name = name_or_url.rsplit("/", 1)[-1]
+        if name not in self.queues:
+            self.queues[name] = Queue(name, self.recorder)
+        return self.queues[name]
+
+    def Queue(self, url):
+        return self.get_queue(url)
+
+    def get_queue_by_name(self, QueueName, **_):
+        self.recorder.record("sqs", "GetQueueUrl")
+        return self.get_queue(QueueName)
+
+    def get_queue_url(self, QueueName, **_):
+        self.recorder.record("sqs", "GetQueueUrl")
+        return dict(OK, QueueUrl=self.get_queue(QueueName).url)
+
+    def send_message(self, QueueUrl, MessageBody, **kwargs):
+        return self.get_queue(QueueUrl).send_message(MessageBody, **kwargs)
+
+    def send_message_batch(self, QueueUrl, Entries):
+        return self.get_queue(QueueUrl).send_messages(Entries)
+
+    def delete_message(self, QueueUrl, ReceiptHandle):
+        self.recorder.record("sqs", "DeleteMessage")
+        return OK
+
+
+class Kinesis:
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self.streams = {}
+        self.lock = threading.Lock()
+
+    def put(self, stream, records):
+        name = stream.rsplit("/", 1)[-1]
+        with self.lock:
+            shard = self.streams.setdefault(name, [])
+            start = len(shard)
+            shard.extend(records)
+        return [
+            {"ShardId": "shardId-000000000000", "SequenceNumber": str(start + offset)}
+            for offset in range(len(records))
+        ]
+
+    def put_record(self, Data, PartitionKey, StreamName=None, StreamARN=None, **_):
+        self.recorder.record("kinesis", "PutRecord")
+        (result,) = self.put(
+            StreamName or StreamARN, [{"Data": Data, "PartitionKey": PartitionKey}]
+        )
+        return dict(OK, **result)
+
+    def put_records(self, Records, StreamName=None, StreamARN=None, **_):
+        self.recorder.record("kinesis", "PutRecords")
+        results = self.put(StreamName or StreamARN, list(Records))
+        return dict(OK, FailedRecordCount=0, Records=results)
+
+
+class Lambda:
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self.invocations = []
+
+    def invoke(self, FunctionName, Payload=b"", **kwargs):
+        self.recorder.record("lambda", "Invoke")
+        self.invocations.append(
+            dict(kwargs, FunctionName=FunctionName, Payload=Payload)
+        )
+        return dict(OK, StatusCode=200, Payload=io.BytesIO(b"{}"))
+
+
+class SSM:
+    def __init__(self, recorder):
+        self.recorder = recorder
+
+    def get_parameter(self, Name, **_):
+        self.recorder.record("ssm", "GetParameter")
+        return dict(OK, Parameter={"Name": Name, "Value": "benchmark"})
+
+
+class Elasticsearch:
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self.documents = {}
+
+    def index(self, index, body, id=None, **_):
+        self.recorder.record("es", "Index")
+        self.documents[(index, id)] = copy.deepcopy(body)
+        return {"result": "created", "_id": id}
+
+    def delete(self, index, id=None, **_):
+        self.recorder.record("es", "Delete")
+        self.documents.pop((index, id), None)
+        return {"result": "deleted", "_id": id}
+
+
+def get_pfvehicle(*args, work_order_key=None, **_):
+    work_order_key = work_order_key or (args[0] if args else "0#BNCH")
+    sblu, _, site_id = work_order_key.partition("#")
+    return json.dumps(
+        {
+            "work_order_key": work_order_key,
+            "sblu": sblu,
+            "site_id": site_id,
+            "work_order_number": sblu[-7:],
+            "pfvehicle": {"vin": "1FTFW1E50KF" + sblu[-6:].zfill(6)},
+        }
+    )
+
+
+def get_unit(unit_id, *_, **__):
+    return {
+        "href": f"https://api.manheim.com/units/id/{unit_id}",
+        "vin": "1FTFW1E50KF" + str(unit_id)[-6:].zfill(6),
+        "contact": {"companyName": "BENCHMARK MOTORS"},
+        "account": {"groupCode": "BNCH"},
+    }
+
+
+def get_labor_status(*_, **__):
+    return {
+        "current_status": {
+            "labor_status": "APPROVED",
+            "date": "2024-03-07T12:00:00.000Z",
+            "source": "benchmark",
+        }
+    }
+
+
+# rpp_lib.rpc lookups the handlers import, keyed by name
+RPC = {
+    "get_approval": lambda *_, **__: [],
+    "get_capture": lambda *_, **__: {},
+    "get_labor_status": get_labor_status,
+    "get_offering": lambda *_, **__: [],
+    "get_pfvehicle": get_pfvehicle,
+    "get_unit": get_unit,
+    "get_work_credit": lambda *_, **__: {},
+}
+
+
+class StandIns:
+    """
+    the aws services of one benchmark process, shared by every handler imported in it
+    """
+
+    def __init__(self, aws_latency=0.0, rpc_latency=0.0, rpc=None):
+        self.recorder = Recorder(aws_latency, rpc_latency)
+        self.dynamodb = DynamoDBResource(self.recorder)
+        self.sqs = SQS(self.recorder)
+        self.kinesis = Kinesis(self.recorder)
+        self.lambda_ = Lambda(self.recorder)
+        self.ssm = SSM(self.recorder)
+        self.es = Elasticsearch(self.recorder)
+        self.rpc = dict(RPC, **(rpc or {}))
+
+    def resource(self, service_name, *_, **__):
+        return {"dynamodb": self.dynamodb, "sqs": self.sqs}[service_name]
+
+    def client(self, service_name, *_, **__):
+        return {
+            "kinesis": self.kinesis,
+            "lambda": self.lambda_,
+            "sqs": self.sqs,
+            "ssm": self.ssm,
+        }[service_name]
+
+    def stub(self, name):
+        def call(*args, **kwargs):
+            self.recorder.record("rpc", name)
+            return copy.deepcopy(self.rpc[name](*args, **kwargs))
+
+        call.__name__ = name
+        return call
+
+    def seed(self, tables):
+        """
+        load {table name: [items]} into the tables
+        """
+        for name, items in tables.items():
+            self.dynamodb.Table(name).load(items)
+
+    def reset(self):
+        """
+        empty the tables, queues and streams, the objects handlers hold stay valid
+        """
+        for table in self.dynamodb.tables.values():
+            table.clear()
+        for queue in self.sqs.queues.values():
+            queue.messages.clear()
+        self.kinesis.streams.clear()
+        self.lambda_.invocations.clear()
+        self.es.documents.clear()
+        self.recorder.reset()
+
+    def state(self):
+        """
+        contents of every table, queue and stream
+        """
+        return {
+            "tables": {
+                name: table.dump()
+                for name, table in sorted(self.dynamodb.tables.items())
+            },
+            "queues": {
+                name: list(queue.messages)
+                for name, queue in sorted(self.sqs.queues.items())
+            },
+            "streams": {
+                name: list(records)
+                for name, records in sorted(self.kinesis.streams.items())
+            },
+            "es": {
+                f"{index}/{_id}": document
+                for (index, _id), document in sorted(self.es.documents.items())
+            },
+        }
+
+
+class Session:
+    def __init__(self, stand_ins):
+        self.stand_ins = stand_ins
+
+    def client(self, service_name, *args, **kwargs):
+        return self.stand_ins.client(service_name, *args, **kwargs)
+
+    def resource(self, service_name, *args, **kwargs):
+        return self.stand_ins.resource(service_name, *args, **kwargs)
+
+
+def install(stand_ins):
+    """
+    route boto3, rpp_lib.rpc and rpp_lib.aws.get_es to the stand-ins
+    """
+    for name, value in ENVIRONMENT.items():
+        os.environ.setdefault(name, value)
+
+    boto3.resource = stand_ins.resource
+    boto3.client = stand_ins.client
+    boto3.Session = lambda *_, **__: Session(stand_ins)
+
+    import rpp_lib.aws
+    import rpp_lib.rpc
+
+    for name in stand_ins.rpc:
+        setattr(rpp_lib.rpc, name, stand_ins.stub(name))
+    rpp_lib.aws.get_es = lambda *_, **__: stand_ins.es
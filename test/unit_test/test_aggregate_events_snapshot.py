@@ -0,0 +1,98 @@
+import os
+from unittest import mock
+
+import pytest
+
+for name, value in {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "WORKORDER_TABLE": "rpp-workorder",
+    "WORKORDER_AM_TABLE": "rpp-recon-work-order",
+    "CATEGORY_TABLE": "rpp-labor-category",
+    "SALE_EVENT_TABLE": "rpp-sale-event",
+    "WORKORDER_QUEUE": "rpp-workorder-queue",
+    "QUEUE": "rpp-workorder-queue",
+}.items():
+    os.environ.setdefault(name, value)
+
+# the queue urls are looked up when the modules are imported
+with mock.patch("utils.resources.queue"):
+    import aggregate_events  # noqa: E402
+from aggregate_events import update_repair_status_approval_flag  # noqa: E402
+from dynamodb.store import WorkOrderSnapshot  # noqa: E402
+from utils.metrics import COUNTS  # noqa: E402
+
+WORK_ORDER_KEY = "1000000#QLM1"
+DAMAGE = {
+    "item_code": "0520",
+    "sub_item_code": "09",
+    "damage_code": "CO",
+    "severity_code": "SV",
+    "action_code": "RP",
+    "approved": True,
+}
+STATUS_SK = "repair_labor_status:0520#09#CO#SV#RP"
+
+
+@pytest.fixture()
+def writes(monkeypatch):
+    writes = []
+    monkeypatch.setattr(
+        aggregate_events,
+        "put_work_order",
+        lambda wo_key, sk, record, **kwargs: writes.append((wo_key, sk, record)),
+    )
+    COUNTS.reset()
+    yield writes
+    COUNTS.reset()
+
+
+def snapshot(*sks):
+    return WorkOrderSnapshot(WORK_ORDER_KEY, [{"sk": sk} for sk in sks])
+
+
+def test_snapshot_contains():
+    work_order = snapshot(STATUS_SK, "damage:0520#09#CO#SV#RP")
+
+    assert STATUS_SK in work_order
+    assert "repair_labor_status:0520#09#CO#SV#RR" not in work_order
+    assert list(work_order.begins_with("damage:")) == ["damage:0520#09#CO#SV#RP"]
+
+
+def test_snapshot_put_and_pop():
+    work_order = snapshot()
+
+    work_order.put(STATUS_SK, {"approved": False})
+    work_order.put(STATUS_SK, {"updated_by": "user"})
+    assert work_order.get(STATUS_SK) == {
+        "approved": False,
+        "updated_by": "user",
+        "sk": STATUS_SK,
+    }
+    assert work_order.pop(STATUS_SK)["sk"] == STATUS_SK
+    assert STATUS_SK not in work_order
+
+
+def test_status_missing_from_snapshot_is_skipped(writes):
+    update_repair_status_approval_flag(
+        WORK_ORDER_KEY, DAMAGE, "user", snapshot("damage:0520#09#CO#SV#RP")
+    )
+
+    assert writes == []
+    assert COUNTS.counts["SkippedApprovalFlags"] == 1
+
+
+def test_status_in_snapshot_is_updated(writes):
+    update_repair_status_approval_flag(
+        WORK_ORDER_KEY, DAMAGE, "user", snapshot(STATUS_SK)
+    )
+
+    assert [(wo_key, sk) for wo_key, sk, _ in writes] == [(WORK_ORDER_KEY, STATUS_SK)]
+    assert writes[0][2]["approved"] is True
+    assert writes[0][2]["updated_by"] == "user"
+    assert not COUNTS.counts["SkippedApprovalFlags"]
+
+
+def test_status_without_snapshot_is_updated(writes):
+    update_repair_status_approval_flag(WORK_ORDER_KEY, DAMAGE, "user")
+
+    assert [sk for _, sk, _ in writes] == [STATUS_SK]
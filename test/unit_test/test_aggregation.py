@@ -0,0 +1,236 @@
+import base64
+import hashlib
+import json
+
+import pytest
+
+from utils.aggregation import (
+    MAGIC,
+    MAX_SIZE,
+    aggregate,
+    aggregate_entries,
+    deaggregate,
+    deaggregate_records,
+    decode_varint,
+    encode_field,
+    encode_varint,
+    get_overhead,
+    get_record_size,
+    group_entries,
+    is_aggregated,
+)
+
+
+def kinesis_record(
+    data, sequence_number="49590338271490256608559692538361571095921575989136588898"
+):
+    return {
+        "kinesis": {
+            "kinesisSchemaVersion": "1.0",
+            "partitionKey": "first",
+            "sequenceNumber": sequence_number,
+            "data": base64.b64encode(data).decode("utf-8"),
+            "approximateArrivalTimestamp": 1545084650.987,
+        },
+        "eventSource": "aws:kinesis",
+        "eventID": f"shardId-000000000006:{sequence_number}",
+    }
+
+
+def kpl_record(partition_keys, explicit_hash_keys, records):
+    """
+    aggregated data the way the kpl writes it, records are
+    (partition key index, explicit hash key index or None, data)
+    """
+    message = b"".join(encode_field(1, key.encode("utf-8")) for key in partition_keys)
+    message += b"".join(
+        encode_field(2, key.encode("utf-8")) for key in explicit_hash_keys
+    )
+    for key_index, hash_key_index, data in records:
+        record = encode_field(1, key_index)
+        if hash_key_index is not None:
+            record += encode_field(2, hash_key_index)
+        message += encode_field(3, record + encode_field(3, data))
+
+    return MAGIC + message + hashlib.md5(message).digest()
+
+
+def user_records(records):
+    return [
+        (record["kinesis"]["partitionKey"], base64.b64decode(record["kinesis"]["data"]))
+        for record in records
+    ]
+
+
+@pytest.mark.parametrize("value", [0, 1, 127, 128, 300, 16384, 2**63 - 1])
+def test_varint_round_trip(value):
+    encoded = encode_varint(value)
+
+    assert decode_varint(encoded + b"rest", 0) == (value, len(encoded))
+
+
+def test_varint_truncated():
+    with pytest.raises(ValueError):
+        decode_varint(encode_varint(300)[:1], 0)
+
+
+def test_aggregate_round_trip():
+    datas = [json.dumps({"index": index}).encode("utf-8") for index in range(5)]
+    data = aggregate("work_order_key#1", datas)
+
+    assert is_aggregated(data)
+    assert deaggregate(data) == [("work_order_key#1", item) for item in datas]
+
+
+def test_aggregate_round_trip_through_lambda_records():
+    datas = [b'{"a": 1}', b"", "é".encode("utf-8") * 200]
+    records = deaggregate_records([kinesis_record(aggregate("pk", datas))])
+
+    assert user_records(records) == [("pk", item) for item in datas]
+    assert [record["kinesis"]["subSequenceNumber"] for record in records] == [0, 1, 2]
+    assert {record["kinesis"]["sequenceNumber"] for record in records} == {
+        "49590338271490256608559692538361571095921575989136588898"
+    }
+    assert all(record["eventSource"] == "aws:kinesis" for record in records)
+
+
+def test_deaggregate_multi_key_table():
+    data = kpl_record(
+        ["first", "second", "third"],
+        [],
+        [(0, None, b"1"), (2, None, b"2"), (1, None, b"3"), (0, None, b"4")],
+    )
+
+    assert deaggregate(data) == [
+        ("first", b"1"),
+        ("third", b"2"),
+        ("second", b"3"),
+        ("first", b"4"),
+    ]
+
+
+def test_deaggregate_explicit_hash_keys():
+    data = kpl_record(
+        ["first", "second"],
+        ["170141183460469231731687303715884105728", "0"],
+        [(0, 1, b"1"), (1, 0, b"2"), (1, None, b"3")],
+    )
+
+    assert user_records(deaggregate_records([kinesis_record(data)])) == [
+        ("first", b"1"),
+        ("second", b"2"),
+        ("second", b"3"),
+    ]
+
+
+def test_plain_records_pass_through():
+    records = [kinesis_record(b'{"eventName": "INSERT"}'), None, {}]
+
+    assert deaggregate_records(records) == [records[0]]
+
+
+def test_corrupt_trailer_passes_through():
+    data = bytearray(aggregate("pk", [b"1", b"2"]))
+    data[-1] ^= 0xFF
+    record = kinesis_record(bytes(data))
+
+    assert not is_aggregated(bytes(data))
+    assert deaggregate_records([record]) == [record]
+
+
+def test_truncated_record_passes_through():
+    data = aggregate("pk", [b"1", b"2"])
+    records = [kinesis_record(data[:-1]), kinesis_record(data[: len(MAGIC) + 3])]
+
+    assert deaggregate_records(records) == records
+
+
+def test_corrupt_protobuf_with_valid_trailer_passes_through():
+    message = encode_field(1, b"pk") + encode_field(3, encode_field(1, 5))
+    record = kinesis_record(MAGIC + message + hashlib.md5(message).digest())
+    truncated = encode_field(1, b"pk")[:-1]
+    truncated_record = kinesis_record(
+        MAGIC + truncated + hashlib.md5(truncated).digest()
+    )
+
+    assert deaggregate_records([record, truncated_record]) == [
+        record,
+        truncated_record,
+    ]
+
+
+def test_group_size_matches_aggregate():
+    entries = [
+        {"Data": b"x" * size, "PartitionKey": "pk"} for size in (0, 1, 127, 128, 5000)
+    ]
+    (group,) = group_entries(entries)
+
+    expected = get_overhead("pk") + sum(get_record_size(e["Data"]) for e in entries)
+    assert len(aggregate("pk", [entry["Data"] for entry in group])) == expected
+
+
+def test_group_split_at_max_size():
+    data = b"x" * 100
+    max_size = get_overhead("pk") + 3 * get_record_size(data)
+    entries = [{"Data": data, "PartitionKey": "pk"} for _ in range(4)]
+
+    groups = group_entries(entries[:3], max_size)
+    assert [len(group) for group in groups] == [3]
+    assert len(aggregate("pk", [e["Data"] for e in groups[0]])) == max_size
+
+    groups = group_entries(entries, max_size)
+    assert [len(group) for group in groups] == [3, 1]
+    groups = group_entries(entries[:3], max_size - 1)
+    assert [len(group) for group in groups] == [2, 1]
+
+
+def test_aggregates_stay_under_max_size():
+    entries = [
+        {"Data": b"x" * (index * 97 % 3000), "PartitionKey": f"pk{index % 3}"}
+        for index in range(300)
+    ]
+
+    for entry in aggregate_entries(entries):
+        assert len(entry["Data"]) <= MAX_SIZE
+
+
+def test_oversized_entry_is_left_alone():
+    entry = {"Data": b"x" * (MAX_SIZE + 1), "PartitionKey": "pk"}
+
+    assert aggregate_entries([entry]) == [entry]
+
+
+def test_aggregate_entries_keeps_key_order():
+    entries = [
+        {"Data": f"{key}{index}".encode("utf-8"), "PartitionKey": key}
+        for index, key in enumerate("abacbba")
+    ]
+    aggregated = aggregate_entries(entries)
+
+    assert [entry["PartitionKey"] for entry in aggregated] == ["a", "b", "c"]
+    assert aggregated[2] == entries[3]
+    records = deaggregate_records(
+        [kinesis_record(entry["Data"]) for entry in aggregated]
+    )
+    assert [data for _, data in user_records(records)] == [
+        b"a0",
+        b"a2",
+        b"a6",
+        b"b1",
+        b"b4",
+        b"b5",
+        b"c3",
+    ]
+
+
+def test_aggregate_entries_by_explicit_hash_key():
+    entries = [
+        {"Data": b"1", "PartitionKey": "pk", "ExplicitHashKey": "1"},
+        {"Data": b"2", "PartitionKey": "pk", "ExplicitHashKey": "2"},
+        {"Data": b"3", "PartitionKey": "pk", "ExplicitHashKey": "1"},
+    ]
+    aggregated = aggregate_entries(entries)
+
+    assert [entry.get("ExplicitHashKey") for entry in aggregated] == ["1", "2"]
+    assert deaggregate(aggregated[0]["Data"]) == [("pk", b"1"), ("pk", b"3")]
+    assert aggregated[1] == entries[1]
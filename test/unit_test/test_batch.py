@@ -0,0 +1,145 @@
+import base64
+import random
+import threading
+
+import pytest
+
+from utils.aggregation import aggregate, deaggregate_records
+from utils.batch import BatchItemFailures, get_sequence_number
+
+
+def kinesis_record(sequence_number, data="e30="):
+    return {
+        "kinesis": {"sequenceNumber": str(sequence_number), "data": data},
+        "eventSource": "aws:kinesis",
+    }
+
+
+def dynamodb_record(sequence_number):
+    return {"dynamodb": {"SequenceNumber": str(sequence_number)}}
+
+
+def test_get_sequence_number():
+    assert get_sequence_number(kinesis_record(12)) == "12"
+    assert get_sequence_number(dynamodb_record(34)) == "34"
+
+
+def test_no_failure():
+    records = [kinesis_record(number) for number in range(3)]
+    batch = BatchItemFailures(records)
+
+    assert list(batch) == records
+    assert not batch.failed
+    assert batch.response() == {"batchItemFailures": []}
+
+
+def test_iteration_stops_at_failure():
+    records = [kinesis_record(number) for number in range(5)]
+    batch = BatchItemFailures(records)
+
+    processed = []
+    for record in batch:
+        processed.append(record)
+        with batch.guard(record):
+            if record is records[2]:
+                raise ValueError("boom")
+
+    assert processed == records[:3]
+    assert batch.response() == {"batchItemFailures": [{"itemIdentifier": "2"}]}
+
+
+def test_lowest_sequence_number_wins():
+    batch = BatchItemFailures([])
+
+    batch.fail(dynamodb_record(20))
+    batch.fail(dynamodb_record(30))
+    assert batch.sequence_number == "20"
+    batch.fail(dynamodb_record(9))
+    assert batch.sequence_number == "9"
+
+
+def test_sequence_numbers_compare_as_numbers():
+    batch = BatchItemFailures([])
+
+    batch.fail(
+        kinesis_record("49590338271490256608559692538361571095921575989136588898")
+    )
+    batch.fail(kinesis_record("5"))
+
+    assert batch.response() == {"batchItemFailures": [{"itemIdentifier": "5"}]}
+
+
+def test_lowest_sequence_number_wins_across_threads():
+    numbers = list(range(1000, 1200))
+    random.Random(7).shuffle(numbers)
+    batch = BatchItemFailures([])
+    start = threading.Barrier(8)
+
+    def fail(chunk):
+        start.wait()
+        for number in chunk:
+            batch.fail(kinesis_record(number))
+
+    threads = [
+        threading.Thread(target=fail, args=(numbers[index::8],)) for index in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert batch.sequence_number == "1000"
+
+
+def test_skip():
+    records = [kinesis_record(number) for number in range(5)]
+    batch = BatchItemFailures(records)
+
+    assert not any(batch.skip(record) for record in records)
+    batch.fail(records[2])
+    assert [batch.skip(record) for record in records] == [
+        False,
+        False,
+        True,
+        True,
+        True,
+    ]
+
+
+def test_guard_fails_the_record():
+    record = kinesis_record(1)
+    batch = BatchItemFailures([record])
+
+    with batch.guard(record):
+        raise KeyError("missing")
+
+    assert batch.failed
+
+
+@pytest.mark.parametrize("failed_index", [0, 1, 2])
+def test_deaggregated_records_share_sequence_number(failed_index):
+    data = aggregate("pk", [b"{}", b"{}", b"{}"])
+    aggregated = kinesis_record("100", base64.b64encode(data).decode("utf-8"))
+    records = deaggregate_records(
+        [kinesis_record("50"), aggregated, kinesis_record("200")]
+    )
+    assert [get_sequence_number(record) for record in records] == [
+        "50",
+        "100",
+        "100",
+        "100",
+        "200",
+    ]
+    batch = BatchItemFailures(records)
+
+    processed = []
+    for index, record in enumerate(batch):
+        processed.append(record)
+        if index == failed_index + 1:
+            batch.fail(record)
+
+    # a failure of any user record replays the whole kinesis record it came in
+    assert batch.response() == {"batchItemFailures": [{"itemIdentifier": "100"}]}
+    assert len(processed) == failed_index + 2
+    assert all(batch.skip(record) for record in records[1:])
+    assert not batch.skip(records[0])
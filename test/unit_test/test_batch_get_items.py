@@ -0,0 +1,79 @@
+import pytest
+
+from utils import dynamodb
+from utils.dynamodb import batch_get_items
+
+TABLE = "rpp-workorder"
+
+
+class Resource:
+    """
+    BatchGetItem leaving the keys past processed of each request unprocessed
+    """
+
+    def __init__(self, processed):
+        self.processed = processed
+        self.requests = []
+
+    def batch_get_item(self, RequestItems):
+        keys = RequestItems[TABLE]["Keys"]
+        self.requests.append(len(keys))
+        response = {"Responses": {TABLE: [dict(key) for key in keys[: self.processed]]}}
+        if keys[self.processed :]:
+            response["UnprocessedKeys"] = {TABLE: {"Keys": keys[self.processed :]}}
+
+        return response
+
+
+@pytest.fixture()
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(dynamodb.time, "sleep", sleeps.append)
+
+    return sleeps
+
+
+def keys(count):
+    return [
+        {"work_order_key": f"{number}#QLM1", "site_id": "QLM1"}
+        for number in range(count)
+    ]
+
+
+def test_every_key_processed(monkeypatch, sleeps):
+    resource = Resource(processed=100)
+    monkeypatch.setattr(dynamodb, "get_resource", lambda: resource)
+
+    items, unprocessed = batch_get_items(TABLE, keys(250))
+
+    assert items == keys(250)
+    assert unprocessed == []
+    assert resource.requests == [100, 100, 50]
+    assert sleeps == []
+
+
+def test_unprocessed_keys_are_retried(monkeypatch, sleeps):
+    resource = Resource(processed=40)
+    monkeypatch.setattr(dynamodb, "get_resource", lambda: resource)
+
+    items, unprocessed = batch_get_items(TABLE, keys(100))
+
+    assert sorted(item["work_order_key"] for item in items) == sorted(
+        key["work_order_key"] for key in keys(100)
+    )
+    assert unprocessed == []
+    assert resource.requests == [100, 60, 20]
+    assert len(sleeps) == 2
+
+
+def test_attempts_are_capped(monkeypatch, sleeps):
+    resource = Resource(processed=0)
+    monkeypatch.setattr(dynamodb, "get_resource", lambda: resource)
+
+    items, unprocessed = batch_get_items(TABLE, keys(150), attempts=3)
+
+    assert items == []
+    assert unprocessed == keys(150)
+    assert resource.requests == [100, 100, 100, 50, 50, 50]
+    assert len(sleeps) == 4
+    assert max(sleeps) <= 1
@@ -0,0 +1,140 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from utils import cache
+from utils.cache import ReadCache, can_invalidate, get_tag
+
+
+@pytest.mark.parametrize(
+    "index, key, invalidated",
+    [
+        ("table", {"pk": "workorder:1", "sk": "workorder:1"}, True),
+        ("index_vin", {"vin": "1FT"}, True),
+        ("index_vin", {"vin": "1FT", "sk": "conditions"}, True),
+        ("index_site_id_sk", {"sk": "charge", "site_id": "QLM1"}, True),
+        ("index_vin", {"sk": "conditions"}, False),
+        ("index_vin", {"vin": "1FT", "site_id": "QLM1"}, False),
+        ("index_conditions_vin", {"conditions_vin": "1FT"}, False),
+        ("index_damage_work_order", {"damage_work_order_key": "1#QLM1"}, False),
+    ],
+)
+def test_can_invalidate(index, key, invalidated):
+    assert can_invalidate(index, key) is invalidated
+
+
+def test_value_is_cached():
+    cache = ReadCache(table_name=None)
+    loads = []
+
+    def load():
+        loads.append(1)
+        return [{"pk": "workorder:1", "sk": "charge:1"}]
+
+    first = cache.get("key", load)
+    first.append("changed by the caller")
+
+    assert cache.get("key", load) == [{"pk": "workorder:1", "sk": "charge:1"}]
+    assert len(loads) == 1
+
+
+@pytest.mark.parametrize("empty", [None, [], {}])
+def test_empty_value_is_not_cached(empty):
+    cache = ReadCache(table_name=None)
+    loads = []
+
+    def load():
+        loads.append(1)
+        return empty
+
+    assert cache.get("key", load) == empty
+    assert cache.get("key", load) == empty
+    assert len(loads) == 2
+    assert not cache.entries
+
+
+class InvalidationTable:
+    """
+    invalidation table whose queries wait for release
+    """
+
+    def __init__(self, items=()):
+        self.items = list(items)
+        self.queried = threading.Event()
+        self.released = threading.Event()
+
+    def query(self, **_):
+        self.queried.set()
+        assert self.released.wait(10)
+        return {"Items": self.items}
+
+
+def test_poll_does_not_hold_the_lock():
+    cache = ReadCache(table_name="invalidation", poll=60)
+    cache.table = InvalidationTable()
+    polling = threading.Thread(target=cache.get, args=("a", lambda: [1]))
+    polling.start()
+    assert cache.table.queried.wait(10)
+
+    # the poll is claimed, the other lookups go on while it reads the table
+    assert cache.get("b", lambda: [2]) == [2]
+    assert cache.get("b", lambda: [3]) == [2]
+    assert polling.is_alive()
+
+    cache.table.released.set()
+    polling.join(10)
+    assert not polling.is_alive()
+    assert set(cache.entries) == {"a", "b"}
+
+
+def test_invalidated_entries_are_dropped():
+    cache = ReadCache(table_name="invalidation", poll=0)
+    cache.table = InvalidationTable()
+    cache.table.released.set()
+    cache.get(
+        "vin", lambda: [{"pk": "workorder:1", "sk": "charge:1"}], [get_tag(vin="1FT")]
+    )
+    cache.get("sblu", lambda: [{"pk": "workorder:2", "sk": "charge:1"}])
+
+    cache.table.items = [
+        {"tags": {get_tag(vin="1FT")}, "invalidated": int(time.time() * 1000) + 1}
+    ]
+    cache.get("other", lambda: [1])
+
+    assert set(cache.entries) == {"sblu", "other"}
+
+
+def test_invalidate_writes_the_record_tags(monkeypatch):
+    written = []
+    monkeypatch.setattr(
+        cache,
+        "get_table",
+        lambda name: SimpleNamespace(put_item=lambda **kwargs: written.append(kwargs)),
+    )
+    record = {
+        "dynamodb": {
+            "Keys": {"pk": {"S": "workorder:1"}, "sk": {"S": "charge:1"}},
+            "NewImage": {
+                "pk": {"S": "workorder:1"},
+                "sk": {"S": "charge:1"},
+                "vin": {"S": "1FT"},
+            },
+        }
+    }
+
+    cache.invalidate([record], table_name="invalidation")
+
+    assert len(written) == 1
+    tags = written[0]["Item"]["tags"]
+    assert get_tag(vin="1FT") in tags
+    assert get_tag(pk="workorder:1", sk="charge:1") in tags
+
+
+def test_get_table_is_built_once(monkeypatch):
+    cache.get_table.cache_clear()
+    monkeypatch.setattr(cache, "table", lambda name: object())
+
+    assert cache.get_table("invalidation") is cache.get_table("invalidation")
+    cache.get_table.cache_clear()
@@ -0,0 +1,62 @@
+import pytest
+
+from utils import changes
+from utils.changes import get_image_attributes, is_unchanged
+
+
+def modify(new_image, old_image):
+    return {
+        "eventName": "MODIFY",
+        "dynamodb": {
+            "Keys": {"pk": "workorder:1"},
+            "NewImage": new_image,
+            "OldImage": old_image,
+        },
+    }
+
+
+@pytest.fixture()
+def skip_unchanged(monkeypatch):
+    monkeypatch.setattr(changes, "SKIP_UNCHANGED_WRITES", True)
+
+
+def test_get_image_attributes():
+    record = modify({"pk": "1", "vin": "1FT"}, {"pk": "1", "sblu": "100"})
+
+    assert get_image_attributes(record) == {"pk", "vin", "sblu"}
+    assert get_image_attributes({"eventName": "INSERT", "dynamodb": {}}) == set()
+
+
+def test_off_by_default():
+    record = modify({"vin": "1FT", "updated": 2}, {"vin": "1FT", "updated": 1})
+
+    assert not changes.SKIP_UNCHANGED_WRITES
+    assert not is_unchanged(record, get_image_attributes(record))
+
+
+def test_only_ignored_attributes_moved(skip_unchanged):
+    record = modify({"vin": "1FT", "updated": 2}, {"vin": "1FT", "updated": 1})
+
+    assert is_unchanged(record, get_image_attributes(record))
+
+
+def test_copied_attribute_changed(skip_unchanged):
+    record = modify({"vin": "1FT", "sblu": "200"}, {"vin": "1FT", "sblu": "100"})
+
+    assert not is_unchanged(record, get_image_attributes(record))
+    # a change the handler does not copy is not worth the write
+    assert is_unchanged(record, ["vin"])
+
+
+def test_removed_attribute_changed(skip_unchanged):
+    record = modify({"vin": "1FT"}, {"vin": "1FT", "sblu": "100"})
+
+    assert not is_unchanged(record, get_image_attributes(record))
+
+
+def test_records_without_old_image_change(skip_unchanged):
+    insert = {"eventName": "INSERT", "dynamodb": {"NewImage": {"vin": "1FT"}}}
+    new_only = {"eventName": "MODIFY", "dynamodb": {"NewImage": {"vin": "1FT"}}}
+
+    assert not is_unchanged(insert, get_image_attributes(insert))
+    assert not is_unchanged(new_only, get_image_attributes(new_only))
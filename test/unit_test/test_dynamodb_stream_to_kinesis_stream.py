@@ -0,0 +1,136 @@
+import base64
+import json
+import os
+
+import pytest
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault(
+    "RECON_WORKORDER_KINESIS_STREAM_ARN",
+    "arn:aws:kinesis:us-east-1:000000000000:stream/rpp-recon-workorder",
+)
+
+import dynamodb_stream_to_kinesis_stream as bridge  # noqa: E402
+from utils.aggregation import deaggregate_records, is_aggregated  # noqa: E402
+
+# data of a kinesis record
+MAX_RECORD_SIZE = 1024 * 1024
+
+
+class Kinesis:
+    def __init__(self):
+        self.puts = []
+
+    def put_record(self, **kwargs):
+        self.puts.append(kwargs)
+        return {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+
+@pytest.fixture()
+def kinesis(monkeypatch):
+    kinesis = Kinesis()
+    monkeypatch.setattr(bridge, "KINESIS", kinesis)
+    monkeypatch.setattr(bridge, "invalidate", lambda records: None)
+    monkeypatch.setattr(bridge, "RECORD_AGGREGATION", True)
+
+    return kinesis
+
+
+def stream_record(index, pk, size=0):
+    keys = {"pk": {"S": pk}, "sk": {"S": f"labor:{index}"}}
+    return {
+        "eventName": "MODIFY",
+        "dynamodb": {
+            "SequenceNumber": str(1000 + index),
+            "Keys": keys,
+            "NewImage": dict(keys, notes={"S": "x" * size}),
+        },
+    }
+
+
+def read(puts):
+    """
+    (partition key, sk) of the user records a consumer reads, in order
+    """
+    records = deaggregate_records(
+        [
+            {
+                "kinesis": {
+                    "partitionKey": put["PartitionKey"],
+                    "data": base64.b64encode(put["Data"]).decode("utf-8"),
+                }
+            }
+            for put in puts
+        ]
+    )
+
+    return [
+        (record["kinesis"]["partitionKey"], get_sk(record["kinesis"]["data"]))
+        for record in records
+    ]
+
+
+def get_sk(data):
+    return json.loads(base64.b64decode(data))["dynamodb"]["Keys"]["sk"]["S"]
+
+
+def test_records_of_a_pk_keep_their_order(kinesis):
+    pks = ["workorder:1#QLM1", "workorder:2#QLM1", "workorder:3#QLM1"]
+    records = [
+        stream_record(index, pks[index * 7 % 3], index * 50) for index in range(30)
+    ]
+
+    assert bridge.handler({"Records": records}, None) == {"batchItemFailures": []}
+
+    assert len(kinesis.puts) < len(records)
+    assert all(is_aggregated(put["Data"]) for put in kinesis.puts)
+    read_records = read(kinesis.puts)
+    assert sorted(read_records) == sorted(
+        (pks[index * 7 % 3], f"labor:{index}") for index in range(30)
+    )
+    for pk in pks:
+        assert [sk for key, sk in read_records if key == pk] == [
+            f"labor:{index}" for index in range(30) if pks[index * 7 % 3] == pk
+        ]
+
+
+def test_aggregated_records_stay_under_the_record_limit(kinesis):
+    records = [
+        stream_record(index, "workorder:1#QLM1", size=(index % 5) * 10000)
+        for index in range(40)
+    ]
+
+    bridge.handler({"Records": records}, None)
+
+    assert len(kinesis.puts) > 1
+    for put in kinesis.puts:
+        assert len(put["Data"]) <= bridge.RECORD_AGGREGATION_MAX_SIZE
+        assert len(put["Data"]) + len(put["PartitionKey"]) <= MAX_RECORD_SIZE
+    assert [sk for _, sk in read(kinesis.puts)] == [
+        f"labor:{index}" for index in range(40)
+    ]
+
+
+def test_large_record_is_put_alone(kinesis):
+    records = [
+        stream_record(0, "workorder:1#QLM1"),
+        stream_record(1, "workorder:1#QLM1", size=bridge.RECORD_AGGREGATION_MAX_SIZE),
+        stream_record(2, "workorder:1#QLM1"),
+    ]
+
+    bridge.handler({"Records": records}, None)
+
+    assert len(kinesis.puts) == 3
+    assert not any(is_aggregated(put["Data"]) for put in kinesis.puts)
+    assert [sk for _, sk in read(kinesis.puts)] == ["labor:0", "labor:1", "labor:2"]
+
+
+def test_without_aggregation(kinesis, monkeypatch):
+    monkeypatch.setattr(bridge, "RECORD_AGGREGATION", False)
+    records = [stream_record(index, "workorder:1#QLM1") for index in range(3)]
+
+    bridge.handler({"Records": records}, None)
+
+    assert len(kinesis.puts) == 3
+    assert not any(is_aggregated(put["Data"]) for put in kinesis.puts)
+    assert {put["PartitionKey"] for put in kinesis.puts} == {"workorder:1#QLM1"}
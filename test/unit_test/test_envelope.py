@@ -0,0 +1,150 @@
+import base64
+import json
+import os
+import zlib
+
+import pytest
+
+from utils import envelope
+from utils.aggregation import aggregate_entries, deaggregate_records
+from utils.envelope import (
+    ENVELOPE_VERSION,
+    IDENTITY,
+    MAGIC,
+    ZLIB,
+    ZSTD,
+    is_packed,
+    pack,
+    unpack,
+)
+
+RECORD = json.dumps(
+    {
+        "eventName": "MODIFY",
+        "dynamodb": {
+            "NewImage": {
+                "work_order_key": {"S": "1000000#QLM1"},
+                "notes": {"S": "scratch on the left door " * 100},
+            }
+        },
+    }
+).encode("utf-8")
+
+
+def get_codec(data):
+    assert data[:1] == MAGIC
+    assert data[1] == ENVELOPE_VERSION
+
+    return data[2]
+
+
+@pytest.mark.parametrize(
+    "codec, code", [("identity", IDENTITY), ("zlib", ZLIB), ("zstd", ZSTD)]
+)
+def test_round_trip(codec, code):
+    packed = pack(RECORD, codec)
+
+    assert get_codec(packed) == code
+    assert unpack(packed) == RECORD
+    if code != IDENTITY:
+        assert len(packed) < len(RECORD)
+
+
+def test_zstd_falls_back_to_zlib(monkeypatch):
+    monkeypatch.setattr(envelope, "zstandard", None)
+    packed = pack(RECORD, "zstd")
+
+    assert get_codec(packed) == ZLIB
+    assert unpack(packed) == RECORD
+
+
+def test_zstd_record_without_zstandard(monkeypatch):
+    packed = pack(RECORD, "zstd")
+    monkeypatch.setattr(envelope, "zstandard", None)
+
+    with pytest.raises(ValueError, match="zstandard"):
+        unpack(packed)
+
+
+def test_small_record_is_not_compressed():
+    data = b'{"eventName": "REMOVE"}'
+    packed = pack(data, "zlib", threshold=1024)
+
+    assert get_codec(packed) == IDENTITY
+    assert packed[3:] == data
+    assert unpack(packed) == data
+
+
+def test_incompressible_record_is_not_compressed():
+    data = os.urandom(2048)
+    packed = pack(data, "zlib", threshold=0)
+
+    assert len(zlib.compress(data, 6)) >= len(data)
+    assert get_codec(packed) == IDENTITY
+    assert unpack(packed) == data
+
+
+@pytest.mark.parametrize("data", [RECORD, b"[]", b""])
+def test_plain_json_passes_through(data):
+    assert not is_packed(data)
+    assert unpack(data) is data
+
+
+def test_unknown_version():
+    packed = bytearray(pack(RECORD))
+    packed[1] = ENVELOPE_VERSION + 1
+
+    with pytest.raises(ValueError, match="version"):
+        unpack(bytes(packed))
+
+
+@pytest.mark.parametrize(
+    "data, reason",
+    [
+        (MAGIC + bytes((ENVELOPE_VERSION,)), "truncated"),
+        (MAGIC + bytes((ENVELOPE_VERSION, 9)) + RECORD, "codec"),
+        (MAGIC + bytes((ENVELOPE_VERSION, ZLIB)) + RECORD, "invalid"),
+    ],
+)
+def test_invalid_envelope(data, reason):
+    with pytest.raises(ValueError, match=reason):
+        unpack(data)
+
+
+def test_round_trip_through_aggregated_records():
+    # the way kinesis.process_stream writes with RECORD_ENVELOPE and
+    # RECORD_AGGREGATION, and a consumer reads
+    datas = [
+        json.dumps({"work_order_key": f"{index % 3}#QLM1", "index": index}).encode(
+            "utf-8"
+        )
+        * (1 + index * 20)
+        for index in range(12)
+    ]
+    entries = [
+        {"Data": pack(data, "zlib", threshold=256), "PartitionKey": f"{index % 3}"}
+        for index, data in enumerate(datas)
+    ]
+    records = deaggregate_records(
+        [
+            {
+                "kinesis": {
+                    "partitionKey": entry["PartitionKey"],
+                    "data": base64.b64encode(entry["Data"]).decode("utf-8"),
+                }
+            }
+            for entry in aggregate_entries(entries)
+        ]
+    )
+
+    read = [
+        (
+            record["kinesis"]["partitionKey"],
+            unpack(base64.b64decode(record["kinesis"]["data"])),
+        )
+        for record in records
+    ]
+    for key in "012":
+        assert [data for partition_key, data in read if partition_key == key] == [
+            data for index, data in enumerate(datas) if str(index % 3) == key
+        ]
@@ -0,0 +1,125 @@
+import os
+from unittest import mock
+
+import pytest
+
+for name, value in {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "WORKORDER_TABLE": "rpp-workorder",
+    "WORKORDER_AM_TABLE": "rpp-recon-work-order",
+    "CATEGORY_TABLE": "rpp-labor-category",
+    "SALE_EVENT_TABLE": "rpp-sale-event",
+    "WORKORDER_QUEUE": "rpp-workorder-queue",
+}.items():
+    os.environ.setdefault(name, value)
+
+# the work order queue url is looked up when the module is imported
+with mock.patch("utils.resources.queue"):
+    import event_stream  # noqa: E402
+from event_stream import compact_group, compact_groups  # noqa: E402
+
+
+def stream_record(column, item, updated, event_name="MODIFY"):
+    """
+    (raw record, decoded record) of a column image, updated is the
+    ApproximateCreationDateTime the column is written with
+    """
+    record = {
+        "eventName": event_name,
+        "tableName": "rpp-order-detail",
+        "dynamodb": {
+            "ApproximateCreationDateTime": updated,
+            "Keys": {column: item},
+            "NewImage": {column: item, "work_order_key": "1000000#QLM1"},
+        },
+    }
+
+    return {"sequence": f"{column}:{item}:{updated}"}, record
+
+
+def kept(group):
+    return [raw["sequence"] for raw, _ in group]
+
+
+@pytest.fixture()
+def counts(monkeypatch):
+    counts = []
+    monkeypatch.setattr(
+        event_stream,
+        "add_count",
+        lambda name, value, **dimensions: counts.append((name, value)),
+    )
+
+    return counts
+
+
+def test_newest_image_of_a_column_key_is_kept():
+    group = [
+        stream_record("detail_id", "1", 100),
+        stream_record("detail_id", "1", 300),
+        stream_record("detail_id", "1", 200),
+    ]
+
+    assert kept(compact_group(group)) == ["detail_id:1:300"]
+
+
+def test_newest_is_kept_for_every_column_and_item():
+    group = [
+        stream_record("detail_id", "1", 100),
+        stream_record("condition_id", "1", 150),
+        stream_record("detail_id", "2", 120),
+        stream_record("detail_id", "1", 200),
+        stream_record("condition_id", "1", 110),
+        stream_record("detail_id", "2", 90),
+    ]
+
+    assert kept(compact_group(group)) == [
+        "condition_id:1:150",
+        "detail_id:2:120",
+        "detail_id:1:200",
+    ]
+
+
+def test_order_updated_on_wins_over_creation_time():
+    older = stream_record("detail_id", "1", 200)
+    newer = stream_record("detail_id", "1", 100)
+    older[1]["dynamodb"]["NewImage"]["order"] = {"updatedOn": "2024-03-07T10:00:00"}
+    newer[1]["dynamodb"]["NewImage"]["order"] = {"updatedOn": "2024-03-07T11:00:00"}
+
+    assert kept(compact_group([older, newer])) == ["detail_id:1:100"]
+
+
+def test_tie_keeps_the_first_image():
+    group = [
+        stream_record("detail_id", "1", 100),
+        stream_record("detail_id", "1", 100.0),
+    ]
+
+    assert compact_group(group) == group[:1]
+
+
+def test_old_image_columns_and_removes_are_kept():
+    group = [
+        stream_record("approval_id", "1", 100),
+        stream_record("approval_id", "1", 200),
+        stream_record("detail_id", "1", 100, event_name="REMOVE"),
+        stream_record("detail_id", "1", 200, event_name="REMOVE"),
+    ]
+
+    assert compact_group(group) == group
+
+
+def test_compact_groups_counts_the_dropped_records(counts):
+    groups = [
+        [stream_record("detail_id", "1", 100), stream_record("detail_id", "1", 200)],
+        [stream_record("offering_id", "2", 100)],
+        [],
+    ]
+
+    compacted = compact_groups(groups)
+
+    assert [kept(group) for group in compacted] == [
+        ["detail_id:1:200"],
+        ["offering_id:2:100"],
+    ]
+    assert counts == [("CompactedRecords", 1)]
@@ -0,0 +1,62 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from utils import executor
+from utils.executor import run_concurrently
+from utils.resources import ThreadLocal
+
+
+def test_run_concurrently_keeps_order():
+    assert run_concurrently(lambda item: item * 2, list(range(50))) == [
+        item * 2 for item in range(50)
+    ]
+
+
+def test_nested_calls_run_on_the_worker():
+    threads = set()
+    lock = threading.Lock()
+
+    def inner(item):
+        with lock:
+            threads.add(threading.get_ident())
+        time.sleep(0.001)
+        return item
+
+    def outer(item):
+        return run_concurrently(inner, list(range(item, item + 5)))
+
+    results = run_concurrently(outer, list(range(0, 50, 5)))
+
+    assert results == [list(range(item, item + 5)) for item in range(0, 50, 5)]
+    # the inner calls never take more threads than the pool has
+    assert len(threads) <= executor.MAX_WORKERS
+    assert threading.get_ident() not in threads
+
+
+def test_pool_is_kept_across_calls():
+    run_concurrently(lambda item: item, [1, 2])
+    pool = executor.POOL
+
+    run_concurrently(lambda item: item, [1, 2])
+
+    assert executor.POOL is pool
+
+
+def test_thread_local_builds_one_instance_per_thread():
+    built = []
+    local = ThreadLocal(lambda: built.append(object()) or built[-1])
+
+    instances = run_concurrently(lambda _: local.get(), list(range(40)))
+
+    assert local.get() is local.get()
+    assert len({id(instance) for instance in instances}) <= executor.MAX_WORKERS
+    assert len(built) == len({id(instance) for instance in built})
+    assert local.get() not in instances
+
+
+def test_thread_local_proxies_attributes():
+    local = ThreadLocal(lambda: SimpleNamespace(name="rpp-recon-work-order"))
+
+    assert local.name == "rpp-recon-work-order"
+    assert local.get().name == "rpp-recon-work-order"
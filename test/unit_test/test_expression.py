@@ -0,0 +1,121 @@
+import pytest
+
+from utils.expression import build_update, compile_update, name_alias, value_alias
+
+
+@pytest.mark.parametrize(
+    "name, alias",
+    [
+        ("work_order_key", "work_order_key"),
+        ("vin", "vin"),
+        ("a-b", "a_2d_b"),
+        ("updated at", "updated_20_at"),
+        ("a.b", "a_2e_b"),
+        ("é_1", "_e9__1"),
+    ],
+)
+def test_name_alias(name, alias):
+    assert name_alias(name) == alias
+
+
+def test_value_alias_of_nested_path():
+    assert value_alias(("labor", "status")) == ":labor_status"
+    assert value_alias(("labor-type", "x")) == ":labor_2d_type_x"
+
+
+def test_set_and_remove():
+    compiled = compile_update(("vin", "status"), ("sblu",))
+
+    assert compiled.expression == "SET #vin = :vin, #status = :status REMOVE #sblu"
+    assert dict(compiled.names) == {"#vin": "vin", "#status": "status", "#sblu": "sblu"}
+    assert compiled.values == (":vin", ":status")
+
+
+def test_nested_paths():
+    compiled = compile_update((("labor", "status"), "labor"), (("labor", "old"),))
+
+    assert compiled.expression == (
+        "SET #labor.#status = :labor_status, #labor = :labor REMOVE #labor.#old"
+    )
+    assert dict(compiled.names) == {
+        "#labor": "labor",
+        "#status": "status",
+        "#old": "old",
+    }
+
+
+def test_nested_value_alias_collision():
+    compiled = compile_update((("a", "b"), "a_b"))
+
+    # the top level value keeps :a_b, conditions refer to it
+    assert compiled.values == (":a_b_1", ":a_b")
+    assert compiled.expression == "SET #a.#b = :a_b_1, #a_b = :a_b"
+
+
+def test_escaped_name_collision():
+    compiled = compile_update(("a-b", "a_2d_b"))
+
+    assert compiled.expression == "SET #a_2d_b = :a_2d_b, #a_2d_b_1 = :a_2d_b_1"
+    assert dict(compiled.names) == {"#a_2d_b": "a-b", "#a_2d_b_1": "a_2d_b"}
+
+
+def test_remove_only():
+    update = build_update({}, remove=("sblu", "vin"))
+
+    assert update == {
+        "UpdateExpression": "REMOVE #sblu, #vin",
+        "ExpressionAttributeNames": {"#sblu": "sblu", "#vin": "vin"},
+    }
+
+
+def test_build_update():
+    update = build_update(
+        {"vin": "1FT", ("labor", "status"): "open", "a-b": 1},
+        remove=("sblu",),
+        condition="attribute_exists(#vin)",
+    )
+
+    assert update == {
+        "UpdateExpression": (
+            "SET #vin = :vin, #labor.#status = :labor_status, #a_2d_b = :a_2d_b "
+            "REMOVE #sblu"
+        ),
+        "ExpressionAttributeNames": {
+            "#vin": "vin",
+            "#labor": "labor",
+            "#status": "status",
+            "#a_2d_b": "a-b",
+            "#sblu": "sblu",
+        },
+        "ExpressionAttributeValues": {
+            ":vin": "1FT",
+            ":labor_status": "open",
+            ":a_2d_b": 1,
+        },
+        "ConditionExpression": "attribute_exists(#vin)",
+    }
+
+
+def test_cache_key():
+    compile_update.cache_clear()
+
+    first = compile_update(("vin", "status"))
+    assert compile_update(("vin", "status")) is first
+    assert compile_update.cache_info().hits == 1
+
+    reordered = compile_update(("status", "vin"))
+    assert reordered is not first
+    assert reordered.expression == "SET #status = :status, #vin = :vin"
+    assert compile_update(("vin", "status"), ("sblu",)) is not first
+    assert compile_update.cache_info().misses == 3
+
+
+def test_build_update_values_follow_key_order():
+    compile_update.cache_clear()
+
+    first = build_update({"vin": 1, "status": 2})
+    second = build_update({"status": 2, "vin": 1})
+
+    assert first["ExpressionAttributeValues"] == {":vin": 1, ":status": 2}
+    assert second["ExpressionAttributeValues"] == {":vin": 1, ":status": 2}
+    assert compile_update.cache_info().misses == 2
@@ -0,0 +1,108 @@
+import base64
+import gzip
+import json
+
+import brotli
+import pytest
+
+from utils import http
+from utils.http import accepts_binary, compress, get_encoding
+
+BODY = json.dumps(
+    [{"pk": "workorder:1000000#QLM1", "sk": f"labor#{i}"} for i in range(50)]
+)
+
+
+def request(accept="application/json", accept_encoding="gzip, br"):
+    return {"headers": {"Accept": accept, "Accept-Encoding": accept_encoding}}
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, encoding",
+    [
+        ("gzip", "gzip"),
+        ("gzip, br", "br"),
+        ("br;q=0.5, gzip", "gzip"),
+        ("br;q=0, gzip;q=0", None),
+        ("gzip;q=0", None),
+        ("*", "br"),
+        ("*, br;q=0", "gzip"),
+        ("identity", None),
+        ("", None),
+    ],
+)
+def test_get_encoding(accept_encoding, encoding):
+    assert get_encoding(request(accept_encoding=accept_encoding)) == encoding
+
+
+@pytest.mark.parametrize(
+    "accept, binary",
+    [
+        ("application/json", True),
+        ("Application/JSON; charset=utf-8", True),
+        ("application/json;q=0.9, text/plain", True),
+        ("text/plain, application/json", False),
+        ("*/*", False),
+        ("", False),
+    ],
+)
+def test_accepts_binary(accept, binary):
+    assert accepts_binary(request(accept=accept)) is binary
+
+
+def test_accepts_binary_without_headers():
+    assert not accepts_binary({"headers": None})
+
+
+@pytest.mark.parametrize(
+    "encoding, decompress", [("gzip", gzip.decompress), ("br", brotli.decompress)]
+)
+def test_compress(encoding, decompress):
+    response = {
+        "statusCode": 200,
+        "headers": {"Content-Type": "application/json"},
+        "body": BODY,
+    }
+
+    compressed = compress(request(accept_encoding=encoding), response)
+
+    assert compressed["isBase64Encoded"]
+    assert compressed["headers"] == {
+        "Content-Type": "application/json",
+        "Content-Encoding": encoding,
+        "Vary": "Accept-Encoding",
+    }
+    assert decompress(base64.b64decode(compressed["body"])).decode("utf-8") == BODY
+    assert response["body"] == BODY
+
+
+def test_compress_threshold(monkeypatch):
+    monkeypatch.setattr(http, "COMPRESSION_THRESHOLD", len(BODY.encode("utf-8")) + 1)
+    response = {"statusCode": 200, "body": BODY}
+
+    assert compress(request(), response) is response
+
+    monkeypatch.setattr(http, "COMPRESSION_THRESHOLD", len(BODY.encode("utf-8")))
+    assert compress(request(), response)["isBase64Encoded"]
+
+
+@pytest.mark.parametrize(
+    "headers",
+    [
+        # no content coding the client takes
+        {"Accept": "application/json", "Accept-Encoding": "gzip;q=0, br;q=0"},
+        # api gateway would pass the base64 body through as text
+        {"Accept": "text/plain, application/json", "Accept-Encoding": "gzip"},
+        {"Accept-Encoding": "gzip"},
+    ],
+)
+def test_compress_leaves_response(headers):
+    response = {"statusCode": 200, "body": BODY}
+
+    assert compress({"headers": headers}, response) is response
+
+
+def test_compress_leaves_encoded_body():
+    response = {"statusCode": 200, "body": BODY, "isBase64Encoded": True}
+
+    assert compress(request(), response) is response
@@ -0,0 +1,147 @@
+import copy
+import functools
+
+import pytest
+
+from utils import partition
+from utils.partition import (
+    MAX_PARTITION_KEY,
+    get_explicit_hash_key,
+    get_partition_key,
+    hash_key,
+    with_hash_key,
+)
+
+# kinesis hash keys are 128 bit
+MAX_HASH_KEY = 2**128
+
+
+def stream_record(keys, new_image=None, old_image=None):
+    dynamodb = {"Keys": keys}
+    if new_image is not None:
+        dynamodb["NewImage"] = new_image
+    if old_image is not None:
+        dynamodb["OldImage"] = old_image
+
+    return {"eventName": "MODIFY", "dynamodb": dynamodb}
+
+
+KEYS = {"pk": {"S": "workorder:1000000#QLM1"}, "sk": {"S": "labor:1"}}
+
+
+def test_key_of_new_image():
+    record = stream_record(
+        KEYS,
+        new_image={"work_order_key": {"S": "1000000#QLM1"}},
+        old_image={"work_order_key": {"S": "999#QLM1"}},
+    )
+
+    assert get_partition_key(record, "work_order_key") == "1000000#QLM1"
+
+
+def test_key_of_old_image():
+    record = stream_record(KEYS, old_image={"work_order_key": {"S": "1000000#QLM1"}})
+
+    assert get_partition_key(record, "work_order_key") == "1000000#QLM1"
+
+
+def test_key_of_keys():
+    record = stream_record(KEYS, new_image={"work_order_key": {"S": ""}})
+
+    assert get_partition_key(record, "pk") == "workorder:1000000#QLM1"
+
+
+def test_plain_images():
+    record = stream_record({"pk": "workorder:1#QLM1"}, new_image={"sblu": 1000000})
+
+    assert get_partition_key(record, "sblu") == "1000000"
+    assert get_partition_key(record, "pk") == "workorder:1#QLM1"
+
+
+def test_key_derived_from_keys():
+    record = stream_record({"sk": {"S": "labor:1"}, "pk": {"S": "site:QLM1"}})
+
+    assert get_partition_key(record, "work_order_key") == "pk=site:QLM1&sk=labor:1"
+
+
+def test_long_derived_key_is_hashed():
+    record = stream_record({"pk": {"S": "x" * MAX_PARTITION_KEY}})
+
+    partition_key = get_partition_key(record, "work_order_key")
+    assert partition_key == hash_key(f"pk={'x' * MAX_PARTITION_KEY}")
+    assert len(partition_key) <= MAX_PARTITION_KEY
+
+
+def test_key_of_record_without_keys():
+    record = {"eventName": "REMOVE", "dynamodb": {"SequenceNumber": "1"}}
+    other = {"eventName": "REMOVE", "dynamodb": {"SequenceNumber": "2"}}
+
+    partition_key = get_partition_key(record, "work_order_key")
+    assert partition_key == get_partition_key(copy.deepcopy(record), "pk")
+    assert partition_key != get_partition_key(other, "work_order_key")
+
+
+@pytest.mark.parametrize(
+    "record",
+    [
+        stream_record(KEYS, new_image={"work_order_key": {"S": "1000000#QLM1"}}),
+        stream_record(KEYS),
+        {"eventName": "REMOVE", "dynamodb": {}},
+    ],
+)
+def test_key_is_stable(record):
+    partition_key = get_partition_key(record, "work_order_key")
+
+    assert get_partition_key(copy.deepcopy(record), "work_order_key") == partition_key
+
+
+def test_explicit_hash_key_of_cold_key():
+    record = stream_record(KEYS)
+
+    assert get_explicit_hash_key(record, "1000000#QLM1", hot_keys={"2#QLM1"}) is None
+
+
+def test_explicit_hash_key_range_and_determinism(monkeypatch):
+    monkeypatch.setattr(partition, "HOT_KEY_SPREAD", 4)
+    records = [
+        stream_record({"pk": {"S": "site:QLM1"}, "sk": {"S": f"labor:{index}"}})
+        for index in range(200)
+    ]
+
+    hash_keys = [
+        get_explicit_hash_key(record, "site:QLM1", hot_keys={"site:QLM1"})
+        for record in records
+    ]
+
+    assert all(0 <= int(key) < MAX_HASH_KEY for key in hash_keys)
+    assert len(set(hash_keys)) == 4
+    assert hash_keys == [
+        get_explicit_hash_key(copy.deepcopy(record), "site:QLM1", {"site:QLM1"})
+        for record in records
+    ]
+
+
+def test_explicit_hash_key_without_spread(monkeypatch):
+    monkeypatch.setattr(partition, "HOT_KEY_SPREAD", 0)
+    hash_keys = {
+        get_explicit_hash_key(
+            stream_record({"sk": {"S": f"labor:{index}"}}), "hot", hot_keys={"hot"}
+        )
+        for index in range(20)
+    }
+
+    assert hash_keys == {str(int(hash_key("hot#0"), 16))}
+
+
+def test_with_hash_key(monkeypatch):
+    monkeypatch.setattr(
+        partition,
+        "get_explicit_hash_key",
+        functools.partial(get_explicit_hash_key, hot_keys={"hot"}),
+    )
+    record = stream_record(KEYS)
+    cold = {"Data": b"{}", "PartitionKey": "cold"}
+
+    assert with_hash_key(cold, record) is cold
+    hot = with_hash_key({"Data": b"{}", "PartitionKey": "hot"}, record)
+    assert hot["ExplicitHashKey"] == get_explicit_hash_key(record, "hot", {"hot"})
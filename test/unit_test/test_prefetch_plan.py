@@ -0,0 +1,271 @@
+"""
+the rpc lookups the prefetch planners plan are the ones processing makes, checked
+against a local stub of the rpc service and the in memory aws stand-ins of the
+benchmark
+"""
+
+import copy
+import json
+import os
+import sys
+import threading
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import Request, urlopen
+
+import boto3
+import pytest
+
+BENCHMARK = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmark")
+sys.path.insert(0, BENCHMARK)
+
+from stand_ins import StandIns, get_pfvehicle, install  # noqa: E402
+
+WORK_ORDER_KEY = "1000000#QLM1"
+
+
+def damage(item_code, **labor):
+    return dict(
+        {
+            "action": "Repair",
+            "actionCode": "RP",
+            "approved": True,
+            "damage": "Dent",
+            "damageCode": "DT",
+            "item": item_code.title(),
+            "itemCode": item_code,
+            "subItemCode": "01",
+            "severityCode": "SM",
+            "repairLaborCost": Decimal("0"),
+            "repairLaborHours": Decimal("0"),
+            "paintLaborCost": Decimal("0"),
+            "paintLaborHours": Decimal("0"),
+            "partLaborCost": Decimal("0"),
+            "partLaborHours": Decimal("0"),
+        },
+        **labor,
+    )
+
+
+DAMAGES = [
+    damage("FRBUMP", repairLaborHours=Decimal("0.9"), repairLaborCost=Decimal("45")),
+    damage("HOOD", paintLaborCost=Decimal("120"), partLaborHours=Decimal("1.5")),
+    # no labor at all, looked up as a repair
+    damage("ROOF"),
+    # labor attributes left out
+    {
+        "action": "Repair",
+        "actionCode": "RP",
+        "damage": "Scratch",
+        "damageCode": "SC",
+        "item": "Trunk",
+        "itemCode": "TRUNK",
+        "subItemCode": "02",
+        "severityCode": "SM",
+    },
+]
+
+
+def get_labor_status(work_order_key, isdt_key):
+    if isdt_key.endswith("#PAINT"):
+        return None
+
+    return {
+        "current_status": {
+            "labor_status": "APPROVED",
+            "date": "2024-03-07T12:00:00.000Z",
+            "source": "stub",
+        }
+    }
+
+
+RESPONSES = {
+    "get_approval": lambda *_, **__: [],
+    "get_labor_status": get_labor_status,
+    "get_pfvehicle": get_pfvehicle,
+    "get_work_credit": lambda *_, **__: {},
+}
+
+
+class RPCServer(ThreadingHTTPServer):
+    """
+    stub of the rpc service, POST /<lookup> with {"args", "kwargs"} answers what
+    RESPONSES has for the lookup and records it
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), RPCHandler)
+        self.requests = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def take_requests(self):
+        with self.lock:
+            requests, self.requests = self.requests, []
+
+        return requests
+
+
+class RPCHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        name = self.path.strip("/")
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.server.lock:
+            self.server.requests.append(
+                (name, tuple(body["args"]), tuple(sorted(body["kwargs"].items())))
+            )
+
+        data = json.dumps(RESPONSES[name](*body["args"], **body["kwargs"])).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *_):
+        pass
+
+
+def stub(server, name):
+    """
+    rpp_lib.rpc lookup calling the stub server
+    """
+
+    def lookup(*args, **kwargs):
+        request = Request(
+            f"{server.url}/{name}",
+            data=json.dumps({"args": args, "kwargs": kwargs}).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        with urlopen(request, timeout=10) as response:
+            return json.loads(response.read(), parse_float=Decimal)
+
+    lookup.__name__ = name
+    return lookup
+
+
+def get_call_keys(calls):
+    return {
+        (func.__name__, args, tuple(sorted(kwargs.items())))
+        for func, args, kwargs in calls
+    }
+
+
+@pytest.fixture(scope="module")
+def server():
+    server = RPCServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(scope="module")
+def handlers():
+    """
+    damages and aggregate_events imported against the aws stand-ins
+    """
+    saved = boto3.resource, boto3.client, boto3.Session
+    stand_ins = StandIns()
+    install(stand_ins)
+    import aggregate_events
+    import damages
+    import recon_labor_status
+
+    yield stand_ins, damages, aggregate_events, recon_labor_status
+
+    boto3.resource, boto3.client, boto3.Session = saved
+
+
+@pytest.fixture()
+def lookups(server, handlers, monkeypatch):
+    _, damages, aggregate_events, recon_labor_status = handlers
+    stubs = {name: stub(server, name) for name in RESPONSES}
+    for module in (damages, aggregate_events, recon_labor_status):
+        for name, lookup in stubs.items():
+            if hasattr(module, name):
+                monkeypatch.setattr(module, name, lookup)
+    server.take_requests()
+
+    return stubs
+
+
+def run_planned(server, records, plan, process):
+    """
+    requests processing made inline, then with the plan prefetched
+    """
+    from utils.prefetch import prefetch
+
+    for record in copy.deepcopy(records):
+        process(record)
+    inline = server.take_requests()
+
+    records = copy.deepcopy(records)
+    with prefetch(records, plan):
+        for record in records:
+            process(record)
+    prefetched = server.take_requests()
+
+    return inline, prefetched
+
+
+def test_damage_plan_matches_lookups(server, handlers, lookups):
+    _, damages, _, _ = handlers
+    order = {"condition": {"damages": DAMAGES}}
+
+    planned = get_call_keys(damages.plan_damage_rpc(order, WORK_ORDER_KEY))
+    inline, prefetched = run_planned(
+        server,
+        [order],
+        lambda order: damages.plan_damage_rpc(order, WORK_ORDER_KEY),
+        lambda order: damages.create_damage_list(
+            order["condition"]["damages"], WORK_ORDER_KEY
+        ),
+    )
+
+    assert planned == set(inline)
+    # every lookup was answered by its prefetched call, none was made again inline
+    assert sorted(prefetched) == sorted(planned)
+    assert ("get_labor_status", (WORK_ORDER_KEY, "HOOD#01#DT#PAINT"), ()) in planned
+    assert ("get_work_credit", (WORK_ORDER_KEY, "ROOF#01#DT#REPAIR"), ()) in planned
+
+
+def test_approval_plan_matches_lookups(server, handlers, lookups):
+    _, _, aggregate_events, _ = handlers
+    event = {
+        "eventName": "INSERT",
+        "tableName": "rpp-order-approval",
+        "dynamodb": {
+            "Keys": {"approval_id": "approval-1000000"},
+            "NewImage": {
+                "approval_id": "approval-1000000",
+                "sblu": "1000000",
+                "site_id": "QLM1",
+                "work_order_key": WORK_ORDER_KEY,
+                "order": {
+                    "updatedBy": "stub",
+                    "status": "APPROVED",
+                    "condition": {"damages": DAMAGES, "tires": []},
+                },
+            },
+        },
+    }
+
+    planned = get_call_keys(aggregate_events.plan_rpc(event))
+    inline, prefetched = run_planned(
+        server,
+        [event],
+        aggregate_events.plan_rpc,
+        aggregate_events.process_dynamodb_event,
+    )
+
+    assert planned == set(inline)
+    assert sorted(prefetched) == sorted(planned)
+    assert ("get_pfvehicle", (), (("work_order_key", WORK_ORDER_KEY),)) in planned
+    assert ("get_labor_status", (WORK_ORDER_KEY, "TRUNK#02#SC#REPAIR"), ()) in planned
@@ -0,0 +1,188 @@
+import os
+
+import pytest
+from botocore.exceptions import ClientError
+
+for name, value in {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "WORKORDER_AM_TABLE": "rpp-recon-work-order",
+}.items():
+    os.environ.setdefault(name, value)
+
+import recon_labor_status  # noqa: E402
+from recon_labor_status import (  # noqa: E402
+    DAMAGES,
+    find_damage,
+    preload_damages,
+    update_work_order,
+)
+
+WORK_ORDER_KEY = "1000000#QLM1"
+PK = f"workorder:{WORK_ORDER_KEY}"
+ISDSA = "damage:0520#09#CO#SV#RP"
+IDSA = "damage:0520#CO#SV#RP"
+
+
+@pytest.fixture()
+def lookups(monkeypatch):
+    """
+    damages find_damage reads one at a time
+    """
+    lookups = []
+
+    def get_work_order(key, _):
+        lookups.append(key["key"]["sk"])
+        return {"pk": key["key"]["pk"], "sk": key["key"]["sk"], "read": "alone"}
+
+    monkeypatch.setattr(recon_labor_status, "get_work_order", get_work_order)
+    monkeypatch.setattr(
+        recon_labor_status,
+        "get_damage_keys",
+        lambda record: [(PK, sk) for sk in record["sks"]],
+    )
+
+    return lookups
+
+
+def batch_get(items, unprocessed=()):
+    def batch_get_items(table_name, keys):
+        assert table_name == "rpp-recon-work-order"
+        return [dict(item) for item in items], list(unprocessed)
+
+    return batch_get_items
+
+
+def test_preloaded_damage_is_found(monkeypatch, lookups):
+    damage = {"pk": PK, "sk": ISDSA, "repair_status": "APPROVED"}
+    monkeypatch.setattr(recon_labor_status, "batch_get_items", batch_get([damage]))
+
+    with preload_damages([{"sks": [ISDSA, IDSA]}]):
+        found = find_damage(WORK_ORDER_KEY, ISDSA)
+        found["repair_status"] = "changed by the caller"
+
+        assert find_damage(WORK_ORDER_KEY, ISDSA) == damage
+        # the idsa was read and is not there
+        assert find_damage(WORK_ORDER_KEY, IDSA) is None
+
+    assert lookups == []
+    assert not DAMAGES
+
+
+def test_damage_not_preloaded_is_read(monkeypatch, lookups):
+    monkeypatch.setattr(recon_labor_status, "batch_get_items", batch_get([]))
+
+    with preload_damages([{"sks": [ISDSA]}]):
+        assert find_damage(WORK_ORDER_KEY, IDSA)["read"] == "alone"
+
+    assert lookups == [IDSA]
+
+
+def test_unprocessed_damage_is_read(monkeypatch, lookups):
+    monkeypatch.setattr(
+        recon_labor_status,
+        "batch_get_items",
+        batch_get([], unprocessed=[{"pk": PK, "sk": ISDSA}]),
+    )
+
+    with preload_damages([{"sks": [ISDSA, IDSA]}]):
+        assert find_damage(WORK_ORDER_KEY, ISDSA)["read"] == "alone"
+        assert find_damage(WORK_ORDER_KEY, IDSA) is None
+
+    assert lookups == [ISDSA]
+
+
+def test_failed_preload_reads_every_damage(monkeypatch, lookups):
+    def batch_get_items(table_name, keys):
+        raise ClientError(
+            {"Error": {"Code": "ProvisionedThroughputExceededException"}},
+            "BatchGetItem",
+        )
+
+    monkeypatch.setattr(recon_labor_status, "batch_get_items", batch_get_items)
+
+    with preload_damages([{"sks": [ISDSA]}]):
+        assert find_damage(WORK_ORDER_KEY, ISDSA)["read"] == "alone"
+
+    assert lookups == [ISDSA]
+
+
+def test_invalid_record_is_not_preloaded(monkeypatch, lookups):
+    requested = []
+    monkeypatch.setattr(
+        recon_labor_status,
+        "batch_get_items",
+        lambda table_name, keys: requested.append(keys) or ([], []),
+    )
+
+    with preload_damages([{"no sks": []}]):
+        assert find_damage(WORK_ORDER_KEY, ISDSA)["read"] == "alone"
+
+    assert requested == []
+
+
+class Table:
+    def __init__(self):
+        self.updates = []
+
+    def update_item(self, **kwargs):
+        self.updates.append(kwargs)
+        return {"Attributes": {}}
+
+
+@pytest.mark.parametrize("labor_type", ["REPAIR", "PART", "PAINT"])
+def test_update_work_order_sets_and_removes(monkeypatch, labor_type):
+    table = Table()
+    monkeypatch.setattr(recon_labor_status, "WO_TABLE", table)
+    updated = f"{labor_type.lower()}_updated"
+    status = f"{labor_type.lower()}_status"
+    damage = {
+        "site_id": "QLM1",
+        "work_order_number": "6701628",
+        "item_code": "0520",
+        "damage": "CO",
+        status: "APPROVED",
+        updated: 1709827157078,
+        "updated": 1709827157078,
+    }
+
+    update_work_order(
+        WORK_ORDER_KEY,
+        ISDSA,
+        damage,
+        labor_type,
+        remove_attributes=["charge_l_status", "charge_p_status"],
+    )
+
+    (update,) = table.updates
+    assert update["Key"] == {"pk": PK, "sk": ISDSA}
+    set_clause, remove_clause = update["UpdateExpression"].split(" REMOVE ")
+    assert set_clause.startswith("SET ")
+    assert f"#{status} = :{status}" in set_clause
+    assert "#damage_work_order = :damage_work_order" in set_clause
+    assert "#damage_key = :damage_key" in set_clause
+    assert remove_clause == "#charge_l_status, #charge_p_status"
+    assert update["ConditionExpression"] == (
+        f"attribute_not_exists(#{updated}) OR #{updated} <= :updated"
+    )
+    assert update["ExpressionAttributeNames"][f"#{updated}"] == updated
+    assert update["ExpressionAttributeNames"]["#charge_l_status"] == "charge_l_status"
+    assert update["ExpressionAttributeValues"][":updated"] == 1709827157078
+    assert update["ExpressionAttributeValues"][":damage_key"] == "0520#CO"
+    assert update["ReturnValues"] == "UPDATED_NEW"
+
+
+def test_update_work_order_without_removes(monkeypatch):
+    table = Table()
+    monkeypatch.setattr(recon_labor_status, "WO_TABLE", table)
+
+    update_work_order(
+        WORK_ORDER_KEY,
+        ISDSA,
+        {"repair_status": "DONE", "repair_updated": 2, "updated": 2},
+        "REPAIR",
+    )
+
+    assert table.updates[0]["UpdateExpression"] == (
+        "SET #repair_status = :repair_status, #repair_updated = :repair_updated,"
+        " #updated = :updated"
+    )
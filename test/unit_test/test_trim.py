@@ -0,0 +1,82 @@
+import copy
+
+import pytest
+
+from utils.trim import PROFILES, RECON_INDEX_KEYS, trim_record
+
+KEYS = {"pk": {"S": "workorder:1000000#QLM1"}, "sk": {"S": "clock_rt:1"}}
+IMAGE = dict(
+    KEYS,
+    vin={"S": "1FTFW1E50KF100000"},
+    damage_work_order={"S": "QLM1#6701628"},
+    damage_key={"S": "0520#CO"},
+    conditions_vin={"S": "1FTFW1E50KF100000"},
+    conditions_updated={"N": "1709827157"},
+)
+TRIMMED_IMAGE = dict(KEYS, vin={"S": "1FTFW1E50KF100000"})
+
+
+def stream_record(event_name):
+    dynamodb = {"ApproximateCreationDateTime": 1709827157078, "Keys": KEYS}
+    if event_name != "REMOVE":
+        dynamodb["NewImage"] = IMAGE
+    if event_name != "INSERT":
+        dynamodb["OldImage"] = IMAGE
+
+    return {"eventName": event_name, "eventID": "1", "dynamodb": dynamodb}
+
+
+@pytest.mark.parametrize("event_name", ["INSERT", "MODIFY", "REMOVE"])
+def test_full(event_name):
+    record = stream_record(event_name)
+
+    assert trim_record(record, "full") is record
+
+
+@pytest.mark.parametrize("event_name", ["INSERT", "MODIFY", "REMOVE"])
+def test_recon(event_name):
+    record = stream_record(event_name)
+    original = copy.deepcopy(record)
+
+    trimmed = trim_record(record, "recon")
+
+    assert record == original
+    assert trimmed["eventName"] == event_name
+    assert trimmed["dynamodb"]["Keys"] == KEYS
+    for name in ("NewImage", "OldImage"):
+        if name in record["dynamodb"]:
+            assert trimmed["dynamodb"][name] == TRIMMED_IMAGE
+
+
+@pytest.mark.parametrize(
+    "event_name, images",
+    [
+        ("INSERT", {"NewImage"}),
+        ("MODIFY", {"NewImage"}),
+        ("REMOVE", {"OldImage"}),
+    ],
+)
+def test_recon_clocking(event_name, images):
+    record = stream_record(event_name)
+    original = copy.deepcopy(record)
+
+    trimmed = trim_record(record, "recon_clocking")
+
+    assert record == original
+    assert trimmed["dynamodb"]["Keys"] == KEYS
+    assert trimmed["dynamodb"]["ApproximateCreationDateTime"] == 1709827157078
+    assert {name for name in trimmed["dynamodb"] if name.endswith("Image")} == images
+    for name in images:
+        assert trimmed["dynamodb"][name] == TRIMMED_IMAGE
+
+
+@pytest.mark.parametrize("profile", sorted(PROFILES))
+def test_record_without_images(profile):
+    record = {"eventName": "REMOVE", "eventSource": "aws:dynamodb"}
+
+    assert trim_record(record, profile) is record
+
+
+def test_recon_profiles_drop_the_index_keys():
+    assert set(RECON_INDEX_KEYS) == set(IMAGE) - set(TRIMMED_IMAGE)
+    assert PROFILES["recon"]["drop"] == PROFILES["recon_clocking"]["drop"]